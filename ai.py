@@ -0,0 +1,288 @@
+import os
+import random
+import threading
+import time
+
+from metrics import (AI_BREAKER_TRANSITIONS, AI_PROMPT_CHARS, AI_REJECTED, AI_SECONDS, AI_TOKENS, Gauge, log_event,
+                     record, registry)
+
+# --- Configuration ---
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
+GEMINI_MODEL_NAME = os.getenv('GEMINI_MODEL_NAME', 'gemini-1.5-flash-latest')
+AI_HEALTH_INTERVAL = float(os.getenv('AI_HEALTH_INTERVAL', '300')) # Seconds between background probes
+AI_TIMEOUT = float(os.getenv('AI_TIMEOUT', '20')) # Deadline for one call, retries included
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', '4')) # Calls in flight per process
+AI_QUEUE_TIMEOUT = float(os.getenv('AI_QUEUE_TIMEOUT', '2')) # Wait for a free slot before giving up
+AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', '2')) # Extra attempts for idempotent calls
+AI_RETRY_BACKOFF = float(os.getenv('AI_RETRY_BACKOFF', '0.5')) # Base delay, doubled per retry
+AI_BREAKER_THRESHOLD = int(os.getenv('AI_BREAKER_THRESHOLD', '5')) # Consecutive failures that open the breaker
+AI_BREAKER_COOLDOWN = float(os.getenv('AI_BREAKER_COOLDOWN', '30')) # Seconds open before a trial call
+# HTTP statuses a retry can fix: request timeout, rate limiting and server-side failures
+TRANSIENT_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class AIUnavailableError(Exception):
+    """Raised instead of calling Gemini when the breaker is open or every slot is busy."""
+
+
+def is_transient(error: Exception) -> bool:
+    """True for failures worth retrying: timeouts, dropped connections, rate limits and 5xx responses.
+
+    Bad requests, auth failures and blocked prompts fail the same way every time.
+    google.api_core errors carry their HTTP status in `code`, so the SDK need not
+    be imported to tell them apart.
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, 'code', None)
+    return isinstance(code, int) and code in TRANSIENT_STATUS_CODES
+
+
+class CircuitBreaker:
+    """Closed -> open after `threshold` consecutive failures -> half-open after `cooldown`.
+
+    While open every call is refused immediately. Half-open lets a single trial
+    call through: success closes the breaker, failure opens it again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+    STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, threshold: int = AI_BREAKER_THRESHOLD, cooldown: float = AI_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        self.state = state
+        AI_BREAKER_TRANSITIONS.inc(state=state)
+        if state == self.OPEN:
+            log_event("ai_breaker_open", "Gemini circuit breaker opened; using local fallbacks",
+                      level='warning', failures=self.failures, cooldown=self.cooldown)
+        elif state == self.CLOSED:
+            log_event("ai_breaker_closed", "Gemini circuit breaker closed", level='info')
+
+    def is_open(self) -> bool:
+        """True while calls are being refused outright (cooldown not yet over)."""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self._opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now; claims the trial slot when half-opening."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def state_code(self) -> int:
+        return self.STATE_CODES[self.state]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures}
+
+
+breaker = CircuitBreaker()
+_slots = threading.BoundedSemaphore(AI_MAX_CONCURRENCY)
+registry.register(Gauge('expense_tracker_ai_breaker_state',
+                        'Gemini circuit breaker state: 0 closed, 1 half-open, 2 open.', lambda: breaker.state_code()))
+
+# google.generativeai is imported on first use, not at import time: it is slow to
+# load and pulls in grpc, which must not be initialised before a worker forks.
+_model = None
+_model_lock = threading.Lock()
+_healthy = True # Optimistic until a probe says otherwise
+_last_error = None
+_probe_thread = None
+_override = None # Stand-in model installed by set_model() (benchmarks, offline runs)
+
+
+def _reset_after_fork():
+    """A forked child builds its own client; grpc channels do not survive fork."""
+    global _model, _model_lock, _probe_thread, _slots, breaker
+    _model = None
+    _model_lock = threading.Lock()
+    _probe_thread = None
+    _slots = threading.BoundedSemaphore(AI_MAX_CONCURRENCY)
+    breaker = CircuitBreaker(breaker.threshold, breaker.cooldown)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def is_configured() -> bool:
+    """True when an API key is set, whether or not the API is currently reachable."""
+    return bool(GEMINI_API_KEY) or _override is not None
+
+
+def set_model(model):
+    """Uses `model` (anything with generate_content) instead of the Gemini client; None restores it.
+
+    Benchmarks install a deterministic fake here so runs never touch the network.
+    """
+    global _override
+    _override = model
+
+
+def _client():
+    """Creates the Gemini client once per process (thread-safe)."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=GEMINI_API_KEY)
+                _model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    return _model
+
+
+def get_model():
+    """Returns the Gemini model, or None if AI is unconfigured, unhealthy or the breaker is open."""
+    if breaker.is_open():
+        return None # Fail fast: callers fall back to their local defaults
+    if _override is not None:
+        return _override
+    if not GEMINI_API_KEY or not _healthy:
+        return None
+    try:
+        return _client()
+    except Exception as e:
+        log_event("ai_configure_failed", "Failed to configure Gemini AI", error=str(e))
+        return None
+
+
+def _attempt(model, prompt: str, purpose: str, timeout: float, kwargs: dict):
+    """One admitted call: breaker check, concurrency slot, deadline, metrics."""
+    if breaker.is_open():
+        AI_REJECTED.inc(purpose=purpose, reason='breaker_open')
+        raise AIUnavailableError("Gemini circuit breaker is open")
+    if not _slots.acquire(timeout=AI_QUEUE_TIMEOUT):
+        AI_REJECTED.inc(purpose=purpose, reason='saturated')
+        raise AIUnavailableError(f"All {AI_MAX_CONCURRENCY} Gemini call slots busy")
+    if not breaker.allow(): # Re-checked with a slot held; also claims the half-open trial
+        _slots.release()
+        AI_REJECTED.inc(purpose=purpose, reason='breaker_open')
+        raise AIUnavailableError("Gemini circuit breaker is open")
+    outcome = 'error'
+    started = time.perf_counter()
+    try:
+        # retry=None turns off the SDK's own retry wrapper, whose 600s deadline would
+        # override `timeout`; generate() retries transient errors itself
+        request_options = dict(kwargs.pop('request_options', None) or {}, timeout=timeout, retry=None)
+        response = model.generate_content(prompt, request_options=request_options, **kwargs)
+        outcome = 'ok'
+    except Exception as e:
+        if is_transient(e):
+            breaker.record_failure()
+        else:
+            breaker.record_success() # Gemini answered; the request itself was at fault
+        raise
+    finally:
+        _slots.release()
+        elapsed = time.perf_counter() - started
+        AI_SECONDS.observe(elapsed, purpose=purpose, outcome=outcome)
+        record(f"ai:{purpose}", elapsed)
+    breaker.record_success()
+    return response
+
+
+def generate(model, prompt: str, purpose: str, retries: int = 0, timeout: float = AI_TIMEOUT,
+             backoff: float = AI_RETRY_BACKOFF, **kwargs):
+    """Calls model.generate_content through the breaker, the concurrency limit and a deadline.
+
+    `timeout` bounds the whole call including retries. Pass `retries` only for
+    idempotent calls; they are spaced by jittered exponential backoff and only
+    follow transient errors (see is_transient()); others are raised at once. Raises
+    AIUnavailableError when the call is refused without being sent. Latency,
+    prompt size and token usage are recorded under `purpose`.
+    """
+    AI_PROMPT_CHARS.observe(len(prompt), purpose=purpose)
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        try:
+            response = _attempt(model, prompt, purpose, max(deadline - time.monotonic(), 0.1), dict(kwargs))
+            break
+        except AIUnavailableError:
+            raise
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            attempt += 1
+            delay = backoff * (2 ** (attempt - 1))
+            delay += random.uniform(0, delay / 2)
+            if attempt > retries or time.monotonic() + delay >= deadline:
+                raise
+            time.sleep(delay)
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None:
+        AI_TOKENS.inc(getattr(usage, 'prompt_token_count', 0) or 0, purpose=purpose, kind='prompt')
+        AI_TOKENS.inc(getattr(usage, 'candidates_token_count', 0) or 0, purpose=purpose, kind='completion')
+    return response
+
+
+def probe() -> bool:
+    """Sends a tiny request to check the API is reachable and records the result."""
+    global _healthy, _last_error
+    if _override is not None:
+        return True
+    if not GEMINI_API_KEY:
+        return False
+    try:
+        generate(_client(), "Hello", "health_probe", generation_config={"max_output_tokens": 5})
+        if not _healthy:
+            log_event("ai_recovered", "Gemini reachable again; AI features re-enabled.", level='info')
+        _healthy, _last_error = True, None
+    except AIUnavailableError:
+        pass # Breaker open or saturated: nothing learned about reachability
+    except Exception as e:
+        if _healthy:
+            log_event("ai_probe_failed", "Gemini health probe failed, AI features paused", error=str(e))
+        _healthy, _last_error = False, str(e)
+    return _healthy
+
+
+def _probe_loop(interval: float):
+    while True:
+        probe()
+        time.sleep(interval)
+
+
+def start_health_probe(interval: float = AI_HEALTH_INTERVAL):
+    """Starts the background probe that replaces the old import-time 'Hello' request."""
+    global _probe_thread
+    if not GEMINI_API_KEY or _override is not None or (_probe_thread and _probe_thread.is_alive()):
+        return
+    _probe_thread = threading.Thread(target=_probe_loop, args=(interval,), name='gemini-health-probe', daemon=True)
+    _probe_thread.start()
+
+
+def status() -> dict:
+    return {"configured": is_configured(), "healthy": _healthy, "last_error": _last_error,
+            "breaker": breaker.state}
@@ -0,0 +1,297 @@
+import calendar
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from categories import CATEGORIES, PENDING_CATEGORY
+from metrics import log_event
+import repository
+
+ANALYTICS_MONTHS = int(os.getenv('ANALYTICS_MONTHS', '12')) # Months of per-category totals returned
+ANALYTICS_MAX_MONTHS = 120
+ANALYTICS_WINDOW = int(os.getenv('ANALYTICS_WINDOW', '3')) # Rolling-average window, in months
+# Full reload period; catches changes made by other processes that the incremental path cannot see
+ANALYTICS_FULL_REFRESH = float(os.getenv('ANALYTICS_FULL_REFRESH', '3600'))
+ANALYTICS_FETCH_ROWS = 50000 # Rows per fetchmany() while loading
+ANALYTICS_CACHE_USERS = int(os.getenv('ANALYTICS_CACHE_USERS', '64')) # Per-user snapshots kept in memory
+
+
+# numpy is imported inside the methods below so it stays off the app's startup path.
+
+class ExpenseSnapshot:
+    """Column arrays (id, day, amount, category code) of one user's expenses, kept in id order.
+
+    refresh() appends only expenses newer than the last id seen and re-reads the
+    category of rows that were still Pending, so its cost follows the number of
+    new rows, not the size of the history. All analytics are computed with
+    vectorized numpy operations over these columns.
+    """
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.categories = list(CATEGORIES) + [PENDING_CATEGORY] # code -> name
+        self._codes = {name: code for code, name in enumerate(self.categories)}
+        self._ids = self._days = self._amounts = self._cats = None
+        self.size = 0
+        self.last_id = 0
+        self.loaded_at = None
+        self.refreshes = 0
+        self.full_loads = 0
+        self._lock = threading.Lock()
+
+    # --- Loading ---
+
+    def _code(self, name: str) -> int:
+        code = self._codes.get(name)
+        if code is None: # Categories stored before the list was fixed still get their own column
+            code = self._codes[name] = len(self.categories)
+            self.categories.append(name)
+        return code
+
+    def _reserve(self, extra: int):
+        """Grows the column buffers geometrically so appends are amortized O(1)."""
+        import numpy as np
+        needed = self.size + extra
+        capacity = 0 if self._ids is None else len(self._ids)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        for name, dtype in (('_ids', np.int64), ('_days', 'datetime64[D]'), ('_amounts', np.float64), ('_cats', np.int16)):
+            column = np.zeros(capacity, dtype=dtype)
+            if getattr(self, name) is not None:
+                column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+
+    def _append(self, rows: list):
+        import numpy as np
+        count = len(rows)
+        self._reserve(count)
+        end = self.size + count
+        self._ids[self.size:end] = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+        self._days[self.size:end] = np.array([row[1].date() for row in rows], dtype='datetime64[D]')
+        self._amounts[self.size:end] = np.fromiter((row[2] for row in rows), dtype=np.float64, count=count)
+        self._cats[self.size:end] = np.fromiter((self._code(row[3]) for row in rows), dtype=np.int16, count=count)
+        self.size = end
+        self.last_id = int(self._ids[end - 1])
+
+    def _load_since(self, conn, after_id: int):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT id, date_added, amount, category FROM expenses
+                WHERE user_id = %s AND id > %s
+                ORDER BY id ASC
+            """, (self.user_id, after_id))
+            while True:
+                rows = cursor.fetchmany(ANALYTICS_FETCH_ROWS)
+                if not rows:
+                    break
+                self._append(rows)
+        finally:
+            cursor.close()
+
+    def _recheck_pending(self, conn):
+        """Picks up categories the background categorizer assigned since the last refresh."""
+        import numpy as np
+        pending = np.flatnonzero(self._cats[:self.size] == self._codes[PENDING_CATEGORY])
+        for start in range(0, len(pending), 1000):
+            positions = pending[start:start + 1000]
+            ids = [int(expense_id) for expense_id in self._ids[positions]]
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"SELECT id, category FROM expenses WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                               tuple(ids))
+                updates = {expense_id: category for expense_id, category in cursor.fetchall()}
+            finally:
+                cursor.close()
+            for position, expense_id in zip(positions, ids):
+                category = updates.get(expense_id)
+                if category and category != PENDING_CATEGORY:
+                    self._cats[position] = self._code(category)
+
+    def refresh(self, conn):
+        """Brings the snapshot up to date: a full load when empty or stale, else only the delta."""
+        with self._lock:
+            stale = self.loaded_at is None or time.monotonic() - self.loaded_at > ANALYTICS_FULL_REFRESH
+            if stale:
+                self.size, self.last_id = 0, 0
+                self.loaded_at = time.monotonic()
+                self.full_loads += 1
+            else:
+                self._recheck_pending(conn)
+            self._load_since(conn, self.last_id)
+            self.refreshes += 1
+
+    def update_category(self, expense_id: int, category: str):
+        """Applies a category correction made in this process without a reload."""
+        import numpy as np
+        with self._lock:
+            if not self.size:
+                return
+            position = int(np.searchsorted(self._ids[:self.size], expense_id))
+            if position < self.size and self._ids[position] == expense_id:
+                self._cats[position] = self._code(category)
+
+    def columns(self) -> tuple:
+        """Consistent (days, amounts, category codes) views plus the category names."""
+        with self._lock:
+            if self._ids is None:
+                self._reserve(0)
+            return (self._days[:self.size].copy(), self._amounts[:self.size].copy(),
+                    self._cats[:self.size].copy(), list(self.categories))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"rows": self.size, "refreshes": self.refreshes, "full_loads": self.full_loads}
+
+
+class SnapshotCache:
+    """Per-user ExpenseSnapshots, dropping the least recently used beyond ANALYTICS_CACHE_USERS."""
+
+    def __init__(self, max_users: int = ANALYTICS_CACHE_USERS):
+        self.max_users = max_users
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, user_id: int) -> ExpenseSnapshot:
+        with self._lock:
+            snapshot = self._snapshots.get(user_id)
+            if snapshot is None:
+                snapshot = self._snapshots[user_id] = ExpenseSnapshot(user_id)
+                while len(self._snapshots) > self.max_users:
+                    self._snapshots.popitem(last=False)
+                    self.evictions += 1
+            self._snapshots.move_to_end(user_id)
+            return snapshot
+
+    def update_category(self, user_id: int, expense_id: int, category: str):
+        with self._lock:
+            snapshot = self._snapshots.get(user_id)
+        if snapshot is not None:
+            snapshot.update_category(expense_id, category)
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshots = list(self._snapshots.values())
+        totals = {"users": len(snapshots), "evictions": self.evictions, "rows": 0, "refreshes": 0, "full_loads": 0}
+        for snapshot in snapshots:
+            for key, value in snapshot.stats().items():
+                totals[key] += value
+        return totals
+
+
+# --- Analytics ---
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def monthly_totals(days, amounts, cats, n_categories: int, first_month, n_months: int):
+    """(n_months x n_categories) spend matrix starting at `first_month` (a datetime64[M])."""
+    import numpy as np
+    month_index = (days.astype('datetime64[M]') - first_month).astype(np.int64)
+    mask = (month_index >= 0) & (month_index < n_months)
+    flat = month_index[mask] * n_categories + cats[mask]
+    totals = np.bincount(flat, weights=amounts[mask], minlength=n_months * n_categories)
+    return totals.reshape(n_months, n_categories)
+
+
+def rolling_mean(matrix, window: int):
+    """Trailing mean over `window` rows; rows before the window fills are NaN."""
+    import numpy as np
+    cumulative = np.cumsum(np.vstack([np.zeros((1, matrix.shape[1])), matrix]), axis=0)
+    result = np.full(matrix.shape, np.nan)
+    if window <= matrix.shape[0]:
+        result[window - 1:] = (cumulative[window:] - cumulative[:-window]) / window
+    return result
+
+
+def month_forecast(days, amounts, month_start: date, today: date, budget) -> dict:
+    """Burn rate, month-end projection and over-budget ETA for the month containing `today`."""
+    import numpy as np
+    days_in_month = calendar.monthrange(month_start.year, month_start.month)[1]
+    day_index = (days - np.datetime64(month_start, 'D')).astype(np.int64)
+    mask = (day_index >= 0) & (day_index < days_in_month)
+    daily = np.bincount(day_index[mask], weights=amounts[mask], minlength=days_in_month)
+    cumulative = np.cumsum(daily)
+
+    elapsed = min(today.day, days_in_month)
+    spent = float(cumulative[elapsed - 1])
+    burn_rate = spent / elapsed
+    projected = spent + burn_rate * (days_in_month - elapsed)
+
+    over_on = eta = None
+    if budget:
+        crossed = np.flatnonzero(cumulative[:elapsed] > budget)
+        if crossed.size:
+            over_on = month_start + timedelta(days=int(crossed[0]))
+        elif burn_rate > 0:
+            days_left = int(np.ceil((budget - spent) / burn_rate))
+            if elapsed + days_left <= days_in_month:
+                eta = today + timedelta(days=days_left)
+    return {
+        "month": month_start.strftime("%Y-%m"),
+        "days_in_month": days_in_month,
+        "days_elapsed": elapsed,
+        "spent": round(spent, 2),
+        "budget": budget,
+        "daily_burn_rate": round(burn_rate, 2),
+        "budget_daily_rate": round(budget / days_in_month, 2) if budget else None,
+        "projected_total": round(projected, 2),
+        "projected_over_budget": bool(budget) and projected > budget,
+        "over_budget_on": over_on.isoformat() if over_on else None,
+        "over_budget_eta": eta.isoformat() if eta else None,
+        "cumulative_by_day": [round(value, 2) for value in cumulative[:elapsed].tolist()],
+    }
+
+
+def _series(values) -> list:
+    return [None if value != value else round(value, 2) for value in values.tolist()] # NaN -> None
+
+
+def build_report(snapshot: ExpenseSnapshot, conn, months: int = ANALYTICS_MONTHS, window: int = ANALYTICS_WINDOW,
+                 today: date = None) -> dict:
+    """Refreshes the snapshot and computes the /api/analytics payload."""
+    import numpy as np
+    if not 1 <= months <= ANALYTICS_MAX_MONTHS or not 1 <= window <= ANALYTICS_MAX_MONTHS:
+        raise ValueError(f"months and window must be between 1 and {ANALYTICS_MAX_MONTHS}.")
+    snapshot.refresh(conn)
+    days, amounts, cats, categories = snapshot.columns()
+
+    today = today or date.today()
+    current_month = np.datetime64(_month_start(today), 'M')
+    first_month = current_month - (months - 1)
+    totals = monthly_totals(days, amounts, cats, len(categories), first_month, months)
+    rolling = rolling_mean(totals, window)
+    overall = totals.sum(axis=1)
+    overall_rolling = rolling_mean(overall[:, None], window)[:, 0]
+
+    used = np.flatnonzero(totals.sum(axis=0)) # Skip categories with no spend in the period
+    month_labels = [str(month) for month in np.arange(first_month, current_month + 1)]
+    month_year = _month_start(today).strftime("%Y-%m")
+    budget = repository.current_budget(conn, snapshot.user_id, month_year)
+    return {
+        "generated_at": datetime.now().isoformat(timespec='seconds'),
+        "rows": int(days.size),
+        "months": month_labels,
+        "monthly_totals": {categories[code]: _series(totals[:, code]) for code in used},
+        "monthly_total": _series(overall),
+        "rolling_average": {
+            "window": window,
+            "by_category": {categories[code]: _series(rolling[:, code]) for code in used},
+            "total": _series(overall_rolling),
+        },
+        "current_month": month_forecast(days, amounts, _month_start(today), today, budget),
+    }
+
+
+def numpy_available() -> bool:
+    try:
+        import numpy # noqa: F401
+        return True
+    except ImportError:
+        log_event("analytics_unavailable", "numpy is not installed; /api/analytics is disabled", level='warning')
+        return False
@@ -1,120 +1,107 @@
 import os
-import mysql.connector
+import time
 from datetime import datetime
-from flask import (Flask, render_template, request, redirect,
-                   url_for, flash, send_file, abort)
-import google.generativeai as genai
-from google.api_core import exceptions as google_exceptions # Import google exceptions
-from fpdf import FPDF
+from io import BytesIO, TextIOWrapper
+from flask import (Blueprint, Flask, Response, current_app, render_template as flask_render_template,
+                   request, redirect, url_for, flash, send_file, abort, jsonify, session)
+import ai
+import analytics
+import metrics
+import database
+import digest
+from database import DB_ERRORS, get_db, init_app as init_db
+import repository
+import schema
+from schema import DEFAULT_USER_ID, DEFAULT_USERNAME
+from metrics import TEMPLATE_SECONDS, Gauge, log_event, registry, timed
+import rollup
+from categories import CATEGORIES, DEFAULT_CATEGORY, PENDING_CATEGORY, category_cache
+import classifier
+from categorizer import CategorizerWorker
+from insights_cache import InsightsCache
+from export import EXPORT_FORMATS, stream_export
+from filters import parse_expense_filters
+from importer import import_statement
+from history import HISTORY_PAGE_SIZE, fetch_page, serialize_row
+from reports import (ReportJobs, generate_pdf_report, parse_period, report_fingerprint,
+                     fingerprint_etag, report_cache, report_fonts)
 
 # --- Configuration ---
 # Load sensitive data from environment variables for security
-FLASK_SECRET_KEY = 'your_strong_random_secret_key'
-GEMINI_API_KEY = "Enter your API key here"
-DB_HOST = os.getenv('DB_HOST', 'localhost')
-DB_USER = os.getenv('DB_USER', 'root')
-DB_PASSWORD = os.getenv('DB_PASSWORD', '#Enter Pass') # Keep default if not set
-DB_NAME = os.getenv('DB_DATABASE', 'payment_tracker') # Keep default if not set
-
-# Flask App Configuration
-app = Flask(__name__)
-if not FLASK_SECRET_KEY:
-    print("WARNING: FLASK_SECRET_KEY environment variable not set. Using a default insecure key.")
-    app.secret_key = 'a-very-insecure-default-key' # Use a default only if necessary, not for production
-else:
-    app.secret_key = FLASK_SECRET_KEY
-
-# Gemini Configuration
-if not GEMINI_API_KEY:
-    print("ERROR: GEMINI_API_KEY environment variable not set. AI features will fail.")
-    # Depending on your needs, you might want to exit or disable AI features
-    # exit("Gemini API Key required.")
-    gemini_model = None # Flag that AI is unavailable
-else:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        # Use a potentially more current/valid model name
-        gemini_model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        # Test connection (optional, but good practice)
-        gemini_model.generate_content("Hello", generation_config=genai.types.GenerationConfig(max_output_tokens=5))
-        print("Gemini configured successfully.")
-    except Exception as e:
-        print(f"ERROR: Failed to configure Gemini AI: {e}")
-        gemini_model = None # Flag that AI is unavailable
-
-# Database Configuration
-try:
-    db = mysql.connector.connect(
-        host=DB_HOST,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        database=DB_NAME
-    )
-    # Check connection works
-    if db.is_connected():
-        print("Database connected successfully.")
-    # Use dictionary=True for easier data handling
-    # Create a new cursor for each request context or manage carefully
-except mysql.connector.Error as err:
-    print(f"ERROR: Database connection failed: {err}")
-    # Exit or handle gracefully depending on application needs
-    exit(f"Database connection failed: {err}")
-
-def get_db_cursor():
-    """Gets a new database cursor for a request."""
-    # Reconnect if connection lost (optional, depends on setup)
-    if not db.is_connected():
-        db.reconnect()
-    return db.cursor(dictionary=True)
+FLASK_SECRET_KEY = os.getenv('FLASK_SECRET_KEY', 'your_strong_random_secret_key')
+# The web app has no login: unless this dev-only switch is on, every request acts
+# as the default user. With it on, anyone who can reach the app can pick any
+# user, so never enable it on a shared or public deployment.
+ALLOW_USER_SWITCH = os.getenv('ALLOW_USER_SWITCH', '0') == '1'
 
-# --- Utility Functions ---
-
-def get_category_from_title(title: str) -> str:
-    """Uses Gemini AI to determine the category for an expense title."""
-    if not gemini_model:
-        return "Miscellaneous" # Default if AI is unavailable
+# Routes live on a blueprint so the app itself is only built by create_app().
+# Nothing here touches the network or the database at import time: the DB pool,
+# Gemini client and PDF engine are all created lazily on first use.
+bp = Blueprint('main', __name__)
 
-    prompt = f"""Analyze the expense title below. Return ONLY the single most appropriate spending category name from this list:
-Food, Travel, Shopping, Utilities, Health, Entertainment, Education, Miscellaneous.
-
-Expense Title: '{title}'
+# --- Utility Functions ---
 
-Return only the category name, nothing else."""
-    try:
-        response = gemini_model.generate_content(prompt)
-        category = response.text.strip()
-        # Basic validation if the returned category is in our list
-        valid_categories = {"Food", "Travel", "Shopping", "Utilities", "Health", "Entertainment", "Education", "Miscellaneous"}
-        if category in valid_categories:
-            return category
-        else:
-            print(f"Warning: AI returned unexpected category '{category}'. Defaulting to Miscellaneous.")
-            return "Miscellaneous"
-    except (google_exceptions.GoogleAPIError, Exception) as e:
-        print(f"ERROR: Gemini category generation failed: {e}")
-        flash("Could not determine category automatically.", "warning")
-        return "Miscellaneous" # Default category on error
-
-def generate_insights() -> list:
-    """Generates spending insights using Gemini AI based on recent expenses."""
+def render_template(template_name: str, **context) -> str:
+    """flask.render_template, timed into the template histogram and the request profile."""
+    with timed(f"template:{template_name}", TEMPLATE_SECONDS, template=template_name):
+        return flask_render_template(template_name, **context)
+
+def current_user_id() -> int:
+    """The user whose expenses this request reads and writes: the default user unless ALLOW_USER_SWITCH."""
+    if not ALLOW_USER_SWITCH:
+        return DEFAULT_USER_ID
+    return session.get('user_id', DEFAULT_USER_ID)
+
+def get_category_from_title(user_id: int, title: str) -> str:
+    """Determines an expense's category without waiting on the network.
+
+    Cached titles and confident local predictions are answered immediately;
+    anything that needs Gemini is stored as Pending and categorized in a batch
+    by the background worker, including while Gemini is unreachable, so an
+    outage delays the category instead of settling it on a guess.
+    """
+    # Repeat titles ("Swiggy order 123") are answered from the cache, no model call
+    cached = category_cache.get(get_db(), title, user_id) # The user's own corrections first
+    if cached:
+        return cached
+
+    # Local model trained on past expenses answers confident cases in microseconds
+    local_category, confidence = classifier.classify(title)
+    if local_category and confidence >= classifier.LOCAL_CLASSIFIER_THRESHOLD:
+        return local_category
+
+    if not ai.is_configured():
+        # Without a Gemini key, the local model's best guess still beats a blanket default
+        return local_category or DEFAULT_CATEGORY
+
+    return PENDING_CATEGORY
+
+def generate_insights(user_id: int) -> list:
+    """Generates a user's spending insights using Gemini AI from a digest of their recent months.
+
+    Errors propagate so the insights cache can keep serving its last good result.
+    """
+    gemini_model = ai.get_model()
     if not gemini_model:
         return [] # Return empty list if AI is unavailable
 
-    cursor = get_db_cursor()
     try:
-        cursor.execute("SELECT title, amount, category FROM expenses ORDER BY date_added DESC LIMIT 15")
-        expense_list = cursor.fetchall()
-        cursor.close()
-
-        if not expense_list:
+        # Category totals, month-over-month changes, budget use and top merchants:
+        # a fixed-size summary of whole months rather than a handful of raw rows.
+        # The connection goes back to the pool before the (slow) model call.
+        with database.connection() as conn:
+            spending = digest.build_digest(conn, user_id)
+        if not any(month['count'] for month in spending['months']):
             return ["No expense data available to generate insights."]
+        summary = digest.render_digest(spending)
 
         prompt = f"""
-You are a friendly personal finance assistant analyzing these recent household spending entries: {expense_list}
+You are a friendly personal finance assistant. Here is a summary of a household's spending (amounts in INR):
+{summary}
 
 Please provide exactly **3 brief, actionable bullet points** based *only* on the data provided:
 1. One specific, data-driven suggestion on where the user might be able to reduce expenses.
-2. One observation about the user's spending patterns or frequency in certain categories.
+2. One observation about the user's spending patterns or month-over-month changes in certain categories.
 3. One practical budgeting or savings tip relevant to the observed spending.
 
 Keep each point concise (under 25 words). Be encouraging and avoid generic advice.
@@ -124,8 +111,13 @@ Example:
 2. You seem to shop frequently online; maybe consolidate orders to save on shipping.
 3. Try setting aside 5% of your next paycheck towards your savings goal.
 """
-        response = gemini_model.generate_content(prompt)
+        # Read-only prompt, so it is safe to retry on transient errors
+        started = time.perf_counter()
+        response = ai.generate(gemini_model, prompt, "insights", retries=ai.AI_MAX_RETRIES)
         insights_text = response.text.strip()
+        log_event("insights_generated", "Generated insights from spending digest", level='info',
+                  months=len(spending['months']), prompt_chars=len(prompt),
+                  seconds=round(time.perf_counter() - started, 3))
 
         # Parse numbered points robustly
         insight_points = []
@@ -138,157 +130,107 @@ Example:
                     insight_points.append(point)
 
         if len(insight_points) != 3:
-             print(f"Warning: AI returned {len(insight_points)} insights instead of 3. Raw text: {insights_text}")
+             log_event("insights_unexpected_count", f"AI returned {len(insight_points)} insights instead of 3",
+                       level='warning', raw_text=insights_text)
              # Optionally return raw text or a generic message if parsing fails
              # return ["Could not parse AI insights correctly."]
 
         return insight_points
 
-    except (mysql.connector.Error, google_exceptions.GoogleAPIError, Exception) as e:
-        print(f"ERROR: Failed to generate insights: {e}")
-        if cursor: cursor.close()
-        return ["Could not generate insights at this time."] # Return error message list
+    except Exception as e: # Database and Gemini API errors alike
+        log_event("insights_failed", "Failed to generate insights", error=str(e))
+        raise
+
+def get_dashboard_data(user_id: int) -> dict:
+    """Fetches all necessary data for a user's dashboard template.
 
-def get_dashboard_data() -> dict:
-    """Fetches all necessary data for the dashboard template."""
-    cursor = get_db_cursor()
+    Every read is a prefix lookup on a user-leading key (rollup, budget,
+    expenses indexes), so the dashboard does not slow down as users are added.
+    """
     data = {
         "budget": 0.0,
         "total_spent": 0.0,
+        "category_totals": [],
+        "pending_count": 0,
         "expenses": [],
         "over_budget": False
     }
     try:
-        # Get total spent
-        cursor.execute("SELECT SUM(amount) as total FROM expenses")
-        total_spent_row = cursor.fetchone()
-        if total_spent_row and total_spent_row.get('total') is not None:
-            data['total_spent'] = float(total_spent_row['total'])
+        conn = get_db()
+        month_year = datetime.now().strftime("%Y-%m")
+        # Get this month's spend from the rollup (one row per category, no table scan)
+        summary = rollup.month_summary(conn, user_id, month_year)
+        data['total_spent'] = sum(bucket['total'] for bucket in summary.values())
+        data['category_totals'] = sorted(((category, bucket['total']) for category, bucket in summary.items()),
+                                         key=lambda item: item[1], reverse=True)
+
+        # Expenses still waiting for the background categorizer
+        data['pending_count'] = repository.pending_count(conn, user_id)
 
         # Get recent expenses
-        cursor.execute("SELECT title, amount, category, DATE_FORMAT(date_added, '%Y-%m-%d %H:%i') as formatted_date FROM expenses ORDER BY date_added DESC LIMIT 10")
-        data['expenses'] = cursor.fetchall()
+        data['expenses'] = repository.recent_expenses(conn, user_id, 10)
 
-        # Get current budget (assuming one budget entry per month/period is managed elsewhere or latest is fine)
-        cursor.execute("SELECT amount FROM budget ORDER BY id DESC LIMIT 1") # Or filter by current month_year if needed
-        budget_row = cursor.fetchone()
-        if budget_row and budget_row.get('amount') is not None:
-            data['budget'] = float(budget_row['amount'])
+        # This month's budget, or the most recent one if none was set for this month yet
+        budget = repository.current_budget(conn, user_id, month_year)
+        if budget is not None:
+            data['budget'] = budget
 
         # Calculate over_budget status
         if data['budget'] > 0:
             data['over_budget'] = data['total_spent'] > data['budget']
 
-        cursor.close()
         return data
 
-    except mysql.connector.Error as err:
-        print(f"ERROR: Database error fetching dashboard data: {err}")
+    except DB_ERRORS as err:
+        log_event("dashboard_db_error", "Database error fetching dashboard data", error=str(err))
         flash("Error fetching dashboard data from database.", "error")
-        if cursor: cursor.close()
         # Return default data structure on error
         return data
     except Exception as e:
-        print(f"ERROR: Unexpected error fetching dashboard data: {e}")
+        log_event("dashboard_error", "Unexpected error fetching dashboard data", error=str(e))
         flash("An unexpected error occurred while fetching dashboard data.", "error")
-        if cursor: cursor.close()
         return data
 
 
-# --- PDF Generation Class ---
-class PDF(FPDF):
-    def header(self):
-        self.set_font("Helvetica", "B", 14)
-        self.cell(0, 10, "Monthly Spending Report", ln=True, align="C")
-        self.ln(5) # Add a little space after header
-
-    def footer(self):
-        self.set_y(-15)
-        self.set_font("Helvetica", "I", 8)
-        self.cell(0, 10, f"Page {self.page_no()}", 0, 0, "C")
-
-def generate_pdf_report() -> str:
-    """Generates a PDF report of the current month's expenses."""
-    cursor = get_db_cursor()
-    try:
-        month_year = datetime.now().strftime("%Y-%m")
-        # Fetch expenses for the current month
-        cursor.execute("""
-            SELECT title, amount, category, DATE_FORMAT(date_added, '%Y-%m-%d') as formatted_date
-            FROM expenses
-            WHERE DATE_FORMAT(date_added, '%Y-%m') = %s
-            ORDER BY date_added ASC
-        """, (month_year,))
-        expenses = cursor.fetchall()
-
-        # Fetch total for the current month - USE ALIAS
-        cursor.execute("""
-            SELECT SUM(amount) as monthly_total
-            FROM expenses
-            WHERE DATE_FORMAT(date_added, '%Y-%m') = %s
-        """, (month_year,))
-        total_row = cursor.fetchone()
-        total = total_row.get('monthly_total') if total_row and total_row.get('monthly_total') is not None else 0.0
-        cursor.close()
-
-        pdf = PDF(orientation="P", unit="mm", format="A4")
-        pdf.add_page()
-        pdf.set_font("Helvetica", size=11)
-
-        # Add table header
-        pdf.set_font("Helvetica", "B", 11)
-        pdf.cell(80, 10, "Title", border=1)
-        pdf.cell(40, 10, "Category", border=1)
-        pdf.cell(30, 10, "Date", border=1)
-        pdf.cell(30, 10, "Amount (INR)", border=1, ln=True, align="R")
-        pdf.set_font("Helvetica", size=11)
-
-        # Add table rows
-        for e in expenses:
-            # Handle potential encoding issues carefully for FPDF core fonts
-            title = e.get('title', 'N/A').encode('latin-1', 'replace').decode('latin-1')
-            category = e.get('category', 'N/A').encode('latin-1', 'replace').decode('latin-1')
-            date_str = e.get('formatted_date', 'N/A')
-            amount_str = f"{e.get('amount', 0.0):.2f}" # Format amount
-
-            pdf.cell(80, 10, title, border=1)
-            pdf.cell(40, 10, category, border=1)
-            pdf.cell(30, 10, date_str, border=1)
-            pdf.cell(30, 10, amount_str, border=1, ln=True, align="R")
-
-        pdf.ln(10) # Add space before total
-
-        # Add total
-        pdf.set_font("Helvetica", "B", 12)
-        total_line = f"Total Spending for {datetime.now().strftime('%B %Y')}: INR {total:.2f}"
-        pdf.cell(0, 10, total_line.encode('latin-1', 'replace').decode('latin-1'), ln=True, align="R")
-
-        # Use OS-independent path joining (safer)
-        report_dir = os.path.join(app.root_path, 'reports') # Store in a 'reports' subdir
-        os.makedirs(report_dir, exist_ok=True) # Create dir if it doesn't exist
-        filename = os.path.join(report_dir, f"Spending_Report_{month_year}.pdf")
-
-        pdf.output(filename)
-        return filename
-
-    except (mysql.connector.Error, Exception) as e:
-        print(f"ERROR: Failed to generate PDF report: {e}")
-        if cursor: cursor.close()
-        return None # Return None indicates failure
-
-
 # --- Routes ---
 
-@app.route('/')
+@bp.route('/')
 def dashboard():
     """Displays the main dashboard with expenses, budget, and insights."""
-    dashboard_info = get_dashboard_data()
+    user_id = current_user_id()
+    dashboard_info = get_dashboard_data(user_id)
     # Generate insights only if AI is available
-    insights_list = generate_insights() if gemini_model else ["AI Insights currently unavailable."]
+    insights_cache = current_app.extensions['insights_cache']
+    insights_list = insights_cache.get(get_db(), user_id) if ai.get_model() else ["AI Insights currently unavailable."]
+
+    return render_template('index.html', **dashboard_info, insights=insights_list, categories=CATEGORIES,
+                           username=session.get('username', DEFAULT_USERNAME) if ALLOW_USER_SWITCH else DEFAULT_USERNAME,
+                           allow_user_switch=ALLOW_USER_SWITCH)
 
-    return render_template('index.html', **dashboard_info, insights=insights_list)
+@bp.route('/user', methods=['POST'])
+def switch_user():
+    """Selects (creating on first use) the user whose expenses this session works with.
 
-@app.route('/add', methods=['GET', 'POST'])
+    Unauthenticated, so only available in the ALLOW_USER_SWITCH dev mode.
+    """
+    if not ALLOW_USER_SWITCH:
+        abort(403)
+    try:
+        conn = get_db()
+        user_id = repository.get_or_create_user(conn, request.form.get('username'))
+        conn.commit()
+        session['user_id'] = user_id
+        session['username'] = request.form['username'].strip()
+        flash(f"Now tracking expenses for {session['username']}.", "success")
+    except ValueError as e:
+        flash(str(e), "error")
+    except DB_ERRORS as err:
+        log_event("switch_user_db_error", "Database error switching user", error=str(err))
+        flash("Database error switching user. Please try again.", "error")
+        get_db().rollback()
+    return redirect(url_for('main.dashboard'))
+
+@bp.route('/add', methods=['GET', 'POST'])
 def add_expense():
     """Handles adding a new expense (displays form on GET, processes on POST)."""
     if request.method == 'POST':
@@ -307,98 +249,382 @@ def add_expense():
                  return render_template('add.html')
 
             # Get category using AI (or default)
-            category = get_category_from_title(title)
+            category = get_category_from_title(current_user_id(), title)
 
-            # Insert into database
-            cursor = get_db_cursor()
-            sql = "INSERT INTO expenses (title, amount, category, date_added) VALUES (%s, %s, %s, %s)"
-            val = (title, amount, category, datetime.now())
-            cursor.execute(sql, val)
-            db.commit() # Commit the transaction
-            cursor.close()
+            # Insert into database (the rollup is updated in the same transaction)
+            repository.add_expense(get_db(), current_user_id(), title, amount, category)
+            get_db().commit() # Commit the transaction
 
-            flash(f"Expense '{title}' added! Category assigned: {category}", "success")
-            return redirect(url_for('dashboard'))
+            if category == PENDING_CATEGORY:
+                current_app.extensions['categorizer'].notify()
+                flash(f"Expense '{title}' added! Its category will be assigned shortly.", "success")
+            else:
+                flash(f"Expense '{title}' added! Category assigned: {category}", "success")
+            return redirect(url_for('main.dashboard'))
 
         except ValueError:
              flash("Invalid amount entered. Please use numbers.", "error")
              return render_template('add.html')
-        except mysql.connector.Error as err:
-             print(f"ERROR: Database error adding expense: {err}")
+        except DB_ERRORS as err:
+             log_event("add_expense_db_error", "Database error adding expense", error=str(err))
              flash("Database error adding expense. Please try again.", "error")
-             db.rollback() # Rollback on error
-             if cursor: cursor.close()
+             get_db().rollback() # Rollback on error
              return render_template('add.html') # Show form again
         except Exception as e:
-            print(f"ERROR: Unexpected error adding expense: {e}")
+            log_event("add_expense_error", "Unexpected error adding expense", error=str(e))
             flash("An unexpected error occurred while adding the expense.", "error")
-            db.rollback() # Rollback on error
-            if cursor: cursor.close()
+            get_db().rollback() # Rollback on error
             return render_template('add.html') # Show form again
 
     # For GET request:
     return render_template('add.html')
 
-@app.route('/set_budget', methods=['POST'])
+@bp.route('/set_budget', methods=['POST'])
 def set_budget():
     """Sets or updates the monthly budget."""
     budget_str = request.form.get('budget')
     if not budget_str:
         flash("Budget amount is required.", "error")
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     try:
         budget = float(budget_str)
         if budget < 0:
              flash("Budget cannot be negative.", "error")
-             return redirect(url_for('dashboard'))
+             return redirect(url_for('main.dashboard'))
 
         month_year = datetime.now().strftime("%Y-%m") # Or use a specific logic for budget period
-        cursor = get_db_cursor()
-        # Using REPLACE assumes 'month_year' is a unique key or primary key for budget periods
-        # Adjust schema/query if you need multiple budget entries per month or different logic
-        sql = "REPLACE INTO budget (month_year, amount) VALUES (%s, %s)"
-        val = (month_year, budget)
-        cursor.execute(sql, val)
-        db.commit()
-        cursor.close()
+        # Upsert on the unique month_year key (portable replacement for REPLACE INTO)
+        repository.set_budget(get_db(), current_user_id(), month_year, budget)
+        get_db().commit()
         flash(f"Monthly budget set to INR {budget:.2f}!", "success")
 
     except ValueError:
         flash("Invalid budget amount entered. Please use numbers.", "error")
-    except mysql.connector.Error as err:
-        print(f"ERROR: Database error setting budget: {err}")
+    except DB_ERRORS as err:
+        log_event("set_budget_db_error", "Database error setting budget", error=str(err))
         flash("Database error setting budget. Please try again.", "error")
-        db.rollback()
-        if cursor: cursor.close()
+        get_db().rollback()
     except Exception as e:
-        print(f"ERROR: Unexpected error setting budget: {e}")
+        log_event("set_budget_error", "Unexpected error setting budget", error=str(e))
         flash("An unexpected error occurred while setting the budget.", "error")
-        db.rollback()
-        if cursor: cursor.close()
+        get_db().rollback()
 
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('main.dashboard'))
 
-@app.route('/download_report')
+@bp.route('/expense/<int:expense_id>/category', methods=['POST'])
+def correct_category(expense_id):
+    """Lets the user override an expense's category and re-pins the cached classification."""
+    category = request.form.get('category')
+    if category not in CATEGORIES:
+        flash("Please choose a valid category.", "error")
+        return redirect(url_for('main.dashboard'))
+
+    try:
+        conn = get_db()
+        expense = repository.lock_expense(conn, current_user_id(), expense_id)
+        if not expense:
+            conn.rollback()
+            abort(404)
+
+        if expense['category'] != category:
+            repository.change_category(conn, expense, category)
+        # This user's future expenses with the same normalized title get the corrected category.
+        # The shared cache and local model are left alone: one user's preference must not
+        # recategorize anyone else's expenses.
+        category_cache.override(conn, expense['user_id'], expense['title'], category)
+        conn.commit()
+        current_app.extensions['analytics'].update_category(expense['user_id'], expense_id, category)
+        flash(f"Category for '{expense['title']}' changed to {category}.", "success")
+
+    except DB_ERRORS as err:
+        log_event("correct_category_db_error", "Database error correcting category",
+                  expense_id=expense_id, error=str(err))
+        flash("Database error updating the category. Please try again.", "error")
+        get_db().rollback()
+
+    return redirect(url_for('main.dashboard'))
+
+def _send_report(data: bytes, etag: str, filename: str):
+    response = send_file(BytesIO(data), mimetype='application/pdf', as_attachment=True,
+                         download_name=filename, etag=etag, conditional=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True # Always revalidate; the ETag makes that cheap
+    return response
+
+@bp.route('/download_report')
 def download_report():
-    """Generates and serves the monthly expense report PDF."""
+    """Serves the expense report PDF for ?month=YYYY-MM, ?year=YYYY or ?start=&end= (default: this month).
+
+    Renders inline; clients asking for long ranges should prefer the POST /reports job.
+    """
+    try:
+        start_month, end_month = parse_period(request.args.get('month'), request.args.get('year'),
+                                              request.args.get('start'), request.args.get('end'))
+    except ValueError as e:
+        flash(f"Invalid report period: {e}", "error")
+        return redirect(url_for('main.dashboard'))
+
     try:
-        filename = generate_pdf_report()
-        if filename and os.path.exists(filename):
-             # send_file needs the absolute path
-            return send_file(filename, as_attachment=True)
+        # Unchanged data means an unchanged PDF: answer If-None-Match without rendering anything
+        user_id = current_user_id()
+        fingerprint = report_fingerprint(get_db(), user_id, start_month, end_month)
+        etag = fingerprint_etag(fingerprint)
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        report = generate_pdf_report(user_id, start_month, end_month, fingerprint)
+        if report:
+            return _send_report(*report)
         else:
             flash("Could not generate the PDF report.", "error")
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
     except Exception as e:
-        print(f"ERROR: Failed to send PDF report: {e}")
+        log_event("send_report_failed", "Failed to send PDF report", error=str(e))
         flash("An error occurred while preparing the download.", "error")
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
+
+def _report_job_response(job, status: int = 200):
+    body = job.to_dict()
+    body['status_url'] = url_for('main.report_job', job_id=job.id)
+    if job.status == 'done':
+        body['download_url'] = url_for('main.download_report_job', job_id=job.id)
+    response = jsonify(body)
+    response.status_code = status
+    if job.status in ('queued', 'running'):
+        response.headers['Retry-After'] = '1'
+    if status == 202:
+        response.headers['Location'] = body['status_url']
+    return response
+
+@bp.route('/reports', methods=['POST'])
+def start_report_job():
+    """Queues a background PDF render for month/year/start+end (as for /download_report); 202 with a status URL."""
+    try:
+        start_month, end_month = parse_period(request.values.get('month'), request.values.get('year'),
+                                              request.values.get('start'), request.values.get('end'))
+    except ValueError as e:
+        return jsonify(error=f"Invalid report period: {e}"), 400
+    user_id = current_user_id()
+    try:
+        fingerprint = report_fingerprint(get_db(), user_id, start_month, end_month)
+    except DB_ERRORS as err:
+        log_event("report_job_db_error", "Database error queueing a report", error=str(err))
+        return jsonify(error="Database error queueing the report."), 500
+    job = current_app.extensions['report_jobs'].submit(user_id, start_month, end_month, fingerprint)
+    return _report_job_response(job, 202)
+
+@bp.route('/reports/<job_id>')
+def report_job(job_id):
+    """Status of one of the current user's report jobs: queued, running, done (with download_url) or failed."""
+    job = current_app.extensions['report_jobs'].get(current_user_id(), job_id)
+    if job is None:
+        return jsonify(error="No such report job."), 404
+    return _report_job_response(job)
+
+@bp.route('/reports/<job_id>/download')
+def download_report_job(job_id):
+    """The PDF of a finished report job; 409 with the job's status while it is still pending or if it failed."""
+    job = current_app.extensions['report_jobs'].get(current_user_id(), job_id)
+    if job is None:
+        return jsonify(error="No such report job."), 404
+    if job.status != 'done':
+        return _report_job_response(job, 409)
+    return _send_report(*job.result)
+
+def _history_page():
+    """Shared request parsing for the HTML and JSON history views; raises ValueError on bad input."""
+    filters = parse_expense_filters(request.args)
+    limit = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+    rows, next_cursor = fetch_page(get_db(), current_user_id(), filters, request.args.get('cursor'), limit)
+    return rows, next_cursor
+
+@bp.route('/expenses')
+def expense_history():
+    """Browsable expense history, newest first, with category/date filters."""
+    try:
+        rows, next_cursor = _history_page()
+    except ValueError as e:
+        flash(str(e), "error")
+        rows, next_cursor = [], None
+    except DB_ERRORS as err:
+        log_event("history_db_error", "Database error fetching expense history", error=str(err))
+        flash("Error fetching expense history from database.", "error")
+        rows, next_cursor = [], None
+    # Carry the filters into the "older" link, replacing only the cursor
+    next_args = {key: value for key, value in request.args.items() if key != 'cursor'}
+    return render_template('expenses.html', expenses=rows, next_cursor=next_cursor,
+                           next_args=next_args, categories=CATEGORIES)
+
+@bp.route('/api/expenses')
+def api_expenses():
+    """JSON expense history: {items: [...], next_cursor: token-or-null}."""
+    try:
+        rows, next_cursor = _history_page()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except DB_ERRORS as err: # Includes pool checkout timeouts
+        log_event("history_db_error", "Database error fetching expense history", error=str(err))
+        return jsonify(error="Database unavailable; try again shortly."), 503
+    return jsonify(items=[serialize_row(row) for row in rows], next_cursor=next_cursor)
+
+@bp.route('/api/analytics')
+def api_analytics():
+    """JSON spending analytics: per-category monthly totals, rolling averages and a month-end forecast."""
+    if not analytics.numpy_available():
+        return jsonify(error="Analytics needs numpy, which is not installed."), 503
+    months = request.args.get('months', analytics.ANALYTICS_MONTHS, type=int)
+    window = request.args.get('window', analytics.ANALYTICS_WINDOW, type=int)
+    try:
+        with timed("analytics"):
+            snapshot = current_app.extensions['analytics'].get(current_user_id())
+            report = analytics.build_report(snapshot, get_db(), months, window)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except DB_ERRORS as err:
+        log_event("analytics_db_error", "Database error building analytics", error=str(err))
+        return jsonify(error="Database error building analytics."), 500
+    return jsonify(report)
+
+@bp.route('/import', methods=['GET', 'POST'])
+def import_expenses():
+    """Bulk-imports a bank/card statement CSV (form on GET, processes the upload on POST)."""
+    if request.method == 'POST':
+        upload = request.files.get('statement')
+        if not upload or not upload.filename:
+            flash("Please choose a CSV statement to upload.", "error")
+            return render_template('import.html')
+        try:
+            # Read the upload as a text stream; rows are parsed and inserted chunk by chunk.
+            # No model is passed: rows needing Gemini go in Pending and the background
+            # categorizer batches them, so a large upload never waits on the API
+            stream = TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+            stats = import_statement(get_db(), current_user_id(), stream)
+            if stats.pending:
+                current_app.extensions['categorizer'].notify()
+            log_event("statement_imported", stats.report(), level='info', rows=stats.rows_read,
+                      inserted=stats.inserted, seconds=round(stats.elapsed, 3))
+            flash(stats.report(), "success")
+            return redirect(url_for('main.dashboard'))
+        except (ValueError, UnicodeDecodeError) as e:
+            flash(f"Could not read the statement: {e}", "error")
+            return render_template('import.html')
+        except DB_ERRORS as err:
+            log_event("import_db_error", "Database error importing statement", error=str(err))
+            flash("Database error while importing; rows up to the failing chunk were saved.", "error")
+            return render_template('import.html')
+
+    return render_template('import.html')
+
+@bp.route('/export')
+def export_expenses():
+    """Streams the expense history as CSV or NDJSON (?format=, ?from=, ?to=, ?category=)."""
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify(error=f"Unsupported format '{export_format}'. Use csv or ndjson."), 400
+    try:
+        filters = parse_expense_filters(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    filename = f"expenses_{datetime.now():%Y%m%d_%H%M%S}.{export_format}"
+    # The generator runs after this request returns, so it gets the user id rather than the session
+    response = Response(stream_export(export_format, current_user_id(), filters),
+                        mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no' # Let reverse proxies pass chunks straight through
+    return response
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text-format metrics for this worker process."""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+# --- App Factory ---
+
+def _numeric_stats(sources: dict) -> dict:
+    """Flattens {name: stats_callable} into {(name, stat): value}, keeping numeric values only."""
+    values = {}
+    for name, stats in sources.items():
+        for stat, value in stats().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                values[(name, stat)] = value
+    return values
+
+def _register_gauges(app: Flask):
+    """Exposes the caches' and background workers' own counters on /metrics."""
+    sources = {
+        "category_cache": category_cache.stats,
+        "insights_cache": app.extensions['insights_cache'].stats,
+        "report_cache": report_cache.stats,
+        "report_jobs": app.extensions['report_jobs'].stats,
+        "categorizer": app.extensions['categorizer'].stats,
+        "analytics": app.extensions['analytics'].stats,
+        "ai_breaker": lambda: ai.breaker.stats(),
+    }
+    registry.register(Gauge('expense_tracker_component_stat', 'Cache and worker counters by component.',
+                            lambda: _numeric_stats(sources), ('component', 'stat')))
+    registry.register(Gauge('expense_tracker_ai_healthy', 'Whether Gemini answered the last health probe.',
+                            lambda: 1 if ai.is_configured() and ai.status()['healthy'] else 0))
+
+
+def create_app(config: dict = None) -> Flask:
+    """Builds the Flask app and starts its background workers."""
+    app = Flask(__name__)
+    if config:
+        app.config.update(config)
+    if not FLASK_SECRET_KEY:
+        print("WARNING: FLASK_SECRET_KEY environment variable not set. Using a default insecure key.")
+        app.secret_key = 'a-very-insecure-default-key' # Use a default only if necessary, not for production
+    else:
+        app.secret_key = FLASK_SECRET_KEY
+
+    # Reports embed a Unicode font; a missing one stops startup here instead of garbling every PDF
+    report_fonts()
+
+    # Database Configuration
+    # Connections come from a per-process pool (see database.py); each request checks
+    # one out on first use and returns it when the app context tears down.
+    init_db(app)
+    if database.is_sqlite():
+        # The embedded database is created and kept current on startup; MySQL
+        # deployments run `python schema.py migrate` as a release step instead
+        with database.connection() as conn:
+            schema.migrate(conn)
+    # Request latency histograms, plus (with PROFILING_ENABLED=1) a Server-Timing breakdown for `X-Profile: 1` requests
+    metrics.init_app(app)
+    app.register_blueprint(bp)
+
+    # Gemini Configuration
+    if not ai.is_configured():
+        print("WARNING: GEMINI_API_KEY environment variable not set. Using the local category model only.")
+    # Reachability is checked off the request path and re-checked periodically,
+    # so a worker that boots during an API outage recovers on its own
+    ai.start_health_probe()
+    # The local category model is trained from past expenses off the request path
+    # (only when no saved model exists); until then requests see an empty one
+    classifier.start_background_training()
+
+    # Background categorization of Pending expenses (batched model calls)
+    categorizer = CategorizerWorker(app, ai.get_model)
+    categorizer.start()
+    app.extensions['categorizer'] = categorizer
+    # Insights are regenerated in the background only when the underlying data changes
+    app.extensions['insights_cache'] = InsightsCache(app, generate_insights)
+    # Per-user columnar expense snapshots behind /api/analytics, loaded on first use and then topped up
+    app.extensions['analytics'] = analytics.SnapshotCache()
+    # Multi-month PDF reports rendered off the request thread, polled via /reports/<job_id>
+    app.extensions['report_jobs'] = ReportJobs(app)
+    _register_gauges(app)
+    return app
 
 # --- Main Execution ---
 if __name__ == '__main__':
     print("Starting Flask application...")
     print("Ensure environment variables FLASK_SECRET_KEY and GEMINI_API_KEY are set.")
     print("Database connection details can also be set via DB_HOST, DB_USER, DB_PASSWORD, DB_NAME env vars.")
+    print("Pool sizing can be tuned with DB_POOL_SIZE and DB_POOL_TIMEOUT.")
     # Consider host='0.0.0.0' to make accessible on network if needed
-    app.run(debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
+    create_app().run(debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
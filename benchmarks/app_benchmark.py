@@ -0,0 +1,252 @@
+"""Latency and throughput of the main pages at several table sizes and concurrency levels.
+
+For every --sizes entry a child process seeds its own database (an embedded
+SQLite file under benchmarks/data/ by default; with BENCH_DB_BACKEND=mysql the
+database BENCH_DB_DATABASE + "_" + size, e.g. payment_tracker_bench_100k), installs a
+deterministic fake Gemini model, builds the app in-process and drives `/`,
+`/add`, `/set_budget` and `/download_report` from --concurrency client threads.
+With --users N the rows are spread over N users and the requests act as one
+of them, so per-user latency can be compared as the tenant count grows.
+Results (p50/p95/p99 latency and requests/sec per endpoint) are written as JSON
+so runs from two commits can be compared with --compare.
+
+Usage: python benchmarks/app_benchmark.py [--sizes 1k,100k,10m] [--concurrency 1,4,16]
+                                          [--requests 200] [--ai-latency 0.0] [--users 1]
+                                          [--output FILE] [--compare BASELINE.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+BENCH_DB_PREFIX = os.getenv('BENCH_DB_DATABASE', 'payment_tracker_bench')
+ENDPOINTS = ('dashboard', 'add', 'set_budget', 'download_report')
+
+
+def parse_size(label: str) -> int:
+    """'1k' -> 1000, '10m' -> 10000000."""
+    label = label.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(label[-1:], 1)
+    return int(float(label.rstrip('km')) * multiplier)
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+# --- Worker (one process per table size) ---
+
+def _requests_for():
+    """endpoint -> (callable(client, i) returning a response, expected status codes)."""
+    from seeding import TITLES
+    report_month = datetime.now().strftime("%Y-%m")
+    return {
+        'dashboard': (lambda client, i: client.get('/'), {200}),
+        'add': (lambda client, i: client.post('/add', data={'title': f"{TITLES[i % len(TITLES)]} {i}",
+                                                              'amount': f"{100 + i % 900}.50"}), {302}),
+        'set_budget': (lambda client, i: client.post('/set_budget', data={'budget': str(50000 + i)}), {302}),
+        'download_report': (lambda client, i: client.get(f'/download_report?month={report_month}'), {200}),
+    }
+
+
+def run_phase(app, send, expected: set, concurrency: int, total: int) -> dict:
+    """Sends `total` requests from `concurrency` threads; returns latency and throughput figures."""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(i):
+        nonlocal errors
+        client = getattr(local, 'client', None)
+        if client is None:
+            # No cookies: flashed messages would otherwise pile up in every client's session
+            client = local.client = app.test_client(use_cookies=False)
+        started = time.perf_counter()
+        response = send(client, i)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if response.status_code not in expected:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / wall, 1) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+    }
+
+
+def run_worker(options) -> list:
+    sys.path.insert(0, ROOT_DIR)
+    from seeding import ensure_database, seed
+
+    rows = parse_size(options.worker)
+    log = lambda message: print(f"[{options.worker}] {message}", flush=True)
+    ensure_database()
+    seed(rows, log=log, users=options.users)
+
+    import ai
+    from fake_genai import FakeGenerativeModel
+    ai.set_model(FakeGenerativeModel(latency=options.ai_latency))
+
+    from app import create_app
+    from reports import report_cache
+    app = create_app()
+    requests = _requests_for()
+
+    # Warm-up loads the local classifier, fills the caches and primes the pool
+    for endpoint in ENDPOINTS:
+        send, expected = requests[endpoint]
+        run_phase(app, send, expected, 1, options.warmup)
+
+    results = []
+    for concurrency in options.concurrency:
+        for endpoint in ENDPOINTS:
+            send, expected = requests[endpoint]
+            phase = run_phase(app, send, expected, concurrency, options.requests)
+            phase.update(size=options.worker, rows=rows, users=options.users, endpoint=endpoint)
+            results.append(phase)
+            log(f"{endpoint:>16} c={concurrency:<3} p50 {phase['latency_ms']['p50']:>8} ms  "
+                f"p95 {phase['latency_ms']['p95']:>8} ms  {phase['throughput_rps']:>8} req/s  "
+                f"errors {phase['errors']}")
+
+    # A report render with nothing cached, the case the ETag/LRU path hides above
+    send, expected = requests['download_report']
+
+    def cold_report(client, i):
+        report_cache.clear()
+        return send(client, i)
+
+    phase = run_phase(app, cold_report, expected, 1, options.cold_requests)
+    phase.update(size=options.worker, rows=rows, users=options.users, endpoint='download_report_uncached')
+    results.append(phase)
+    log(f"download_report_uncached p50 {phase['latency_ms']['p50']} ms")
+    app.extensions['categorizer'].stop()
+    return results
+
+
+# --- Driver ---
+
+def compare(current: dict, baseline_path: str):
+    """Prints the p95 and throughput change of every matching (size, endpoint, concurrency) series."""
+    with open(baseline_path, encoding='utf-8') as fh:
+        baseline = json.load(fh)
+    previous = {(r['size'], r.get('users', 1), r['endpoint'], r['concurrency']): r for r in baseline['results']}
+    print(f"\nAgainst {baseline['meta']['commit']} ({baseline_path}):")
+    for result in current['results']:
+        before = previous.get((result['size'], result.get('users', 1), result['endpoint'], result['concurrency']))
+        if not before:
+            continue
+        p95_before, p95_now = before['latency_ms']['p95'], result['latency_ms']['p95']
+        p95_change = (p95_now - p95_before) / p95_before * 100 if p95_before else 0.0
+        rps_before, rps_now = before['throughput_rps'], result['throughput_rps']
+        rps_change = (rps_now - rps_before) / rps_before * 100 if rps_before else 0.0
+        print(f"{result['size']:>5} {result['endpoint']:>24} c={result['concurrency']:<3} "
+              f"p95 {p95_before:>9} -> {p95_now:>9} ms ({p95_change:+6.1f}%)  "
+              f"req/s {rps_before:>8} -> {rps_now:>8} ({rps_change:+6.1f}%)")
+
+
+def main(options):
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "started": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "requests_per_phase": options.requests,
+            "ai_latency_s": options.ai_latency,
+            "users": options.users,
+            "backend": os.getenv('BENCH_DB_BACKEND', 'sqlite'),
+        },
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as scratch:
+        for size in options.sizes:
+            result_file = os.path.join(scratch, f"{size}.json")
+            label = size if options.users == 1 else f"{size}_u{options.users}" # Different users, different data
+            env = dict(os.environ,
+                       DB_BACKEND=os.getenv('BENCH_DB_BACKEND', 'sqlite'),
+                       DB_DATABASE=f"{BENCH_DB_PREFIX}_{label}",
+                       SQLITE_PATH=os.path.join(BENCH_DIR, 'data', f"bench_{label}.db"),
+                       # Keep the benchmark's learned model away from the real one
+                       CLASSIFIER_PATH=os.path.join(scratch, f"classifier_{size}.json.gz"),
+                       # Let `X-Profile: 1` requests against the worker return Server-Timing spans
+                       PROFILING_ENABLED='1')
+            command = [sys.executable, os.path.abspath(__file__), '--worker', size, '--result-file', result_file,
+                       '--concurrency', ','.join(map(str, options.concurrency)),
+                       '--requests', str(options.requests), '--warmup', str(options.warmup),
+                       '--cold-requests', str(options.cold_requests), '--ai-latency', str(options.ai_latency),
+                       '--users', str(options.users)]
+            subprocess.run(command, env=env, check=True)
+            with open(result_file, encoding='utf-8') as fh:
+                report['results'].extend(json.load(fh))
+
+    output = options.output or os.path.join(RESULTS_DIR, f"app_{commit}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=2)
+    print(f"Wrote {len(report['results'])} results to {output}")
+    if options.compare:
+        compare(report, options.compare)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=lambda value: value.split(','), default=['1k', '100k', '10m'])
+    parser.add_argument('--concurrency', type=lambda value: [int(c) for c in value.split(',')], default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint per concurrency level')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--cold-requests', type=int, default=3, help='uncached report renders to time')
+    parser.add_argument('--ai-latency', type=float, default=0.0, help='simulated seconds per model call')
+    parser.add_argument('--users', type=int, default=1, help='users the seeded rows are spread over')
+    parser.add_argument('--output')
+    parser.add_argument('--compare', help='earlier results file to diff against')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.worker:
+        results = run_worker(options)
+        with open(options.result_file, 'w', encoding='utf-8') as fh:
+            json.dump(results, fh)
+    else:
+        main(options)
@@ -0,0 +1,70 @@
+"""Benchmarks /export against a synthetic multi-million-row expenses table.
+
+Seeds a dedicated database (benchmarks/data/export_bench.db, or the MySQL
+database BENCH_DB_DATABASE when BENCH_DB_BACKEND=mysql) up to --rows expenses, then streams the full history through the app in both
+formats and reports time-to-first-byte, rows/sec and peak Python heap use.
+
+Usage: python benchmarks/export_benchmark.py [--rows 2000000] [--format csv|ndjson|both]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+# Point the app at the benchmark database before anything reads the DB settings
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+os.environ['DB_BACKEND'] = os.getenv('BENCH_DB_BACKEND', 'sqlite')
+os.environ['DB_DATABASE'] = os.getenv('BENCH_DB_DATABASE', 'payment_tracker_bench')
+os.environ['SQLITE_PATH'] = os.path.join(BENCH_DIR, 'data', 'export_bench.db')
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from seeding import ensure_database, seed
+
+
+def run_export(client, export_format: str) -> dict:
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get(f"/export?format={export_format}", buffered=False)
+    first_byte = None
+    total_bytes = 0
+    lines = 0
+    for chunk in response.response:
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+        data = chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+        total_bytes += len(data)
+        lines += data.count(b'\n')
+    response.close()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rows = lines - 1 if export_format == 'csv' else lines
+    return {
+        "format": export_format,
+        "rows": rows,
+        "seconds": round(elapsed, 2),
+        "ttfb_ms": round((first_byte or 0) * 1000, 1),
+        "rows_per_sec": round(rows / elapsed) if elapsed else 0,
+        "mb": round(total_bytes / 1e6, 1),
+        "peak_heap_mb": round(peak / 1e6, 1),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--format', choices=['csv', 'ndjson', 'both'], default='both')
+    options = parser.parse_args()
+
+    ensure_database()
+    seed(options.rows)
+
+    from app import create_app
+    client = create_app().test_client()
+    formats = ['csv', 'ndjson'] if options.format == 'both' else [options.format]
+    for export_format in formats:
+        result = run_export(client, export_format)
+        print(f"{result['format']:>6}: {result['rows']:,} rows in {result['seconds']}s "
+              f"({result['rows_per_sec']:,} rows/s), TTFB {result['ttfb_ms']} ms, "
+              f"{result['mb']} MB out, peak heap {result['peak_heap_mb']} MB")
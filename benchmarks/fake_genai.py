@@ -0,0 +1,41 @@
+"""Deterministic stand-in for genai.GenerativeModel used by the benchmarks.
+
+Answers the app's two prompt shapes (batch categorization and insights) with
+stable output derived from the prompt, after a fixed simulated latency, and
+reports token usage the way the real SDK does. Install it with ai.set_model().
+"""
+import re
+import time
+import zlib
+from types import SimpleNamespace
+
+from categories import CATEGORIES
+
+_NUMBERED_TITLE_RE = re.compile(r'^\s*\d+\.\s+(.*)$', re.MULTILINE)
+
+INSIGHTS_TEXT = """1. Food is your largest category this month; cooking twice more a week would trim it.
+2. Most of your spending lands in the first half of the month.
+3. Move a fixed amount to savings on payday before discretionary spending starts."""
+
+
+class FakeGenerativeModel:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency # Seconds each call takes, standing in for network + generation time
+        self.calls = 0
+
+    def _category(self, title: str) -> str:
+        return CATEGORIES[zlib.crc32(title.encode('utf-8')) % len(CATEGORIES)]
+
+    def generate_content(self, prompt: str, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if "Expense titles:" in prompt:
+            titles = _NUMBERED_TITLE_RE.findall(prompt.split("Expense titles:", 1)[1].split("Return ONLY", 1)[0])
+            text = '[' + ', '.join(f'"{self._category(title)}"' for title in titles) + ']'
+        elif "bullet points" in prompt:
+            text = INSIGHTS_TEXT
+        else:
+            text = "OK"
+        usage = SimpleNamespace(prompt_token_count=len(prompt) // 4, candidates_token_count=len(text) // 4)
+        return SimpleNamespace(text=text, usage_metadata=usage)
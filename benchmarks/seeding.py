@@ -0,0 +1,74 @@
+"""Synthetic data shared by the benchmark scripts.
+
+Imported after the script has pointed DB_BACKEND and DB_DATABASE/SQLITE_PATH at
+its benchmark database. Benchmarks default to the embedded SQLite backend
+(BENCH_DB_BACKEND=mysql to run against a local MySQL server instead).
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+import database
+import repository
+import rollup
+import schema
+from categories import CATEGORIES
+
+SEED_BATCH = 10000
+SEED_YEARS = 5
+TITLES = ["Swiggy order", "Uber ride", "Electricity bill", "Amazon purchase", "Pharmacy",
+          "Movie tickets", "Course fee", "Grocery store", "Zomato dinner", "Metro card recharge"]
+
+
+def ensure_database():
+    """Creates database.DB_NAME if it does not exist yet (SQLite files are created on connect)."""
+    if database.is_sqlite():
+        return
+    conn = mysql.connector.connect(host=database.DB_HOST, user=database.DB_USER, password=database.DB_PASSWORD)
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{database.DB_NAME}`")
+    cursor.close()
+    conn.close()
+
+
+def seed(rows: int, log=print, users: int = 1):
+    """Tops the expenses table up to `rows` synthetic expenses spread over SEED_YEARS years.
+
+    Rows are dealt round-robin to `users` users (the default user plus
+    bench_user_2..N), so user 1 owns rows / users of them. Deterministic for a
+    given starting row count, so repeated runs compare like with like.
+    """
+    with database.connection() as conn:
+        schema.migrate(conn)
+        user_ids = [schema.DEFAULT_USER_ID] + [repository.get_or_create_user(conn, f"bench_user_{n}")
+                                               for n in range(2, users + 1)]
+        conn.commit()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM expenses")
+        existing = cursor.fetchone()[0]
+        if existing >= rows:
+            log(f"Benchmark table already has {existing:,} rows.")
+            cursor.close()
+            return
+        log(f"Seeding {rows - existing:,} rows...")
+        rng = random.Random(42 + existing)
+        origin = datetime.now() - timedelta(days=SEED_YEARS * 365)
+        span = SEED_YEARS * 365 * 86400
+        started = time.perf_counter()
+        for offset in range(existing, rows, SEED_BATCH):
+            batch = [
+                (user_ids[row % len(user_ids)],
+                 f"{rng.choice(TITLES)} {rng.randint(1, 9999)}",
+                 round(rng.uniform(20, 5000), 2),
+                 rng.choice(CATEGORIES),
+                 origin + timedelta(seconds=rng.randint(0, span)))
+                for row in range(offset, min(offset + SEED_BATCH, rows))
+            ]
+            cursor.executemany("INSERT INTO expenses (user_id, title, amount, category, date_added) "
+                               "VALUES (%s, %s, %s, %s, %s)", batch)
+            conn.commit()
+        cursor.close()
+        log(f"Seeded in {time.perf_counter() - started:.1f}s; rebuilding rollup...")
+        rollup.rebuild(conn)
@@ -0,0 +1,200 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from database import DB_ERRORS, upsert_sql
+from metrics import log_event
+
+# Canonical spending categories, in the order they are offered to the model and the UI
+CATEGORIES = ["Food", "Travel", "Shopping", "Utilities", "Health", "Entertainment", "Education", "Miscellaneous"]
+DEFAULT_CATEGORY = "Miscellaneous"
+# Placeholder stored while an expense waits for the background categorizer
+PENDING_CATEGORY = "Pending"
+
+CATEGORY_CACHE_SIZE = int(os.getenv('CATEGORY_CACHE_SIZE', '2048'))
+# In-process entries expire so a correction made in another worker process is
+# picked up from the persistent table within this many seconds
+CATEGORY_CACHE_TTL = float(os.getenv('CATEGORY_CACHE_TTL', '300'))
+
+# Amounts with an optional currency marker ("Rs. 1,250.00", "₹99", "INR 40")
+_AMOUNT_RE = re.compile(r'(?:rs\.?|inr|₹|\$)?\s*\d[\d,]*(?:\.\d+)?', re.IGNORECASE)
+_DIGITS_RE = re.compile(r'\d+')
+_PUNCT_RE = re.compile(r'[^\w\s]|_')
+
+
+def normalize_title(title: str) -> str:
+    """Reduces an expense title to a cache key: lowercase, no amounts/digits/punctuation."""
+    text = (title or '').lower()
+    text = _AMOUNT_RE.sub(' ', text)
+    text = _DIGITS_RE.sub(' ', text) # Order numbers, dates, invoice ids
+    text = _PUNCT_RE.sub(' ', text)
+    return ' '.join(text.split())[:255]
+
+
+class CategoryCache:
+    """Two-level title -> category cache: a bounded in-process LRU over the
+    persistent `category_cache` table. Keys are normalize_title() output.
+
+    Model answers are shared by every user. A user's own corrections live in
+    `category_overrides` and only ever apply to that user's expenses.
+    """
+
+    def __init__(self, maxsize: int = CATEGORY_CACHE_SIZE, ttl: float = CATEGORY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict() # key or (user_id, key) -> (category, expires_at)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _remember(self, cache_key, category):
+        with self._lock:
+            self._entries[cache_key] = (category, time.monotonic() + self.ttl)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _cached(self, cache_key) -> tuple:
+        """(found, category) from memory; a found None means "known to have no entry"."""
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry and entry[1] > time.monotonic():
+                self._entries.move_to_end(cache_key)
+                return True, entry[0]
+        return False, None
+
+    def _read(self, conn, sql: str, params: tuple) -> tuple:
+        """(ok, category) from the database; ok is False when the lookup itself failed."""
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        except DB_ERRORS as err:
+            log_event("category_cache_read_failed", "Category cache lookup failed", error=str(err))
+            return False, None
+        finally:
+            cursor.close()
+        return True, row[0] if row else None
+
+    def get(self, conn, title: str, user_id: int = None):
+        """Returns the cached category for `title`, or None on a miss. With `user_id`, their correction wins."""
+        key = normalize_title(title)
+        if not key:
+            return None
+        if user_id is not None:
+            found, category = self._cached((user_id, key))
+            if not found:
+                ok, category = self._read(conn, "SELECT category FROM category_overrides WHERE user_id = %s AND title_key = %s",
+                                          (user_id, key))
+                if ok: # A failed lookup must not be remembered as "no correction" for a whole TTL
+                    self._remember((user_id, key), category) # Also remembers "no correction", the common case
+            if category:
+                self._count(found, category)
+                return category
+        found, category = self._cached(key)
+        if not found:
+            category = self._read(conn, "SELECT category FROM category_cache WHERE title_key = %s", (key,))[1]
+            if category:
+                self._remember(key, category)
+        self._count(found, category)
+        return category
+
+    def _count(self, from_memory: bool, category):
+        with self._lock:
+            if not category:
+                self.misses += 1
+            elif from_memory:
+                self.memory_hits += 1
+            else:
+                self.db_hits += 1
+
+    def put(self, conn, title: str, category: str, source: str = 'ai'):
+        """Stores a shared classification; the first answer stored for a title is kept until invalidate()."""
+        key = normalize_title(title)
+        if not key or category not in CATEGORIES:
+            return
+        self._remember(key, category)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(upsert_sql("category_cache", ("title_key", "category", "source", "updated_at"),
+                                      ("title_key",)),
+                           (key, category, source, datetime.now()))
+        except DB_ERRORS as err:
+            log_event("category_cache_write_failed", "Category cache write failed", error=str(err))
+        finally:
+            cursor.close()
+
+    def override(self, conn, user_id: int, title: str, category: str):
+        """Pins a user's correction for `title`; runs in the caller's transaction and raises on DB errors."""
+        key = normalize_title(title)
+        if not key or category not in CATEGORIES:
+            return
+        cursor = conn.cursor()
+        try:
+            cursor.execute(upsert_sql("category_overrides", ("user_id", "title_key", "category", "updated_at"),
+                                      ("user_id", "title_key"), {"category": "{new}", "updated_at": "{new}"}),
+                           (user_id, key, category, datetime.now()))
+        finally:
+            cursor.close()
+        self._remember((user_id, key), category)
+
+    def invalidate(self, conn, title: str = None) -> int:
+        """Drops the shared answer for `title` (every shared answer without one) so the model is asked again.
+
+        Users' own corrections are kept. Other processes stop serving the old
+        answer once their in-memory entry expires (CATEGORY_CACHE_TTL). Commits
+        and returns the number of rows deleted.
+        """
+        cursor = conn.cursor()
+        try:
+            if title is None:
+                cursor.execute("DELETE FROM category_cache")
+            else:
+                cursor.execute("DELETE FROM category_cache WHERE title_key = %s", (normalize_title(title),))
+            deleted = cursor.rowcount
+            conn.commit()
+        finally:
+            cursor.close()
+        with self._lock:
+            if title is None:
+                shared = [cache_key for cache_key in self._entries if not isinstance(cache_key, tuple)]
+            else:
+                shared = [normalize_title(title)]
+            for cache_key in shared:
+                self._entries.pop(cache_key, None)
+        return deleted
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process."""
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+            }
+
+
+# Shared per-process instance
+category_cache = CategoryCache()
+
+
+if __name__ == '__main__':
+    from database import connection
+
+    if len(sys.argv) < 3 or sys.argv[1] != 'invalidate':
+        exit("Usage: python categories.py invalidate <title> | --all")
+    target = None if sys.argv[2] == '--all' else ' '.join(sys.argv[2:])
+    try:
+        with connection() as conn:
+            removed = category_cache.invalidate(conn, target)
+    except DB_ERRORS as err:
+        exit(f"Database error: {err}")
+    print(f"Removed {removed} shared category answers for {target or 'all titles'}.")
@@ -0,0 +1,280 @@
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import ai
+import classifier
+from categories import CATEGORIES, DEFAULT_CATEGORY, PENDING_CATEGORY, category_cache, normalize_title
+from database import DB_ERRORS, row_lock
+from metrics import log_event
+import rollup
+
+CATEGORIZER_BATCH_SIZE = int(os.getenv('CATEGORIZER_BATCH_SIZE', '25')) # Titles per model call
+CATEGORIZER_CONCURRENCY = int(os.getenv('CATEGORIZER_CONCURRENCY', '2')) # Model calls in flight
+CATEGORIZER_INTERVAL = float(os.getenv('CATEGORIZER_INTERVAL', '5')) # Seconds between sweeps when idle
+CATEGORIZER_MAX_ATTEMPTS = int(os.getenv('CATEGORIZER_MAX_ATTEMPTS', '4'))
+CATEGORIZER_BACKOFF = float(os.getenv('CATEGORIZER_BACKOFF', '1.0')) # Base delay, doubled per retry
+CATEGORIZER_MAX_INTERVAL = float(os.getenv('CATEGORIZER_MAX_INTERVAL', '300')) # Longest wait between failing sweeps
+
+_JSON_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+
+
+def build_batch_prompt(titles: list) -> str:
+    """Prompt asking for one category per numbered title, as a JSON array."""
+    numbered = '\n'.join(f"{i}. {title}" for i, title in enumerate(titles, 1))
+    return f"""Classify each expense title below into exactly one spending category from this list:
+{', '.join(CATEGORIES)}.
+
+Expense titles:
+{numbered}
+
+Return ONLY a JSON array of {len(titles)} category names, in the same order as the titles, e.g. ["Food", "Travel"]."""
+
+
+def parse_batch_response(text: str, expected: int) -> list:
+    """Parses the model's JSON array; unknown entries become None. Raises ValueError on bad shape."""
+    match = _JSON_ARRAY_RE.search(text or '')
+    if not match:
+        raise ValueError(f"No JSON array in model response: {text!r}")
+    values = json.loads(match.group(0))
+    if not isinstance(values, list) or len(values) != expected:
+        raise ValueError(f"Expected {expected} categories, got {values!r}")
+    return [value.strip() if isinstance(value, str) and value.strip() in CATEGORIES else None for value in values]
+
+
+def classify_batch(model, titles: list) -> list:
+    """Categorizes many titles with one model call.
+
+    Classification has no side effects, so transient API errors are retried
+    (with jittered backoff) inside ai.generate(); an open breaker fails at once.
+    """
+    prompt = build_batch_prompt(titles)
+    try:
+        response = ai.generate(model, prompt, "categorize_batch", retries=CATEGORIZER_MAX_ATTEMPTS - 1,
+                               backoff=CATEGORIZER_BACKOFF)
+        return parse_batch_response(response.text, len(titles))
+    except Exception as e:
+        log_event("categorize_batch_failed", "Batch categorization failed", titles=len(titles), error=str(e))
+        raise
+
+
+def fetch_pending(conn, limit: int) -> list:
+    """Oldest expenses still waiting for a category."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT id, user_id, title FROM expenses
+            WHERE category = %s
+            ORDER BY id ASC
+            LIMIT %s
+        """, (PENDING_CATEGORY, limit))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def apply_categories(conn, assignments: dict) -> int:
+    """Writes {expense_id: category} with one bulk UPDATE and moves the rollup buckets.
+
+    Rows whose category changed in the meantime (e.g. corrected by the user) are
+    left alone. Commits on success and returns the number of rows updated.
+    """
+    if not assignments:
+        return 0
+    ids = list(assignments)
+    placeholders = ', '.join(['%s'] * len(ids))
+    lock = row_lock(conn)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f"""
+            SELECT id, user_id, amount, date_added FROM expenses
+            WHERE id IN ({placeholders}) AND category = %s
+            {lock}
+        """, (*ids, PENDING_CATEGORY))
+        rows = cursor.fetchall()
+        if not rows:
+            conn.rollback()
+            return 0
+
+        cases = ' '.join(['WHEN %s THEN %s'] * len(rows))
+        params = []
+        for row in rows:
+            params.extend((row['id'], assignments[row['id']]))
+        locked_ids = [row['id'] for row in rows]
+        cursor.execute(f"""
+            UPDATE expenses SET category = CASE id {cases} END
+            WHERE id IN ({', '.join(['%s'] * len(locked_ids))})
+        """, (*params, *locked_ids))
+
+        for row in rows:
+            rollup.move_expense(conn, row['user_id'], row['date_added'], PENDING_CATEGORY, assignments[row['id']],
+                                row['amount'])
+        conn.commit()
+        return len(rows)
+    except DB_ERRORS:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def categorize_titles(conn, titles: list, model, executor=None, user_id: int = None) -> tuple:
+    """Categorizes many titles with as few model calls as possible.
+
+    With `user_id`, that user's own corrections take precedence over shared answers.
+
+    Titles sharing a normalized form are asked about once; cached and confident
+    local answers skip the model entirely; the rest go out CATEGORIZER_BATCH_SIZE
+    per prompt (in parallel when an executor is given). Titles the model answered
+    for but could not place get the local best guess, as do all titles when no
+    Gemini key is configured. Titles whose call failed or was never made because
+    Gemini is unavailable stay PENDING_CATEGORY for a later sweep to retry.
+    Returns ({title: category}, model_calls, failed_calls).
+    """
+    by_key = {}
+    for title in titles:
+        by_key.setdefault(normalize_title(title) or title, []).append(title)
+
+    resolved = {}
+    unresolved = []
+    for key, same_titles in by_key.items():
+        title = same_titles[0]
+        category = category_cache.get(conn, title, user_id)
+        if not category:
+            local_category, confidence = classifier.classify(title)
+            if local_category and confidence >= classifier.LOCAL_CLASSIFIER_THRESHOLD:
+                category = local_category
+        if category:
+            resolved[key] = category
+        else:
+            unresolved.append(key)
+
+    calls = failed = 0
+    # Keys the model answered for; the local guess only stands in for those
+    answered = set() if ai.is_configured() else set(unresolved)
+    if unresolved and model:
+        chunks = [unresolved[i:i + CATEGORIZER_BATCH_SIZE] for i in range(0, len(unresolved), CATEGORIZER_BATCH_SIZE)]
+        prompts = [[by_key[key][0] for key in chunk] for chunk in chunks]
+        if executor:
+            futures = [executor.submit(classify_batch, model, chunk_titles) for chunk_titles in prompts]
+            outcomes = []
+            for future in futures:
+                try:
+                    outcomes.append(future.result())
+                except Exception:
+                    outcomes.append(None)
+        else:
+            outcomes = []
+            for chunk_titles in prompts:
+                try:
+                    outcomes.append(classify_batch(model, chunk_titles))
+                except Exception:
+                    outcomes.append(None)
+        for chunk, answers in zip(chunks, outcomes):
+            calls += 1
+            if answers is None:
+                failed += 1
+                continue
+            answered.update(chunk)
+            for key, category in zip(chunk, answers):
+                if category:
+                    title = by_key[key][0]
+                    category_cache.put(conn, title, category)
+                    classifier.learn(title, category)
+                    resolved[key] = category
+
+    result = {}
+    for key, same_titles in by_key.items():
+        category = resolved.get(key)
+        if not category:
+            if key in answered:
+                category = classifier.classify(same_titles[0])[0] or DEFAULT_CATEGORY
+            else:
+                category = PENDING_CATEGORY # A Gemini outage must not file it under a guess for good
+        for title in same_titles:
+            result[title] = category
+    return result, calls, failed
+
+
+class CategorizerWorker:
+    """Background thread that categorizes pending expenses in batched model calls."""
+
+    def __init__(self, app, model_getter):
+        self.app = app
+        self.model_getter = model_getter # Returns the Gemini model or None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=CATEGORIZER_CONCURRENCY, thread_name_prefix='categorizer')
+        self._interval = CATEGORIZER_INTERVAL # Doubles while sweeps leave rows Pending, up to CATEGORIZER_MAX_INTERVAL
+        self.batches = 0
+        self.categorized = 0
+        self.deferred = 0
+        self.failures = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='categorizer-worker', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def notify(self):
+        """Wakes the worker early, e.g. right after a pending expense was inserted."""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+            if self._stop.is_set(): # Woken by stop(), not for work
+                break
+            try:
+                while self.drain_once() and not self._stop.is_set():
+                    pass # Keep going while full sweeps come back
+            except Exception as e:
+                self.failures += 1
+                log_event("categorizer_sweep_failed", "Categorizer sweep failed", error=str(e))
+
+    def drain_once(self) -> bool:
+        """Categorizes up to BATCH_SIZE * CONCURRENCY pending expenses. True if more may remain.
+
+        Rows Gemini could not answer for stay Pending; the sweep then reports no
+        more work and the next one waits twice as long, so an outage is retried
+        with backoff instead of in a tight loop.
+        """
+        limit = CATEGORIZER_BATCH_SIZE * CATEGORIZER_CONCURRENCY
+        with self.app.app_context():
+            from database import get_db
+            conn = get_db()
+            pending = fetch_pending(conn, limit)
+            conn.commit() # End the read snapshot so later sweeps see new rows
+            if not pending:
+                return False
+
+            categories, calls, failed = categorize_titles(conn, [row['title'] for row in pending],
+                                                          self.model_getter(), self._executor)
+            self.batches += calls
+            self.failures += failed
+            assignments = {}
+            for row in pending:
+                # A correction the owner made while the row was pending beats the shared answer
+                category = category_cache.get(conn, row['title'], row['user_id']) or categories[row['title']]
+                if category != PENDING_CATEGORY:
+                    assignments[row['id']] = category
+            self.categorized += apply_categories(conn, assignments)
+            if len(assignments) < len(pending):
+                self.deferred += len(pending) - len(assignments)
+                self._interval = min(self._interval * 2, CATEGORIZER_MAX_INTERVAL)
+                return False
+            self._interval = CATEGORIZER_INTERVAL
+            return len(pending) == limit
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "categorized": self.categorized, "deferred": self.deferred,
+                "failures": self.failures, "interval_seconds": self._interval}
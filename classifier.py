@@ -0,0 +1,246 @@
+import atexit
+import gzip
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+from collections import Counter
+
+from categories import CATEGORIES, normalize_title
+from database import DB_ERRORS
+from metrics import log_event
+
+CLASSIFIER_PATH = os.getenv('CLASSIFIER_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'category_nb.json.gz'))
+# Minimum posterior probability for the local answer to be used without asking Gemini
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv('LOCAL_CLASSIFIER_THRESHOLD', '0.85'))
+# Below this many training examples the model is too thin to trust on its own
+LOCAL_CLASSIFIER_MIN_EXAMPLES = int(os.getenv('LOCAL_CLASSIFIER_MIN_EXAMPLES', '20'))
+CLASSIFIER_SAVE_EVERY = int(os.getenv('CLASSIFIER_SAVE_EVERY', '25')) # Incremental updates between saves
+
+
+def tokenize(title: str) -> list:
+    """Tokens used as classifier features (the same normalization as the category cache)."""
+    return normalize_title(title).split()
+
+
+class NaiveBayesClassifier:
+    """Multinomial naive Bayes over title tokens with Laplace smoothing.
+
+    Counts are updated in place by learn(), so the model retrains
+    incrementally; prediction is a few dict lookups per token and category.
+    """
+
+    def __init__(self):
+        self.doc_counts = Counter() # category -> training titles
+        self.token_counts = {category: Counter() for category in CATEGORIES}
+        self.token_totals = Counter() # category -> total tokens seen
+        self.vocabulary = set()
+        self.dirty = 0 # Updates since the last save
+        self._lock = threading.Lock()
+
+    @property
+    def examples(self) -> int:
+        return sum(self.doc_counts.values())
+
+    def learn(self, title: str, category: str, weight: int = 1):
+        """Adds one labelled title to the model (a negative weight removes it)."""
+        if category not in self.token_counts:
+            return
+        tokens = tokenize(title)
+        if not tokens:
+            return
+        with self._lock:
+            self.doc_counts[category] += weight
+            counts = self.token_counts[category]
+            for token in tokens:
+                counts[token] += weight
+                if counts[token] <= 0:
+                    del counts[token]
+                self.vocabulary.add(token)
+            self.token_totals[category] += weight * len(tokens)
+            if self.doc_counts[category] <= 0:
+                del self.doc_counts[category]
+            self.dirty += 1
+
+    def predict(self, title: str) -> tuple:
+        """Returns (category, confidence); confidence is 0.0 when no token is known."""
+        tokens = tokenize(title)
+        with self._lock:
+            total_docs = self.examples
+            known = [token for token in tokens if token in self.vocabulary]
+            if not total_docs or not known:
+                return None, 0.0
+            vocab_size = len(self.vocabulary)
+            scores = {}
+            for category, docs in self.doc_counts.items():
+                counts = self.token_counts[category]
+                denominator = self.token_totals[category] + vocab_size
+                score = math.log(docs / total_docs)
+                for token in known:
+                    score += math.log((counts.get(token, 0) + 1) / denominator)
+                scores[category] = score
+        best = max(scores, key=scores.get)
+        # Softmax over the log scores gives the posterior of the winning category
+        peak = scores[best]
+        norm = sum(math.exp(score - peak) for score in scores.values())
+        return best, 1.0 / norm
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "version": 1,
+                "docs": dict(self.doc_counts),
+                "tokens": {category: dict(counts) for category, counts in self.token_counts.items() if counts},
+            }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        model = cls()
+        model.doc_counts.update(data.get("docs", {}))
+        for category, counts in data.get("tokens", {}).items():
+            if category in model.token_counts:
+                model.token_counts[category].update(counts)
+                model.token_totals[category] = sum(counts.values())
+                model.vocabulary.update(counts)
+        return model
+
+    def save(self, path: str = CLASSIFIER_PATH):
+        """Writes the model as gzipped JSON, atomically replacing any previous file."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = json.dumps(self.to_dict(), separators=(',', ':')).encode('utf-8')
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(gzip.compress(payload))
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.dirty = 0
+
+    @classmethod
+    def load(cls, path: str = CLASSIFIER_PATH):
+        with gzip.open(path, 'rb') as fh:
+            return cls.from_dict(json.loads(fh.read().decode('utf-8')))
+
+
+def train_from_db(conn) -> NaiveBayesClassifier:
+    """Builds a model from every categorized expense in the database."""
+    model = NaiveBayesClassifier()
+    cursor = conn.cursor()
+    try:
+        placeholders = ', '.join(['%s'] * len(CATEGORIES))
+        cursor.execute(f"SELECT title, category FROM expenses WHERE category IN ({placeholders})", tuple(CATEGORIES))
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            for title, category in rows:
+                model.learn(title, category)
+    finally:
+        cursor.close()
+    return model
+
+
+# --- Shared Instance ---
+# Requests only ever load the saved model. Training from the expenses table
+# happens off the request path: in a background thread started by create_app()
+# when no saved model exists, or with `python classifier.py train`.
+_model = None
+_model_lock = threading.Lock()
+_train_thread = None
+
+
+def get_classifier() -> NaiveBayesClassifier:
+    """Returns the process-wide model, loading it from disk once; empty until one has been trained."""
+    global _model
+    if _model is not None:
+        return _model
+    with _model_lock:
+        if _model is None:
+            try:
+                _model = NaiveBayesClassifier.load()
+            except (OSError, ValueError) as e:
+                log_event("classifier_empty", "Local classifier not loaded; starting empty", level='warning', error=str(e))
+                _model = NaiveBayesClassifier()
+    return _model
+
+
+def _train_shared():
+    global _model
+    from database import connection
+    try:
+        with connection() as conn:
+            model = train_from_db(conn)
+    except DB_ERRORS as err:
+        log_event("classifier_train_failed", "Could not train local classifier", error=str(err))
+        return
+    with _model_lock:
+        _model = model
+    try:
+        model.save()
+    except OSError as e:
+        log_event("classifier_save_failed", "Could not save local classifier", error=str(e))
+    log_event("classifier_trained", "Trained local classifier", level='info', examples=model.examples)
+
+
+def start_background_training():
+    """Trains the shared model from the database in a background thread, unless a saved model exists."""
+    global _train_thread
+    if os.path.exists(CLASSIFIER_PATH) or (_train_thread and _train_thread.is_alive()):
+        return
+    _train_thread = threading.Thread(target=_train_shared, name='classifier-train', daemon=True)
+    _train_thread.start()
+
+
+def classify(title: str) -> tuple:
+    """(category, confidence) from the local model; category is None when it has no opinion."""
+    model = get_classifier()
+    if model.examples < LOCAL_CLASSIFIER_MIN_EXAMPLES:
+        return None, 0.0
+    return model.predict(title)
+
+
+def learn(title: str, category: str):
+    """Incrementally trains the shared model on a Gemini answer, saving it every CLASSIFIER_SAVE_EVERY updates.
+
+    Never called with the model's own predictions: feeding those back in
+    would entrench its early mistakes.
+    """
+    model = get_classifier()
+    model.learn(title, category)
+    if model.dirty >= CLASSIFIER_SAVE_EVERY:
+        save_quietly()
+
+
+def save_quietly():
+    """Persists the shared model if it has unsaved updates, logging instead of raising."""
+    if _model is None or not _model.dirty:
+        return
+    try:
+        _model.save()
+    except OSError as e:
+        log_event("classifier_save_failed", "Could not save local classifier", error=str(e))
+
+
+atexit.register(save_quietly)
+
+
+if __name__ == '__main__':
+    from database import connection
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ('train', 'predict'):
+        exit("Usage: python classifier.py train | predict <title>")
+    if sys.argv[1] == 'train':
+        try:
+            with connection() as conn:
+                trained = train_from_db(conn)
+        except DB_ERRORS as err:
+            exit(f"Database error: {err}")
+        trained.save()
+        print(f"Saved model trained on {trained.examples} expenses to {CLASSIFIER_PATH}.")
+    else:
+        print(NaiveBayesClassifier.load().predict(' '.join(sys.argv[2:])))
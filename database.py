@@ -0,0 +1,209 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import pooling
+
+from metrics import InstrumentedConnection, log_event
+
+# --- Configuration ---
+# 'mysql' (default) or 'sqlite': an embedded WAL-mode database file at SQLITE_PATH,
+# for single-node deployments, tests and benchmarks with no external service.
+DB_BACKEND = os.getenv('DB_BACKEND', 'mysql').lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'expense_tracker.db'))
+DB_HOST = os.getenv('DB_HOST', 'localhost')
+DB_USER = os.getenv('DB_USER', 'root')
+DB_PASSWORD = os.getenv('DB_PASSWORD', '#Enter Pass') # Keep default if not set
+DB_NAME = os.getenv('DB_DATABASE', 'payment_tracker') # Keep default if not set
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8')) # mysql.connector caps this at 32
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10')) # Seconds to wait for a free connection
+
+
+class PoolTimeoutError(mysql.connector.Error):
+    """Raised when no pooled connection becomes free within DB_POOL_TIMEOUT."""
+
+
+# Catch these instead of mysql.connector.Error so handlers work on either backend
+DB_ERRORS = (mysql.connector.Error, sqlite3.Error)
+
+
+# --- Pool State ---
+# The pool is created lazily and per process: a forked worker must never reuse
+# sockets inherited from its parent, so the pid is recorded alongside the pool.
+_pool = None
+_pool_pid = None
+_slots = None # Semaphore bounding checkouts so callers wait instead of failing
+_pool_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """Drops the inherited pool in a forked child; it is rebuilt on first use."""
+    global _pool, _pool_pid, _slots, _pool_lock
+    _pool = None
+    _pool_pid = None
+    _slots = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def is_sqlite() -> bool:
+    return DB_BACKEND == 'sqlite'
+
+
+def _create_pool(pid: int):
+    if is_sqlite():
+        from sqlite_backend import SQLitePool
+        return SQLitePool(SQLITE_PATH)
+    return pooling.MySQLConnectionPool(
+        pool_name=f"expense_tracker_{pid}",
+        pool_size=DB_POOL_SIZE,
+        pool_reset_session=True,
+        host=DB_HOST,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME
+    )
+
+
+def get_pool():
+    """Returns this process's connection pool, creating it on first use."""
+    global _pool, _pool_pid, _slots
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid: # Fork without register_at_fork support
+            _pool = _create_pool(pid)
+            _slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+            _pool_pid = pid
+            log_event("db_pool_ready", "Database pool ready", level='info', backend=DB_BACKEND,
+                      size=DB_POOL_SIZE, pid=pid)
+    return _pool
+
+
+def checkout(timeout: float = None):
+    """Takes a healthy connection from the pool, waiting up to `timeout` seconds."""
+    pool = get_pool()
+    slots = _slots
+    if not slots.acquire(timeout=DB_POOL_TIMEOUT if timeout is None else timeout):
+        raise PoolTimeoutError(msg=f"No database connection free after {DB_POOL_TIMEOUT}s (pool size {DB_POOL_SIZE}).")
+    try:
+        conn = pool.get_connection()
+        # Health check: idle pooled connections can be dropped by the server
+        conn.ping(reconnect=True, attempts=2, delay=0)
+    except Exception:
+        slots.release()
+        raise
+    conn._expense_tracker_slots = slots # Release the slot this connection was counted against
+    return InstrumentedConnection(conn) # Times every statement into the SQL histogram
+
+
+def release(conn):
+    """Returns a connection to the pool, discarding any unfinished transaction."""
+    slots = getattr(conn, '_expense_tracker_slots', None)
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except DB_ERRORS as err:
+        log_event("db_rollback_failed", "Rollback before returning connection failed", error=str(err))
+    finally:
+        try:
+            conn.close() # For pooled connections this hands it back to the pool
+        except DB_ERRORS as err:
+            # A deliberately dropped connection fails its session reset but is
+            # still re-queued; the ping on next checkout reconnects it
+            log_event("db_reset_failed", "Resetting connection before returning it to the pool failed", error=str(err))
+        finally:
+            if slots is not None:
+                slots.release()
+
+
+@contextmanager
+def connection(timeout: float = None):
+    """Checks out a connection for code running outside a request (workers, CLI)."""
+    conn = checkout(timeout)
+    try:
+        yield conn
+    finally:
+        release(conn)
+
+
+# --- SQL Dialect ---
+# The few statements that differ between MySQL and SQLite are built here, so the
+# rest of the code stays backend-agnostic.
+
+def month_key(column: str) -> str:
+    """SQL expression for a DATETIME column's 'YYYY-MM' month (for GROUP BY backfills)."""
+    if is_sqlite():
+        return f"strftime('%Y-%m', {column})"
+    return f"DATE_FORMAT({column}, '%Y-%m')"
+
+
+def upsert_sql(table: str, columns: tuple, keys: tuple, updates: dict = None) -> str:
+    """INSERT of one row of `columns` that applies `updates` when a `keys` row already exists.
+
+    `updates` maps column -> SQL expression, where {new} stands for the value being
+    inserted into that column (e.g. {"total": "total + {new}"}). Without updates an
+    existing row is left untouched.
+    """
+    placeholders = ', '.join(['%s'] * len(columns))
+    insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    if is_sqlite():
+        if not updates:
+            return f"{insert} ON CONFLICT ({', '.join(keys)}) DO NOTHING"
+        assignments = ', '.join(f"{column} = {expression.format(new=f'excluded.{column}')}"
+                                for column, expression in updates.items())
+        return f"{insert} ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {assignments}"
+    if not updates:
+        return f"{insert} ON DUPLICATE KEY UPDATE {keys[0]} = {keys[0]}"
+    assignments = ', '.join(f"{column} = {expression.format(new=f'VALUES({column})')}"
+                            for column, expression in updates.items())
+    return f"{insert} ON DUPLICATE KEY UPDATE {assignments}"
+
+
+def row_lock(conn) -> str:
+    """Suffix for a SELECT whose rows must stay locked until commit.
+
+    SQLite has no row locks, so there the write transaction (and the database
+    write lock) is taken up front with BEGIN IMMEDIATE and the suffix is empty.
+    """
+    if not is_sqlite():
+        return "FOR UPDATE"
+    if not conn.in_transaction:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.close()
+    return ""
+
+
+# --- Flask Integration ---
+
+def get_db():
+    """Returns the connection checked out for the current request/app context."""
+    from flask import g
+    if 'db_conn' not in g:
+        g.db_conn = checkout()
+    return g.db_conn
+
+
+def get_db_cursor(dictionary: bool = True):
+    """Gets a new database cursor on the current request's pooled connection."""
+    return get_db().cursor(dictionary=dictionary)
+
+
+def close_db(e=None):
+    """Returns the request's connection to the pool when the app context ends."""
+    from flask import g
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        release(conn)
+
+
+def init_app(app):
+    """Registers the per-request connection teardown on the Flask app."""
+    app.teardown_appcontext(close_db)
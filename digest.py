@@ -0,0 +1,129 @@
+import calendar
+import os
+from datetime import datetime
+
+from categories import PENDING_CATEGORY, normalize_title
+from schema import month_bounds
+import repository
+import rollup
+
+DIGEST_MONTHS = int(os.getenv('DIGEST_MONTHS', '3')) # Months summarized for insights, current month included
+DIGEST_TOP_MERCHANTS = int(os.getenv('DIGEST_TOP_MERCHANTS', '5'))
+
+# Insights prompts get a fixed-size statistical summary instead of raw rows:
+# per-month category totals come from the rollup, merchants are grouped in SQL
+# and folded by normalized title, so the prompt covers whole months at a cost
+# that does not grow with the number of expenses.
+
+
+def _shift_month(month_year: str, delta: int) -> str:
+    year, month = map(int, month_year.split('-'))
+    index = year * 12 + (month - 1) + delta
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _top_merchants(conn, user_id: int, start_month: str, end_month: str, limit: int) -> list:
+    """[(merchant, count, total)] by spend, with titles like 'Swiggy order 123' folded together."""
+    start, _ = month_bounds(start_month)
+    _, end = month_bounds(end_month)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT title, COUNT(*), SUM(amount)
+            FROM expenses
+            WHERE user_id = %s AND date_added >= %s AND date_added < %s
+            GROUP BY title
+        """, (user_id, start, end))
+        merchants = {}
+        for title, count, total in cursor:
+            key = normalize_title(title) or title.strip().lower()
+            seen = merchants.setdefault(key, [0, 0.0])
+            seen[0] += int(count)
+            seen[1] += float(total)
+    finally:
+        cursor.close()
+    ranked = sorted(merchants.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+    return [(name, count, round(total, 2)) for name, (count, total) in ranked]
+
+
+def build_digest(conn, user_id: int, end_month: str = None, months: int = DIGEST_MONTHS,
+                 top_merchants: int = DIGEST_TOP_MERCHANTS) -> dict:
+    """Summarizes a user's `months` months ending at `end_month` (default: this month)."""
+    today = datetime.now()
+    end_month = end_month or today.strftime("%Y-%m")
+    month_list = [_shift_month(end_month, offset) for offset in range(1 - months, 1)]
+
+    summaries = []
+    for month_year in month_list:
+        buckets = rollup.month_summary(conn, user_id, month_year)
+        categories = {category: round(bucket['total'], 2) for category, bucket in buckets.items()
+                      if category != PENDING_CATEGORY}
+        days = calendar.monthrange(*map(int, month_year.split('-')))[1]
+        summaries.append({
+            "month": month_year,
+            "total": round(sum(bucket['total'] for bucket in buckets.values()), 2),
+            "count": sum(bucket['count'] for bucket in buckets.values()),
+            "uncategorized": round(buckets.get(PENDING_CATEGORY, {}).get('total', 0.0), 2),
+            "categories": categories,
+            "budget": repository.month_budget(conn, user_id, month_year),
+            "days": days,
+            "days_elapsed": min(today.day, days) if month_year == today.strftime("%Y-%m") else days,
+        })
+
+    deltas = {}
+    if len(summaries) > 1:
+        current, previous = summaries[-1]['categories'], summaries[-2]['categories']
+        # A month in progress is compared at its current pace, not its partial total
+        pace = summaries[-1]['days'] / summaries[-1]['days_elapsed']
+        for category in sorted(set(current) | set(previous)):
+            before, after = previous.get(category, 0.0), current.get(category, 0.0) * pace
+            deltas[category] = {
+                "change": round(after - before, 2),
+                "percent": round((after - before) / before * 100) if before else None,
+            }
+    return {
+        "months": summaries,
+        "deltas": deltas,
+        "top_merchants": _top_merchants(conn, user_id, month_list[0], end_month, top_merchants) if top_merchants else [],
+    }
+
+
+def _money(amount: float) -> str:
+    return f"₹{amount:,.0f}"
+
+
+def render_digest(digest: dict) -> str:
+    """Compact plain-text form of build_digest() for a prompt: a few short lines per month."""
+    lines = []
+    for month in digest['months']:
+        partial = (f" (day {month['days_elapsed']} of {month['days']})"
+                   if month['days_elapsed'] < month['days'] else "")
+        line = f"{month['month']}{partial}: total {_money(month['total'])} over {month['count']} expenses"
+        if month['budget']:
+            line += (f", budget {_money(month['budget'])} "
+                     f"({month['total'] / month['budget'] * 100:.0f}% used)")
+        lines.append(line)
+        ranked = sorted(month['categories'].items(), key=lambda item: item[1], reverse=True)
+        if ranked:
+            lines.append("  " + ", ".join(f"{category} {_money(total)}" for category, total in ranked))
+        if month['uncategorized']:
+            lines.append(f"  not yet categorized {_money(month['uncategorized'])}")
+
+    if digest['deltas']:
+        latest = digest['months'][-1]
+        label = ("Projected change vs previous month at current pace"
+                 if latest['days_elapsed'] < latest['days'] else "Change vs previous month")
+        changes = []
+        for category, delta in sorted(digest['deltas'].items(), key=lambda item: abs(item[1]['change']),
+                                      reverse=True):
+            if not delta['change']:
+                continue
+            percent = f" ({delta['percent']:+d}%)" if delta['percent'] is not None else " (new)"
+            changes.append(f"{category} {'+' if delta['change'] > 0 else '-'}{_money(abs(delta['change']))}{percent}")
+        if changes:
+            lines.append(f"{label}: " + ", ".join(changes))
+
+    if digest['top_merchants']:
+        lines.append("Top merchants: " + ", ".join(f"{name} {_money(total)} ({count}x)"
+                                                    for name, count, total in digest['top_merchants']))
+    return "\n".join(lines)
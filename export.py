@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+import os
+
+from database import DB_ERRORS, connection
+from filters import filter_clause
+
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '2000')) # Rows fetched and flushed per chunk
+EXPORT_COLUMNS = ("id", "date_added", "title", "category", "amount")
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def iter_expense_rows(user_id: int, filters: dict, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """Yields lists of a user's expense tuples in (date_added, id) order, EXPORT_CHUNK_ROWS at a time.
+
+    Uses a dedicated pooled connection and an unbuffered (server-side streamed)
+    cursor, so memory stays flat no matter how many rows match.
+    """
+    where, params = filter_clause(user_id, filters)
+    with connection() as conn:
+        cursor = conn.cursor(buffered=False)
+        finished = False
+        try:
+            cursor.execute(f"""
+                SELECT id, date_added, title, category, amount
+                FROM expenses
+                {where}
+                ORDER BY date_added ASC, id ASC
+            """, params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield rows
+            finished = True
+        finally:
+            if finished:
+                cursor.close()
+            else:
+                # Client went away mid-stream: draining millions of unread rows would
+                # be slower than dropping the socket; the pool reconnects on next checkout
+                try:
+                    conn.disconnect()
+                except DB_ERRORS:
+                    pass
+
+
+def stream_csv(user_id: int, filters: dict):
+    """Generator of CSV text chunks, header first so the first byte goes out immediately."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    for rows in iter_expense_rows(user_id, filters):
+        buffer.seek(0)
+        buffer.truncate()
+        for expense_id, date_added, title, category, amount in rows:
+            writer.writerow((expense_id, date_added.isoformat(sep=' '), title, category, f"{amount:.2f}"))
+        yield buffer.getvalue()
+
+
+def stream_ndjson(user_id: int, filters: dict):
+    """Generator of newline-delimited JSON chunks, one object per expense."""
+    for rows in iter_expense_rows(user_id, filters):
+        yield ''.join(
+            json.dumps({
+                "id": expense_id,
+                "date_added": date_added.isoformat(sep=' '),
+                "title": title,
+                "category": category,
+                "amount": float(amount),
+            }, ensure_ascii=False) + '\n'
+            for expense_id, date_added, title, category, amount in rows
+        )
+
+
+def stream_export(export_format: str, user_id: int, filters: dict):
+    """Returns the chunk generator for 'csv' or 'ndjson' over a user's expenses."""
+    if export_format == 'csv':
+        return stream_csv(user_id, filters)
+    return stream_ndjson(user_id, filters)
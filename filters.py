@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from categories import CATEGORIES, PENDING_CATEGORY
+
+
+def parse_expense_filters(args) -> dict:
+    """Reads ?from=YYYY-MM-DD, ?to=YYYY-MM-DD (inclusive) and ?category= from request args.
+
+    Raises ValueError on malformed dates or unknown categories.
+    """
+    filters = {"start": None, "end": None, "category": None}
+    if args.get('from'):
+        filters['start'] = datetime.strptime(args['from'], "%Y-%m-%d")
+    if args.get('to'):
+        # Inclusive end date becomes an exclusive bound at the next midnight
+        filters['end'] = datetime.strptime(args['to'], "%Y-%m-%d") + timedelta(days=1)
+    if filters['start'] and filters['end'] and filters['end'] <= filters['start']:
+        raise ValueError("'to' must not be before 'from'.")
+    category = args.get('category')
+    if category:
+        if category not in CATEGORIES and category != PENDING_CATEGORY:
+            raise ValueError(f"Unknown category '{category}'.")
+        filters['category'] = category
+    return filters
+
+
+def filter_clause(user_id: int, filters: dict) -> tuple:
+    """Builds (sql, params) for a WHERE clause over one user's expenses.
+
+    Conditions are plain equality/half-open ranges after user_id so MySQL can
+    use the (user_id, category, date_added) or (user_id, date_added, id) index.
+    """
+    conditions = ["user_id = %s"]
+    params = [user_id]
+    if filters.get('category'):
+        conditions.append("category = %s")
+        params.append(filters['category'])
+    if filters.get('start'):
+        conditions.append("date_added >= %s")
+        params.append(filters['start'])
+    if filters.get('end'):
+        conditions.append("date_added < %s")
+        params.append(filters['end'])
+    return "WHERE " + " AND ".join(conditions), params
@@ -0,0 +1,70 @@
+import base64
+import json
+import os
+from datetime import datetime
+
+from filters import filter_clause
+
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '25'))
+HISTORY_MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(date_added: datetime, expense_id: int) -> str:
+    """Opaque continuation token for the row a page ended on."""
+    raw = json.dumps([date_added.isoformat(), expense_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str) -> tuple:
+    """Inverse of encode_cursor(); raises ValueError for tampered or garbled tokens."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        date_text, expense_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(date_text), int(expense_id)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError("Invalid page cursor.") from e
+
+
+def fetch_page(conn, user_id: int, filters: dict, cursor_token: str = None, limit: int = HISTORY_PAGE_SIZE) -> tuple:
+    """Returns (rows, next_cursor) for one page of a user's expenses, newest first.
+
+    Keyset pagination: instead of OFFSET, each page seeks past the (date_added, id)
+    of the previous page's last row, so page N costs the same index range scan
+    as page 1. next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    where, params = filter_clause(user_id, filters)
+    if cursor_token:
+        after_date, after_id = decode_cursor(cursor_token)
+        # Expanded form of (date_added, id) < (%s, %s), which MySQL turns into an index range
+        where = f"{where} AND (date_added < %s OR (date_added = %s AND id < %s))"
+        params = params + [after_date, after_date, after_id]
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f"""
+            SELECT id, title, amount, category, date_added
+            FROM expenses
+            {where}
+            ORDER BY date_added DESC, id DESC
+            LIMIT %s
+        """, (*params, limit + 1)) # One extra row tells us whether another page exists
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['date_added'], rows[-1]['id'])
+    return rows, next_cursor
+
+
+def serialize_row(row: dict) -> dict:
+    return {
+        "id": row['id'],
+        "title": row['title'],
+        "amount": float(row['amount']),
+        "category": row['category'],
+        "date_added": row['date_added'].isoformat(sep=' '),
+    }
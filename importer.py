@@ -0,0 +1,210 @@
+import csv
+import hashlib
+import os
+import re
+import time
+from collections import Counter
+from datetime import datetime
+
+from categories import PENDING_CATEGORY, normalize_title
+from categorizer import categorize_titles
+from database import DB_ERRORS
+import rollup
+
+IMPORT_CHUNK_ROWS = int(os.getenv('IMPORT_CHUNK_ROWS', '500')) # Rows per categorization batch and transaction
+
+# Header aliases seen in common bank and card statement exports (compared lowercased)
+DATE_COLUMNS = ("date", "transaction date", "txn date", "posting date", "value date", "tran date")
+TITLE_COLUMNS = ("description", "narration", "details", "title", "merchant", "particulars", "transaction details")
+AMOUNT_COLUMNS = ("amount", "debit", "debit amount", "withdrawal", "withdrawal amt.", "withdrawal amount")
+# Money coming in (refunds, card payments, salary) is not an expense: rows with a credit
+# amount or a credit type marker are skipped, as are negative amounts
+CREDIT_COLUMNS = ("credit", "credit amount", "deposit", "deposit amt.", "deposit amount")
+TYPE_COLUMNS = ("type", "dr/cr", "cr/dr", "debit/credit", "transaction type")
+CREDIT_TYPES = ("cr", "credit", "c")
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y", "%d-%m-%y", "%m/%d/%Y",
+                "%d %b %Y", "%d-%b-%Y", "%d %b %y", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M")
+
+_AMOUNT_CLEAN_RE = re.compile(r'[^\d.\-]')
+
+
+class ImportStats:
+    """Counters for one import run, with the throughput report printed at the end."""
+
+    def __init__(self):
+        self.rows_read = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.skipped = 0
+        self.credits = 0 # Included in skipped
+        self.model_calls = 0
+        self.pending = 0 # Inserted as Pending for the background categorizer
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def report(self) -> str:
+        rows_per_sec = self.rows_read / self.elapsed if self.elapsed else 0.0
+        calls_per_1k = self.model_calls * 1000 / self.rows_read if self.rows_read else 0.0
+        return (f"Imported {self.inserted} of {self.rows_read} rows "
+                f"({self.duplicates} duplicates, {self.skipped} skipped of which {self.credits} credits, "
+                f"{self.pending} waiting for a category) "
+                f"in {self.elapsed:.2f}s: "
+                f"{rows_per_sec:,.0f} rows/sec, {calls_per_1k:.1f} model calls per 1k rows.")
+
+
+def _find_column(fieldnames: list, aliases: tuple):
+    lowered = {name.strip().lower(): name for name in fieldnames if name}
+    for alias in aliases:
+        if alias in lowered:
+            return lowered[alias]
+    return None
+
+
+def _parse_date(value: str) -> datetime:
+    value = (value or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date '{value}'")
+
+
+def _parse_amount(value: str):
+    """Signed amount as a float, or None for blanks. 'Cr' suffixes and (parentheses) make it negative."""
+    value = (value or '').strip()
+    if not value:
+        return None
+    amount = float(_AMOUNT_CLEAN_RE.sub('', value) or 0)
+    if value.lower().endswith('cr') or (value.startswith('(') and value.endswith(')')):
+        amount = -abs(amount)
+    return round(amount, 2)
+
+
+def import_hash(date_added: datetime, amount: float, title: str, occurrence: int = 0) -> str:
+    """Dedup key: the same day, amount and normalized title is the same transaction.
+
+    `occurrence` numbers identical rows within one statement (two equal purchases
+    on the same day), so each is kept while re-importing the statement, or an
+    overlapping one, still finds every row already present.
+    """
+    key = f"{date_added.date().isoformat()}|{amount:.2f}|{normalize_title(title)}"
+    if occurrence:
+        key += f"|{occurrence}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def read_statement(stream, stats: ImportStats, chunk_rows: int = IMPORT_CHUNK_ROWS):
+    """Yields lists of (title, amount, date_added, hash) tuples parsed from a CSV text stream."""
+    reader = csv.DictReader(stream)
+    fieldnames = reader.fieldnames or []
+    date_col = _find_column(fieldnames, DATE_COLUMNS)
+    title_col = _find_column(fieldnames, TITLE_COLUMNS)
+    amount_col = _find_column(fieldnames, AMOUNT_COLUMNS)
+    credit_col = _find_column(fieldnames, CREDIT_COLUMNS)
+    type_col = _find_column(fieldnames, TYPE_COLUMNS)
+    if not (date_col and title_col and amount_col):
+        raise ValueError(f"Could not find date/description/amount columns in header {fieldnames}")
+
+    chunk = []
+    occurrences = Counter() # Base hash -> identical rows seen so far in this file
+    for row in reader:
+        stats.rows_read += 1
+        try:
+            title = (row.get(title_col) or '').strip()[:255]
+            amount = _parse_amount(row.get(amount_col))
+            is_credit = ((amount is not None and amount < 0)
+                         or (credit_col is not None and not amount and _parse_amount(row.get(credit_col)))
+                         or (type_col is not None and (row.get(type_col) or '').strip().lower() in CREDIT_TYPES))
+            if is_credit:
+                stats.skipped += 1
+                stats.credits += 1
+                continue
+            if not title or not amount:
+                stats.skipped += 1
+                continue
+            date_added = _parse_date(row.get(date_col))
+        except ValueError:
+            stats.skipped += 1
+            continue
+        base_hash = import_hash(date_added, amount, title)
+        occurrence = occurrences[base_hash]
+        occurrences[base_hash] += 1
+        chunk.append((title, amount, date_added,
+                      import_hash(date_added, amount, title, occurrence) if occurrence else base_hash))
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _existing_hashes(conn, user_id: int, hashes: list) -> set:
+    cursor = conn.cursor()
+    try:
+        placeholders = ', '.join(['%s'] * len(hashes))
+        cursor.execute(f"SELECT import_hash FROM expenses WHERE user_id = %s AND import_hash IN ({placeholders})",
+                       (user_id, *hashes))
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def import_chunk(conn, user_id: int, chunk: list, model, stats: ImportStats):
+    """Dedupes against the database, categorizes and inserts one chunk of a user's statement in a single transaction."""
+    existing = _existing_hashes(conn, user_id, [row[3] for row in chunk])
+    fresh = []
+    for row in chunk:
+        if row[3] in existing:
+            stats.duplicates += 1
+            continue
+        fresh.append(row)
+    if not fresh:
+        return
+
+    categories, calls, _ = categorize_titles(conn, [row[0] for row in fresh], model, user_id=user_id)
+    stats.model_calls += calls
+
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(
+            "INSERT INTO expenses (user_id, title, amount, category, date_added, import_hash) VALUES (%s, %s, %s, %s, %s, %s)",
+            [(user_id, title, amount, categories[title], date_added, row_hash)
+             for title, amount, date_added, row_hash in fresh]
+        )
+        # One rollup write per (month, category) instead of one per row
+        buckets = {}
+        for title, amount, date_added, _ in fresh:
+            key = (date_added.strftime("%Y-%m"), categories[title])
+            count, total, first_date = buckets.get(key, (0, 0.0, date_added))
+            buckets[key] = (count + 1, total + amount, first_date)
+        for (_, category), (count, total, first_date) in buckets.items():
+            rollup.record_expense(conn, user_id, first_date, category, round(total, 2), count=count)
+        conn.commit()
+        stats.inserted += len(fresh)
+        stats.pending += sum(1 for title, _, _, _ in fresh if categories[title] == PENDING_CATEGORY)
+    except DB_ERRORS:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def import_statement(conn, user_id: int, stream, model=None, chunk_rows: int = IMPORT_CHUNK_ROWS) -> ImportStats:
+    """Streams a CSV statement into a user's expenses chunk by chunk. Returns the run's ImportStats.
+
+    Titles the category cache and local model can't place are sent to `model`
+    in batches. Without one they are stored Pending (when a Gemini key is
+    configured) for the background categorizer, so a web upload never waits
+    on Gemini.
+    """
+    stats = ImportStats()
+    try:
+        for chunk in read_statement(stream, stats, chunk_rows):
+            import_chunk(conn, user_id, chunk, model, stats)
+    finally:
+        stats.finish()
+    return stats
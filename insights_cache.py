@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from ai import AI_MAX_CONCURRENCY
+from metrics import log_event
+
+INSIGHTS_TTL = float(os.getenv('INSIGHTS_TTL', '900')) # Seconds before unchanged insights are refreshed anyway
+INSIGHTS_RETRY_AFTER = float(os.getenv('INSIGHTS_RETRY_AFTER', '60')) # Back-off after a failed refresh
+INSIGHTS_CACHE_USERS = int(os.getenv('INSIGHTS_CACHE_USERS', '256')) # Users whose insights are kept in memory
+# Refreshes running at once; more would only queue on the Gemini call slots
+INSIGHTS_REFRESH_WORKERS = int(os.getenv('INSIGHTS_REFRESH_WORKERS', str(AI_MAX_CONCURRENCY)))
+INSIGHTS_PLACEHOLDER = ["Insights are being prepared. Refresh in a moment."]
+INSIGHTS_UNAVAILABLE = ["Could not generate insights at this time."]
+
+
+def data_fingerprint(conn, user_id: int) -> tuple:
+    """Cheap summary of everything a user's insights depend on; changes whenever their spending does.
+
+    Per-category rollup sums rather than overall totals, so a category
+    correction (which moves money between buckets) changes it too. Read from
+    the user's rollup and budget key prefixes, so it costs the same however
+    many expenses or users there are.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT category, SUM(expense_count), SUM(total_amount)
+            FROM expense_rollup
+            WHERE user_id = %s
+            GROUP BY category
+            ORDER BY category
+        """, (user_id,))
+        categories = tuple((category, int(count), float(total)) for category, count, total in cursor.fetchall())
+        cursor.execute("SELECT COUNT(*), SUM(amount) FROM budget WHERE user_id = %s", (user_id,))
+        return categories + tuple(cursor.fetchone())
+    finally:
+        cursor.close()
+
+
+class _Entry:
+    """One user's cached insights and refresh state."""
+
+    def __init__(self):
+        self.value = None
+        self.fingerprint = None
+        self.generated_at = None
+        self.refreshing = False
+        self.failed_at = None
+        self.last_error = None
+
+
+class InsightsCache:
+    """Stale-while-revalidate cache for AI insights, one entry per user keyed on data_fingerprint().
+
+    A fresh entry is returned as-is. A stale one (fingerprint changed or TTL
+    passed) is returned immediately while it is regenerated in the background, on
+    at most INSIGHTS_REFRESH_WORKERS threads shared by all users. A failed
+    refresh keeps serving the last good result. The least recently seen users
+    are dropped beyond INSIGHTS_CACHE_USERS.
+    """
+
+    def __init__(self, app, generate, ttl: float = INSIGHTS_TTL, max_users: int = INSIGHTS_CACHE_USERS,
+                 workers: int = INSIGHTS_REFRESH_WORKERS):
+        self.app = app
+        self.generate = generate # Callable(user_id) run inside an app context; raises on failure
+        self.ttl = ttl
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='insights-refresh')
+        self.hits = 0
+        self.stale_served = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.last_error = None
+
+    def _entry(self, user_id: int) -> _Entry:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._entries[user_id] = _Entry()
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        self._entries.move_to_end(user_id)
+        return entry
+
+    def get(self, conn, user_id: int) -> list:
+        """Returns a user's insights for their current data without ever calling the model inline."""
+        fingerprint = data_fingerprint(conn, user_id)
+        with self._lock:
+            entry = self._entry(user_id)
+            fresh = (entry.value is not None and entry.fingerprint == fingerprint
+                     and time.monotonic() - entry.generated_at < self.ttl)
+            if fresh:
+                self.hits += 1
+                return entry.value
+            if entry.value is not None:
+                self.stale_served += 1
+                value = entry.value
+            else:
+                self.misses += 1
+                value = INSIGHTS_UNAVAILABLE if entry.last_error else INSIGHTS_PLACEHOLDER
+            backing_off = entry.failed_at is not None and time.monotonic() - entry.failed_at < INSIGHTS_RETRY_AFTER
+            start_refresh = not entry.refreshing and not backing_off
+            if start_refresh:
+                entry.refreshing = True
+        if start_refresh:
+            self._executor.submit(self._refresh, entry, user_id, fingerprint)
+        return value
+
+    def _refresh(self, entry: _Entry, user_id: int, fingerprint: tuple):
+        try:
+            with self.app.app_context():
+                value = self.generate(user_id)
+            with self._lock:
+                entry.value = value
+                entry.fingerprint = fingerprint
+                entry.generated_at = time.monotonic()
+                entry.last_error = entry.failed_at = None
+                self.refreshes += 1
+        except Exception as e:
+            log_event("insights_refresh_failed", "Insights refresh failed, keeping last good result",
+                      user_id=user_id, error=str(e))
+            with self._lock:
+                entry.last_error = self.last_error = str(e)
+                entry.failed_at = time.monotonic()
+                self.refresh_failures += 1
+        finally:
+            with self._lock:
+                entry.refreshing = False
+
+    def stats(self) -> dict:
+        """Hit counters, cached users and the age of the oldest cached insights in seconds."""
+        with self._lock:
+            ages = [time.monotonic() - entry.generated_at for entry in self._entries.values() if entry.generated_at]
+            return {
+                "users": len(self._entries),
+                "hits": self.hits,
+                "stale_served": self.stale_served,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "refresh_failures": self.refresh_failures,
+                "age_seconds": max(ages) if ages else None,
+                "last_error": self.last_error,
+            }
@@ -0,0 +1,312 @@
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Configuration ---
+# With PROFILING_ENABLED=1, clients may send `X-Profile: 1` to get a per-request
+# span breakdown (SQL, templates, AI calls) back in a Server-Timing header. Off by
+# default, since the spans reveal query and table timings to any caller.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '0') == '1'
+PROFILE_HEADER = 'X-Profile'
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter with optional labels, rendered in Prometheus text format."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, one series per label combination."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {} # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = []
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                bucket_labels = _format_labels(self.label_names, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            inf_labels = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """Point-in-time value read from a callback when /metrics is scraped.
+
+    The callback returns a number, or {label_value_tuple: number} for labelled series.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, callback, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.label_names = tuple(labels)
+
+    def render(self) -> list:
+        try:
+            value = self.callback()
+        except Exception as e:
+            log_event("metrics_gauge_failed", f"Gauge {self.name} failed", error=str(e))
+            return []
+        if isinstance(value, dict):
+            return [f"{self.name}{_format_labels(self.label_names, key)} {float(v)}"
+                    for key, v in sorted(value.items()) if v is not None]
+        return [] if value is None else [f"{self.name} {float(value)}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Re-registering (e.g. a second create_app() in tests/benchmarks) replaces the old one
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# --- Hot-path Metrics ---
+REQUEST_SECONDS = registry.register(Histogram(
+    'expense_tracker_request_seconds', 'HTTP request latency.', ('endpoint', 'method', 'status')))
+SQL_SECONDS = registry.register(Histogram(
+    'expense_tracker_sql_seconds', 'SQL statement latency by statement kind and table.', ('statement',)))
+AI_SECONDS = registry.register(Histogram(
+    'expense_tracker_ai_call_seconds', 'Gemini call latency.', ('purpose', 'outcome'),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0)))
+AI_TOKENS = registry.register(Counter(
+    'expense_tracker_ai_tokens_total', 'Gemini tokens used.', ('purpose', 'kind')))
+AI_PROMPT_CHARS = registry.register(Histogram(
+    'expense_tracker_ai_prompt_chars', 'Gemini prompt size in characters.', ('purpose',),
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)))
+AI_REJECTED = registry.register(Counter(
+    'expense_tracker_ai_rejected_total', 'Gemini calls refused without being sent.', ('purpose', 'reason')))
+AI_BREAKER_TRANSITIONS = registry.register(Counter(
+    'expense_tracker_ai_breaker_transitions_total', 'Gemini circuit breaker state changes.', ('state',)))
+PDF_SECONDS = registry.register(Histogram(
+    'expense_tracker_pdf_render_seconds', 'PDF report render time.', ('months',),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)))
+TEMPLATE_SECONDS = registry.register(Histogram(
+    'expense_tracker_template_seconds', 'Template render time.', ('template',)))
+EVENTS = registry.register(Counter(
+    'expense_tracker_events_total', 'Structured log events (errors, warnings) by name.', ('event', 'level')))
+
+
+# --- Structured Events ---
+_logger = logging.getLogger('expense_tracker')
+if not _logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    _logger.addHandler(_handler)
+    _logger.setLevel(logging.INFO)
+    _logger.propagate = False
+
+
+def log_event(event: str, message: str, level: str = 'error', **fields):
+    """Emits one JSON log line and counts it in expense_tracker_events_total."""
+    EVENTS.inc(event=event, level=level)
+    record = {"ts": round(time.time(), 3), "level": level, "event": event, "message": message}
+    record.update(fields)
+    _logger.log(getattr(logging, level.upper(), logging.INFO), json.dumps(record, default=str))
+
+
+# --- Spans ---
+
+def _current_spans():
+    """The profiling span list for the current request, or None when not profiling."""
+    # Runs once per SQL statement: only look at Flask if something already imported it,
+    # so CLI commands never load it just to find there is no request
+    flask = sys.modules.get('flask')
+    if flask is None or not flask.has_app_context():
+        return None
+    return flask.g.get('profile_spans')
+
+
+def record(name: str, seconds: float):
+    """Adds a finished span to the current request's profile, if one is being collected."""
+    spans = _current_spans()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+@contextmanager
+def timed(name: str, histogram: Histogram = None, **labels):
+    """Times a block into `histogram` (if given) and the request's profile (if enabled)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        if histogram is not None:
+            histogram.observe(elapsed, **labels)
+        record(name, elapsed)
+
+
+# --- SQL Instrumentation ---
+_STATEMENT_RE = re.compile(r'^\s*(?:EXPLAIN\s+)?(\w+)(?:.*?\b(?:FROM|INTO|UPDATE|TABLE)\s+`?(\w+))?',
+                           re.IGNORECASE | re.DOTALL)
+
+
+def statement_label(sql: str) -> str:
+    """Low-cardinality label for a statement, e.g. 'SELECT expenses'."""
+    match = _STATEMENT_RE.match(sql or '')
+    if not match:
+        return 'OTHER'
+    verb = match.group(1).upper()
+    if verb == 'UPDATE':
+        table = re.match(r'\s*UPDATE\s+`?(\w+)', sql, re.IGNORECASE)
+        return f"UPDATE {table.group(1)}" if table else verb
+    return f"{verb} {match.group(2)}" if match.group(2) else verb
+
+
+class InstrumentedCursor:
+    """Cursor proxy timing every execute()/executemany() into SQL_SECONDS."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        label = statement_label(operation)
+        with timed(f"sql:{label}", SQL_SECONDS, statement=label):
+            return self._cursor.execute(operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        label = statement_label(operation)
+        with timed(f"sql:{label}", SQL_SECONDS, statement=label):
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors are InstrumentedCursors; everything else passes through."""
+
+    def __init__(self, conn):
+        self.__dict__['_conn'] = conn
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+
+# --- Flask Integration ---
+
+def _server_timing(spans: list) -> str:
+    """Aggregates spans by name into a Server-Timing header value."""
+    totals = {}
+    for name, seconds in spans:
+        count, total = totals.get(name, (0, 0.0))
+        totals[name] = (count + 1, total + seconds)
+    parts = []
+    for i, (name, (count, total)) in enumerate(sorted(totals.items(), key=lambda item: -item[1][1])):
+        token = re.sub(r'[^A-Za-z0-9_-]', '_', name)[:40] + f"_{i}"
+        parts.append(f'{token};dur={total * 1000:.2f};desc="{_escape(name)} x{count}"')
+    return ', '.join(parts)
+
+
+def init_app(app):
+    """Registers per-request timing and opt-in profiling on the Flask app."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = time.perf_counter()
+        if PROFILING_ENABLED and request.headers.get(PROFILE_HEADER) == '1':
+            g.profile_spans = []
+
+    @app.after_request
+    def _finish_request_timer(response):
+        started = g.get('request_started')
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            REQUEST_SECONDS.observe(elapsed, endpoint=request.endpoint or 'unknown',
+                                    method=request.method, status=str(response.status_code))
+            spans = g.get('profile_spans')
+            if spans is not None:
+                spans.append(('total', elapsed))
+                response.headers['Server-Timing'] = _server_timing(spans)
+        return response
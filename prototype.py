@@ -1,44 +1,88 @@
-import google.generativeai as genai
-from fpdf import FPDF
+import argparse
+import os
+import shlex
+import sys
 from datetime import datetime
-import mysql.connector
-from datetime import datetime
-from tabulate import tabulate
-
-genai.configure(api_key="Enter Key here")
-global model 
-model = genai.GenerativeModel('gemini-2.0-flash')
-def get_category_from_title(title: str) -> str:
-    prompt = f"Based on the title below, return only the most appropriate spending category from the following options: Food, Travel, Shopping, Utilities, Health, Entertainment, Education, Miscellaneous.\n\nTitle: '{title}'\n\nOnly return the category name."    
-    response = model.generate_content(prompt)
-    return response.text.strip()
 
-class PDF(FPDF):
-    def header(self):
-        self.set_font("Helvetica", "B", 14)
-        self.cell(0, 10, "Monthly Spending Report", ln=True, align="C")
+import database
+import repository
+import rollup
+
+# Command-line front end. Every command runs on one pooled connection; in batch
+# mode (`prototype.py batch FILE|-`) commands are committed in groups of
+# CLI_BATCH_GROUP, and a failing command rolls back only its own group. `import`
+# commits its statement in chunks of its own, so it is refused in batch files.
+# fpdf (via reports), google.generativeai (via ai) and the categorizer are
+# imported inside the commands that use them, so `status` or `budget` start
+# without loading them.
+
+CLI_BATCH_GROUP = int(os.getenv('CLI_BATCH_GROUP', '100')) # Commands per transaction in batch mode
+CLI_USER = os.getenv('EXPENSE_USER', 'default') # Whose expenses commands act on, unless --user is given
+
+_user_ids = {} # username -> id; cleared by rollback(), which may discard a newly created user
+
+
+def _month(value: str) -> str:
+    datetime.strptime(value, "%Y-%m")
+    return value
+
+
+def _day(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def _amount(value: str) -> float:
+    """An expense amount: positive, as the web form requires."""
+    amount = float(value)
+    if amount <= 0:
+        raise argparse.ArgumentTypeError("amount must be positive")
+    return amount
+
+
+def _budget(value: str) -> float:
+    """A budget amount: zero or more, as the web form requires."""
+    amount = float(value)
+    if amount < 0:
+        raise argparse.ArgumentTypeError("budget cannot be negative")
+    return amount
+
 
-def generate_pdf(expenses, total, month_year):
-    pdf = PDF()
-    pdf.add_page()
-    pdf.set_font("Helvetica", size=12)
+def user_id(conn, args) -> int:
+    """The id of the command's --user, created on first use."""
+    if args.user not in _user_ids:
+        _user_ids[args.user] = repository.get_or_create_user(conn, args.user)
+    return _user_ids[args.user]
 
-    for e in expenses:
-        line = f"{e[1]} - ₹{e[2]} ({e[3]})"
-        pdf.cell(0, 10, line.encode('latin-1', 'replace').decode('latin-1'), ln=True)
 
-    pdf.ln()
-    total_line = f"Total Spending: ₹{total}"
-    pdf.cell(0, 10, total_line.encode('latin-1', 'replace').decode('latin-1'), ln=True)
-    pdf.output(f"Spending_Report_{month_year}.pdf")
+def rollback(conn):
+    """Rolls back, forgetting user ids that may have been created in the discarded transaction."""
+    conn.rollback()
+    _user_ids.clear()
 
 
-def generate_insights(expense_list):
-    
+def categorize(conn, args, titles: list) -> dict:
+    """{title: category} via the category cache, the local model, then Gemini in batches.
+
+    Titles Gemini could not be asked about come back Pending; the web app's
+    background categorizer picks them up later.
+    """
+    import ai
+    from categorizer import categorize_titles
+    categories, _, _ = categorize_titles(conn, titles, ai.get_model(), user_id=user_id(conn, args))
+    return categories
+
+
+def generate_insights(summary):
+    import ai
+    model = ai.get_model()
+    if not model:
+        return "AI insights are unavailable (set GEMINI_API_KEY)."
+
     prompt = f"""
 You are analyzing monthly personal expenses for a domestic user. The data is not from a business or organization.
 
-Here is the list of spending entries: {expense_list}
+Here is a summary of their spending (amounts in INR):
+{summary}
 
 Please provide the following in a polite and practical manner:
 1. Areas where the user could consider reducing spending.
@@ -47,69 +91,185 @@ Please provide the following in a polite and practical manner:
 
 Keep the tone warm, simple, and easy to understand — suitable for personal or household budgeting.
 """
-    response = model.generate_content(prompt)
+    try:
+        response = ai.generate(model, prompt, "insights") # Records prompt size and latency
+    except ai.AIUnavailableError as e:
+        return f"AI insights are unavailable right now ({e}); try again later."
+    except Exception as e: # Gemini API errors (auth, quota, blocked prompt) are raised by the SDK
+        return f"Could not generate AI insights: {e}"
     return response.text.strip()
 
-# DB Connect
-db = mysql.connector.connect(
-    host="localhost",
-    user="root",
-    password="1234",
-    database="payment_tracker"
-)
-cursor = db.cursor()
-
-def set_budget():
-    month_year = datetime.now().strftime("%Y-%m")
-    amount = float(input("Enter monthly budget: ₹"))
-    cursor.execute("REPLACE INTO budget (month_year, amount) VALUES (%s, %s)", (month_year, amount))
-    db.commit()
-    print("✅ Budget set successfully.\n")
-
-def add_expense():
-    title = input("Enter payment title: ")
-    amount = float(input("Enter payment amount: ₹"))
-    category = get_category_from_title(title)
-    print(f"🧠 AI-detected category: {category}")
-
-    cursor.execute("INSERT INTO expenses (title, amount, category) VALUES (%s, %s, %s)", (title, amount, category))
-    db.commit()
-    print("✅ Expense added.\n")
-
-def check_budget():
-    month_year = datetime.now().strftime("%Y-%m")
-    cursor.execute("SELECT SUM(amount) FROM expenses WHERE DATE_FORMAT(date_added, '%Y-%m') = %s", (month_year,))
-    total = cursor.fetchone()[0] or 0
-
-    cursor.execute("SELECT amount FROM budget WHERE month_year = %s", (month_year,))
-    result = cursor.fetchone()
-    budget = result[0] if result else 0
-
-    print(f"📊 Total Spending: ₹{total} / Budget: ₹{budget}")
+
+# --- Commands ---
+# Each takes the shared connection and the parsed arguments and leaves
+# committing to the caller, except `import`, which commits chunk by chunk.
+
+def cmd_add(conn, args):
+    category = args.category or categorize(conn, args, [args.title])[args.title]
+    repository.add_expense(conn, user_id(conn, args), args.title, args.amount, category, args.date)
+    print(f"✅ Expense added: {args.title} ₹{args.amount} ({category})")
+
+
+def cmd_import(conn, args):
+    import ai
+    from importer import import_statement
+    with open(args.path, newline='', encoding='utf-8-sig') as statement:
+        stats = import_statement(conn, user_id(conn, args), statement, ai.get_model())
+    print(f"📥 {stats.report()}")
+
+
+def cmd_budget(conn, args):
+    repository.set_budget(conn, user_id(conn, args), args.month, args.amount)
+    print(f"✅ Budget for {args.month} set to ₹{args.amount}.")
+
+
+def cmd_status(conn, args):
+    total = rollup.month_total(conn, user_id(conn, args), args.month)
+    budget = repository.month_budget(conn, user_id(conn, args), args.month) or 0
+
+    print(f"📊 {args.month} Total Spending: ₹{total:.2f} / Budget: ₹{budget:.2f}")
     if total > budget:
-        print("❗ Warning: You have exceeded your monthly budget!\n")
+        print("❗ Warning: You have exceeded your monthly budget!")
     else:
-        print(" You are within your budget.\n")
-
-def download_report():
-    month_year = datetime.now().strftime("%Y-%m")
-    cursor.execute("SELECT * FROM expenses WHERE DATE_FORMAT(date_added, '%Y-%m') = %s", (month_year,))
-    data = cursor.fetchall()
-    cursor.execute("SELECT SUM(amount) FROM expenses WHERE DATE_FORMAT(date_added, '%Y-%m') = %s", (month_year,))
-    total = cursor.fetchone()[0] or 0
-
-    generate_pdf(data, total, month_year)
-    print(f"📄 Report saved as Spending_Report_{month_year}.pdf\n")
-
-def ai_insights():
-    cursor.execute("SELECT title, amount, category FROM expenses ORDER BY date_added DESC LIMIT 15")
-    data = cursor.fetchall()
-    insights = generate_insights(data)
+        print(" You are within your budget.")
+
+
+def cmd_report(conn, args):
+    import reports
+    end_month = args.end or args.month
+    if end_month < args.month:
+        raise ValueError("Report end month is before its start month.")
+    data = reports.render_pdf_report(conn, user_id(conn, args), args.month, end_month)
+    path = args.output or reports.report_filename(args.month, end_month)
+    with open(path, 'wb') as fh:
+        fh.write(data)
+    print(f"📄 Report saved as {path}")
+
+
+def cmd_insights(conn, args):
+    import digest
+    summary = digest.render_digest(digest.build_digest(conn, user_id(conn, args), args.month,
+                                                       args.months or digest.DIGEST_MONTHS))
     print("📌 AI Insights:\n")
-    print(insights)
-    print()
+    print(generate_insights(summary))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    this_month = datetime.now().strftime("%Y-%m")
+    parser = argparse.ArgumentParser(prog="prototype.py", description="Expense tracker command line.")
+    parser.add_argument("--user", default=CLI_USER, help="Username to act as (default: $EXPENSE_USER or 'default')")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+
+    add = commands.add_parser("add", help="Add an expense")
+    add.add_argument("title")
+    add.add_argument("amount", type=_amount)
+    add.add_argument("--category", help="Skip automatic categorization")
+    add.add_argument("--date", type=_day, help="YYYY-MM-DD (default: now)")
+    add.set_defaults(handler=cmd_add)
+
+    statement = commands.add_parser("import", help="Import a bank/card statement CSV")
+    statement.add_argument("path")
+    statement.set_defaults(handler=cmd_import)
+
+    budget = commands.add_parser("budget", help="Set a monthly budget")
+    budget.add_argument("amount", type=_budget)
+    budget.add_argument("--month", type=_month, default=this_month, help="YYYY-MM (default: this month)")
+    budget.set_defaults(handler=cmd_budget)
+
+    status = commands.add_parser("status", help="Show spending against the budget")
+    status.add_argument("--month", type=_month, default=this_month)
+    status.set_defaults(handler=cmd_status)
+
+    report = commands.add_parser("report", help="Write a monthly (or --end: multi-month) PDF report")
+    report.add_argument("--month", type=_month, default=this_month, help="First month covered")
+    report.add_argument("--end", type=_month, default=None, help="Last month covered (default: --month)")
+    report.add_argument("--output", help="PDF path (default: Spending_Report_YYYY-MM.pdf)")
+    report.set_defaults(handler=cmd_report)
+
+    insights = commands.add_parser("insights", help="AI insights on recent months")
+    insights.add_argument("--month", type=_month, default=None, help="Last month covered (default: this month)")
+    insights.add_argument("--months", type=int, default=None, help="Months covered (default: DIGEST_MONTHS)")
+    insights.set_defaults(handler=cmd_insights)
+
+    batch = commands.add_parser("batch", help="Run commands from a file, one per line ('-' for stdin)")
+    batch.add_argument("source", nargs="?", default="-")
+    batch.add_argument("--group", type=int, default=CLI_BATCH_GROUP, help="Commands per transaction")
+    return parser
+
+
+# --- Batch Mode ---
 
-def main_menu():
+class BatchLineError(Exception):
+    pass
+
+
+def _parse_line(parser, line_number: int, line: str):
+    try:
+        args = parser.parse_args(shlex.split(line))
+    except (SystemExit, ValueError) as e: # argparse exits on bad input; shlex raises on bad quoting
+        raise BatchLineError(f"line {line_number}: cannot parse '{line}'") from e
+    if args.command in (None, "batch"):
+        raise BatchLineError(f"line {line_number}: '{line}' is not a batch command")
+    if args.command == "import": # Commits as it goes, so its group could not be rolled back
+        raise BatchLineError(f"line {line_number}: run 'import' on its own, not in a batch")
+    return args
+
+
+def _run_group(conn, group: list):
+    # Adds without an explicit category are categorized together, per user (their corrections
+    # apply only to them): one model call per batch of titles
+    uncategorized = {}
+    for _, args in group:
+        if args.command == "add" and not args.category:
+            uncategorized.setdefault(args.user, (args, []))[1].append(args.title)
+    categories = {user: categorize(conn, args, titles) for user, (args, titles) in uncategorized.items()}
+    for line_number, args in group:
+        if args.command == "add" and not args.category:
+            args.category = categories[args.user][args.title]
+        try:
+            args.handler(conn, args)
+        except Exception as e:
+            raise BatchLineError(f"line {line_number}: {e}") from e
+    conn.commit()
+
+
+def run_batch(conn, parser, stream, group_size: int) -> int:
+    """Runs commands read from `stream`, committing every `group_size`. Returns commands committed.
+
+    Stops at the first bad line; its group is rolled back and earlier groups stay committed.
+    """
+    done = 0
+    group = []
+    try:
+        for line_number, raw in enumerate(stream, 1):
+            line = raw.strip()
+            if not line or line.startswith('#'):
+                continue
+            group.append((line_number, _parse_line(parser, line_number, line)))
+            if len(group) >= group_size:
+                _run_group(conn, group)
+                done += len(group)
+                group = []
+        if group:
+            _run_group(conn, group)
+            done += len(group)
+    except (BatchLineError, *database.DB_ERRORS):
+        rollback(conn)
+        print(f"Stopped after {done} committed commands; the failing group was rolled back.", file=sys.stderr)
+        raise
+    return done
+
+
+# --- Interactive Menu ---
+
+def main_menu(conn, parser):
+    actions = {
+        '1': lambda: ["budget", input("Enter monthly budget: ₹")],
+        '2': lambda: ["add", input("Enter payment title: "), input("Enter payment amount: ₹")],
+        '3': lambda: ["status"],
+        '4': lambda: ["report"],
+        '5': lambda: ["insights"],
+    }
     while True:
         print("=== 💰 Payment Tracker ===")
         print("1. Set Monthly Budget")
@@ -120,21 +280,57 @@ def main_menu():
         print("6. Exit")
         choice = input("Select an option (1–6): ")
 
-        if choice == '1':
-            set_budget()
-        elif choice == '2':
-            add_expense()
-        elif choice == '3':
-            check_budget()
-        elif choice == '4':
-            download_report()
-        elif choice == '5':
-            ai_insights()
-        elif choice == '6':
+        if choice == '6':
             print("Exiting...")
             break
-        else:
+        if choice not in actions:
             print("Invalid choice. Try again.\n")
+            continue
+        try:
+            args = parser.parse_args(actions[choice]())
+            args.handler(conn, args)
+            conn.commit()
+        except SystemExit:
+            pass # argparse already printed what was wrong with the input
+        except database.DB_ERRORS as err:
+            rollback(conn)
+            print(f"Database error: {err}")
+        except (OSError, ValueError) as e: # e.g. a malformed month, or the report file could not be written
+            rollback(conn)
+            print(f"Error: {e}")
+        print()
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    parser.set_defaults(user=args.user) # Batch lines and menu choices act as the same user unless they say otherwise
+    try:
+        # DB Connect (MySQL or the embedded SQLite file, per DB_BACKEND)
+        with database.connection() as conn:
+            if database.is_sqlite():
+                import schema
+                schema.migrate(conn)
+            if args.command is None:
+                main_menu(conn, parser)
+            elif args.command == "batch":
+                if args.source == "-":
+                    done = run_batch(conn, parser, sys.stdin, args.group)
+                else:
+                    with open(args.source, encoding='utf-8') as commands:
+                        done = run_batch(conn, parser, commands, args.group)
+                print(f"Ran {done} commands.")
+            else:
+                args.handler(conn, args)
+                conn.commit()
+    except (BatchLineError, OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except database.DB_ERRORS as err:
+        print(f"Database error: {err}", file=sys.stderr)
+        return 1
+    return 0
+
 
 if __name__ == "__main__":
-    main_menu()
\ No newline at end of file
+    sys.exit(main())
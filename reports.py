@@ -0,0 +1,602 @@
+import hashlib
+import importlib.util
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from io import BytesIO
+from itertools import repeat
+
+from categories import PENDING_CATEGORY
+from database import get_db
+from metrics import PDF_SECONDS, log_event, timed
+from schema import month_bounds
+import rollup
+
+REPORT_CACHE_SIZE = int(os.getenv('REPORT_CACHE_SIZE', '32')) # Rendered PDFs kept in memory
+REPORT_MAX_MONTHS = int(os.getenv('REPORT_MAX_MONTHS', '120')) # Longest range one report may cover
+# Optional archive directory; when set, every freshly rendered report is also written there
+REPORT_ARCHIVE_DIR = os.getenv('REPORT_ARCHIVE_DIR')
+# Ranges with at least REPORT_PARALLEL_ROWS expenses are split across REPORT_WORKERS processes (below 2 disables)
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', str(min(4, os.cpu_count() or 1))))
+REPORT_PARALLEL_ROWS = int(os.getenv('REPORT_PARALLEL_ROWS', '2000'))
+REPORT_JOB_THREADS = int(os.getenv('REPORT_JOB_THREADS', '2')) # Background report jobs rendered at once
+REPORT_JOB_TTL = float(os.getenv('REPORT_JOB_TTL', '3600')) # Seconds a finished job stays downloadable
+REPORT_JOBS_MAX = int(os.getenv('REPORT_JOBS_MAX', '256')) # Finished jobs remembered per process
+
+
+# --- PDF Generation Class ---
+# fpdf is only imported when the first report is rendered, keeping it off the
+# startup path of every worker.
+_pdf_class = None
+_pdf_lock = threading.Lock()
+
+# Reports embed a Unicode TrueType font so ₹ and non-Latin titles render as
+# written: DejaVu Sans, bundled under fonts/ (see fonts/LICENSE), unless
+# REPORT_FONT_PATH (and REPORT_FONT_BOLD_PATH) name another one.
+# REPORT_FALLBACK_FONTS (os.pathsep-separated) adds fonts for scripts it lacks,
+# e.g. Noto Sans Devanagari or CJK. A missing font file is an error, checked
+# when the app starts, rather than a report with its text replaced by '?'.
+FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+REPORT_FONT_PATH = os.getenv('REPORT_FONT_PATH') or os.path.join(FONTS_DIR, 'DejaVuSans.ttf')
+REPORT_FONT_BOLD_PATH = os.getenv('REPORT_FONT_BOLD_PATH')
+REPORT_FALLBACK_FONTS = [path for path in os.getenv('REPORT_FALLBACK_FONTS', '').split(os.pathsep) if path]
+REPORT_FONT_FAMILY = "ReportSans"
+
+
+def report_fonts() -> tuple:
+    """(regular, bold, fallbacks) TTF paths for the report font. Raises FileNotFoundError if one is missing."""
+    bold = REPORT_FONT_BOLD_PATH or REPORT_FONT_PATH.replace('.ttf', '-Bold.ttf')
+    if not REPORT_FONT_BOLD_PATH and not os.path.isfile(bold):
+        bold = REPORT_FONT_PATH # Headings lose their weight rather than the text its glyphs
+    missing = [path for path in (REPORT_FONT_PATH, bold, *REPORT_FALLBACK_FONTS) if not os.path.isfile(path)]
+    if missing:
+        raise FileNotFoundError(f"Report font not found: {', '.join(missing)} (set REPORT_FONT_PATH to a TTF)")
+    return REPORT_FONT_PATH, bold, tuple(REPORT_FALLBACK_FONTS)
+
+
+def get_pdf_class():
+    """Returns the report's FPDF subclass, importing fpdf on first use (thread-safe)."""
+    global _pdf_class
+    if _pdf_class is None:
+        with _pdf_lock:
+            if _pdf_class is None:
+                from fpdf import FPDF
+
+                class PDF(FPDF):
+                    report_title = "Monthly Spending Report"
+                    font_name = REPORT_FONT_FAMILY
+                    currency = "₹"
+                    section_label = None # Set by begin_section(); pages are numbered within a section
+                    section_first_page = 1
+
+                    def use_fonts(self, fonts):
+                        """Embeds the report_fonts() TTFs."""
+                        regular, bold, fallbacks = fonts
+                        self.add_font(REPORT_FONT_FAMILY, "", regular)
+                        self.add_font(REPORT_FONT_FAMILY, "B", bold)
+                        fallback_names = []
+                        for index, path in enumerate(fallbacks):
+                            self.add_font(f"{REPORT_FONT_FAMILY}Fallback{index}", "", path)
+                            fallback_names.append(f"{REPORT_FONT_FAMILY}Fallback{index}")
+                        if fallback_names:
+                            self.set_fallback_fonts(fallback_names)
+
+                    def begin_section(self, label: str = None):
+                        self.add_page() # Closes the previous page with the previous section's footer
+                        self.section_label = label
+                        self.section_first_page = self.page_no()
+                        if label:
+                            self.start_section(label) # PDF outline entry
+
+                    def header(self):
+                        self.set_font(self.font_name, "B", 14)
+                        self.cell(0, 10, self.report_title, ln=True, align="C")
+                        self.ln(5) # Add a little space after header
+
+                    def footer(self):
+                        self.set_y(-15)
+                        self.set_font(self.font_name, "", 8)
+                        page = f"Page {self.page_no() - self.section_first_page + 1}"
+                        label = f"{self.section_label} - {page}" if self.section_label else page
+                        self.cell(0, 10, label, 0, 0, "C")
+
+                _pdf_class = PDF
+    return _pdf_class
+
+
+def new_pdf(title: str, fonts):
+    """An A4 report document titled `title`, using the report_fonts() result `fonts`."""
+    pdf = get_pdf_class()(orientation="P", unit="mm", format="A4")
+    pdf.report_title = title
+    pdf.use_fonts(fonts)
+    return pdf
+
+
+def _pdf_bytes(pdf) -> bytes:
+    """Renders to memory; works with both PyFPDF (str) and fpdf2 (bytearray) output."""
+    data = pdf.output(dest='S')
+    return data.encode('latin-1') if isinstance(data, str) else bytes(data)
+
+
+# --- Report Periods ---
+
+def iter_months(start_month: str, end_month: str) -> list:
+    """All 'YYYY-MM' months from start_month to end_month inclusive."""
+    year, month = map(int, start_month.split('-'))
+    months = []
+    while f"{year:04d}-{month:02d}" <= end_month:
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def parse_period(month: str = None, year: str = None, start: str = None, end: str = None) -> tuple:
+    """Resolves request arguments to an inclusive (start_month, end_month) pair.
+
+    Accepts ?month=YYYY-MM, ?year=YYYY or ?start=YYYY-MM&end=YYYY-MM and defaults
+    to the current month. Raises ValueError on malformed or oversized ranges.
+    """
+    if month:
+        start_month = end_month = datetime.strptime(month, "%Y-%m").strftime("%Y-%m")
+    elif year:
+        parsed_year = datetime.strptime(year, "%Y").year
+        start_month, end_month = f"{parsed_year:04d}-01", f"{parsed_year:04d}-12"
+    elif start or end:
+        start_month = datetime.strptime(start or end, "%Y-%m").strftime("%Y-%m")
+        end_month = datetime.strptime(end or start, "%Y-%m").strftime("%Y-%m")
+    else:
+        start_month = end_month = datetime.now().strftime("%Y-%m")
+    if end_month < start_month:
+        raise ValueError("Report end month is before its start month.")
+    if len(iter_months(start_month, end_month)) > REPORT_MAX_MONTHS:
+        raise ValueError(f"Reports can cover at most {REPORT_MAX_MONTHS} months.")
+    return start_month, end_month
+
+
+def report_filename(start_month: str, end_month: str) -> str:
+    if start_month == end_month:
+        return f"Spending_Report_{start_month}.pdf"
+    return f"Spending_Report_{start_month}_to_{end_month}.pdf"
+
+
+# --- Cache ---
+
+def report_fingerprint(conn, user_id: int, start_month: str, end_month: str) -> tuple:
+    """(user, period, row count, max expense id, pending count, data revision): changes whenever the report would.
+
+    The revision is the user's correction counter (repository.change_category),
+    which is stored in the database, so every worker sees a correction.
+    """
+    range_start, range_end = month_bounds(start_month)[0], month_bounds(end_month)[1]
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT COUNT(*), MAX(id), SUM(CASE WHEN category = %s THEN 1 ELSE 0 END),
+                   (SELECT data_revision FROM users WHERE id = %s)
+            FROM expenses
+            WHERE user_id = %s AND date_added >= %s AND date_added < %s
+        """, (PENDING_CATEGORY, user_id, user_id, range_start, range_end))
+        count, max_id, pending, revision = cursor.fetchone()
+    finally:
+        cursor.close()
+    return (user_id, start_month, end_month, int(count), max_id, int(pending or 0), int(revision or 0))
+
+
+def fingerprint_etag(fingerprint: tuple) -> str:
+    return hashlib.sha1(repr(fingerprint).encode('utf-8')).hexdigest()
+
+
+class ReportCache:
+    """Bounded LRU of rendered report bytes keyed by report_fingerprint().
+
+    get_or_render() is single-flight: concurrent misses for the same key wait
+    for the one render already in progress instead of starting their own.
+    """
+
+    def __init__(self, maxsize: int = REPORT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._inflight = {} # fingerprint -> Future of the render in progress
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, fingerprint: tuple):
+        with self._lock:
+            data = self._entries.get(fingerprint)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return data
+
+    def get_or_render(self, fingerprint: tuple, render) -> tuple:
+        """(data, rendered): cached bytes, or the result of `render()` run once per key at a time."""
+        with self._lock:
+            data = self._entries.get(fingerprint)
+            if data is not None:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                return data, False
+            pending = self._inflight.get(fingerprint)
+            owner = pending is None
+            if owner:
+                self.misses += 1
+                pending = self._inflight[fingerprint] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return pending.result(), False # Re-raises the render's error, if it failed
+        try:
+            data = render()
+            self.put(fingerprint, data)
+            pending.set_result(data)
+            return data, True
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(fingerprint, None)
+
+    def put(self, fingerprint: tuple, data: bytes):
+        with self._lock:
+            self._entries[fingerprint] = data
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drops every cached report in this process (benchmarks measuring cold renders)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                    "in_flight": len(self._inflight)}
+
+
+# Shared per-process instance
+report_cache = ReportCache()
+
+
+def _archive(filename: str, data: bytes):
+    """Writes a copy into REPORT_ARCHIVE_DIR via rename-into-place, so readers never see partial files."""
+    os.makedirs(REPORT_ARCHIVE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=REPORT_ARCHIVE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp_path, os.path.join(REPORT_ARCHIVE_DIR, filename))
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# --- Rendering ---
+# A report is one section per month plus, for ranges, a summary section. The
+# data is fetched once (a single range query plus the rollup totals) and turned
+# into plain tuples, so a long range can be cut into runs of consecutive months,
+# one PDF per pool process, and concatenated with pypdf. Each document embeds
+# its own font subset (about a quarter of a second of work), so the pool is only
+# used once cell drawing outweighs that: REPORT_PARALLEL_ROWS or more rows. Small
+# ranges, REPORT_WORKERS below 2 and installs without pypdf render one document
+# in-process.
+
+def _section_title(start_month: str, end_month: str) -> str:
+    if start_month == end_month:
+        return "Monthly Spending Report"
+    first = datetime.strptime(start_month, "%Y-%m").strftime('%b %Y')
+    last = datetime.strptime(end_month, "%Y-%m").strftime('%b %Y')
+    return f"Spending Report {first} - {last}"
+
+
+def fetch_sections(conn, user_id: int, start_month: str, end_month: str) -> list:
+    """[(month_label, rows, total)] for each month of the range; rows are (title, category, date, amount) tuples."""
+    range_start, range_end = month_bounds(start_month)[0], month_bounds(end_month)[1]
+    cursor = conn.cursor()
+    try:
+        # One half-open range query for the whole period, served by the (user_id, date_added, id) index
+        cursor.execute("""
+            SELECT title, amount, category, date_added
+            FROM expenses
+            WHERE user_id = %s AND date_added >= %s AND date_added < %s
+            ORDER BY date_added ASC, id ASC
+        """, (user_id, range_start, range_end))
+        expenses = cursor.fetchall()
+    finally:
+        cursor.close()
+    # Monthly totals come from the rollup instead of a second pass over expenses
+    totals = rollup.range_totals(conn, user_id, start_month, end_month)
+
+    by_month = {}
+    for title, amount, category, date_added in expenses:
+        by_month.setdefault(date_added.strftime("%Y-%m"), []).append(
+            (title or 'N/A', category or 'N/A', date_added.strftime('%Y-%m-%d'), float(amount or 0.0)))
+    return [(datetime.strptime(month_year, "%Y-%m").strftime('%B %Y'), by_month.get(month_year, []),
+             totals.get(month_year, 0.0))
+            for month_year in iter_months(start_month, end_month)]
+
+
+def _write_month(pdf, section: tuple, heading: bool):
+    month_label, rows, total = section
+    pdf.begin_section(month_label if heading else None)
+    if heading:
+        pdf.set_font(pdf.font_name, "B", 12)
+        pdf.cell(0, 10, month_label, ln=True)
+
+    # Add table header
+    pdf.set_font(pdf.font_name, "B", 11)
+    pdf.cell(80, 10, "Title", border=1)
+    pdf.cell(40, 10, "Category", border=1)
+    pdf.cell(30, 10, "Date", border=1)
+    pdf.cell(30, 10, f"Amount ({pdf.currency})", border=1, ln=True, align="R")
+    pdf.set_font(pdf.font_name, size=11)
+
+    # Add table rows
+    for title, category, date, amount in rows:
+        pdf.cell(80, 10, title, border=1)
+        pdf.cell(40, 10, category, border=1)
+        pdf.cell(30, 10, date, border=1)
+        pdf.cell(30, 10, f"{amount:.2f}", border=1, ln=True, align="R")
+
+    pdf.ln(5) # Add space before total
+    pdf.set_font(pdf.font_name, "B", 12)
+    pdf.cell(0, 10, f"Total Spending for {month_label}: {pdf.currency}{total:.2f}", ln=True, align="R")
+
+
+def _write_summary(pdf, sections: list):
+    pdf.begin_section("Summary")
+    pdf.set_font(pdf.font_name, "B", 12)
+    pdf.cell(0, 10, "Summary", ln=True)
+    pdf.set_font(pdf.font_name, size=11)
+    for month_label, rows, total in sections:
+        pdf.cell(80, 8, month_label, border=1)
+        pdf.cell(40, 8, f"{len(rows)} expenses", border=1)
+        pdf.cell(40, 8, f"{total:.2f}", border=1, ln=True, align="R")
+    pdf.ln(5)
+    pdf.set_font(pdf.font_name, "B", 13)
+    grand_total = sum(total for _, _, total in sections)
+    pdf.cell(0, 10, f"Total Spending for the period: {pdf.currency}{grand_total:.2f}",
+             ln=True, align="R")
+
+
+def render_month_sections(title: str, fonts, sections: list) -> bytes:
+    """Consecutive months of a range report as a standalone PDF; runs in the process pool."""
+    pdf = new_pdf(title, fonts)
+    for section in sections:
+        _write_month(pdf, section, heading=True)
+    return _pdf_bytes(pdf)
+
+
+def split_sections(sections: list, parts: int) -> list:
+    """Cuts sections into at most `parts` runs of consecutive months with similar row counts."""
+    target = sum(len(rows) for _, rows, _ in sections) / parts
+    runs, run, run_rows = [], [], 0
+    for section in sections:
+        run.append(section)
+        run_rows += len(section[1])
+        if run_rows >= target and len(runs) < parts - 1:
+            runs.append(run)
+            run, run_rows = [], 0
+    if run:
+        runs.append(run)
+    return runs
+
+
+def _render_sequential(title: str, fonts, sections: list) -> bytes:
+    pdf = new_pdf(title, fonts)
+    ranged = len(sections) > 1
+    for section in sections:
+        _write_month(pdf, section, heading=ranged)
+    if ranged:
+        _write_summary(pdf, sections)
+    return _pdf_bytes(pdf)
+
+
+def _render_parallel(title: str, fonts, sections: list):
+    """Renders month sections in the process pool and merges them; None if the pool is unusable."""
+    try:
+        parts = list(get_executor().map(render_month_sections, repeat(title), repeat(fonts),
+                                        split_sections(sections, REPORT_WORKERS)))
+    except (BrokenProcessPool, OSError, RuntimeError) as e: # Includes scheduling on a pool that shut down
+        log_event("pdf_pool_failed", "PDF render pool failed, rendering in-process", error=str(e))
+        _reset_executor()
+        return None
+    summary = new_pdf(title, fonts)
+    _write_summary(summary, sections)
+    parts.append(_pdf_bytes(summary))
+    return merge_pdfs(parts)
+
+
+def merge_pdfs(parts: list) -> bytes:
+    """Concatenates PDF documents, keeping each one's outline (the per-month bookmarks)."""
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    for data in parts:
+        writer.append(BytesIO(data))
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def pypdf_available() -> bool:
+    return importlib.util.find_spec('pypdf') is not None
+
+
+# Shared per-process pool; created on first use. Workers are spawned rather than
+# forked so they never inherit the web process's threads, pool connections or locks.
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=REPORT_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def render_pdf_report(conn, user_id: int, start_month: str, end_month: str) -> bytes:
+    """Renders a user's expenses for the inclusive month range into PDF bytes."""
+    with timed("pdf_render", PDF_SECONDS, months=str(len(iter_months(start_month, end_month)))):
+        sections = fetch_sections(conn, user_id, start_month, end_month)
+        title, fonts = _section_title(start_month, end_month), report_fonts()
+        rows = sum(len(section[1]) for section in sections)
+        if REPORT_WORKERS > 1 and len(sections) > 1 and rows >= REPORT_PARALLEL_ROWS and pypdf_available():
+            data = _render_parallel(title, fonts, sections)
+            if data is not None:
+                return data
+        return _render_sequential(title, fonts, sections)
+
+
+def generate_pdf_report(user_id: int, start_month: str = None, end_month: str = None, fingerprint: tuple = None):
+    """Returns (pdf_bytes, etag, filename) for a user's month range, from cache when the data is unchanged.
+
+    Defaults to the current month. Returns None on failure.
+    """
+    start_month = start_month or datetime.now().strftime("%Y-%m")
+    end_month = end_month or start_month
+    try:
+        conn = get_db()
+        fingerprint = fingerprint or report_fingerprint(conn, user_id, start_month, end_month)
+        filename = report_filename(start_month, end_month)
+        data, rendered = report_cache.get_or_render(
+            fingerprint, lambda: render_pdf_report(conn, user_id, start_month, end_month))
+        if rendered:
+            if REPORT_ARCHIVE_DIR:
+                _archive(f"user{user_id}_{filename}", data) # Users share the archive directory
+        return data, fingerprint_etag(fingerprint), filename
+
+    except Exception as e: # Database and rendering errors alike
+        log_event("pdf_report_failed", "Failed to generate PDF report", start=start_month, end=end_month, error=str(e))
+        return None # Return None indicates failure
+
+
+# --- Background Jobs ---
+
+class _Job:
+    """One queued/running/finished report render."""
+
+    def __init__(self, job_id: str, user_id: int, start_month: str, end_month: str, fingerprint: tuple):
+        self.id = job_id
+        self.user_id = user_id
+        self.start_month = start_month
+        self.end_month = end_month
+        self.fingerprint = fingerprint
+        self.status = 'queued'
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.result = None # (pdf_bytes, etag, filename) once done
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "start": self.start_month,
+            "end": self.end_month,
+            "months": len(iter_months(self.start_month, self.end_month)),
+            "created_at": datetime.fromtimestamp(self.created_at).isoformat(timespec='seconds'),
+            "seconds": round((self.finished_at or time.time()) - self.created_at, 3),
+            "error": self.error,
+        }
+
+
+class ReportJobs:
+    """Renders reports in the background so long ranges never hold a request thread.
+
+    submit() returns the pending job for the same fingerprint if there is one, so
+    repeated clicks share one render; a finished render is picked up from
+    report_cache by the next job, which then completes immediately. At most
+    REPORT_JOB_THREADS jobs render at once; finished jobs are kept for
+    REPORT_JOB_TTL seconds and at most REPORT_JOBS_MAX are remembered.
+    """
+
+    def __init__(self, app, threads: int = REPORT_JOB_THREADS, ttl: float = REPORT_JOB_TTL,
+                 max_jobs: int = REPORT_JOBS_MAX):
+        self.app = app
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='report-job')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self.submitted = 0
+        self.reused = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at and now - job.finished_at > self.ttl:
+                del self._jobs[job_id]
+        while len(self._jobs) > self.max_jobs:
+            oldest = next((job_id for job_id, job in self._jobs.items() if job.finished_at), None)
+            if oldest is None:
+                break # Never forget a job that is still rendering
+            del self._jobs[oldest]
+
+    def submit(self, user_id: int, start_month: str, end_month: str, fingerprint: tuple) -> _Job:
+        with self._lock:
+            self._expire()
+            for job in self._jobs.values():
+                if job.fingerprint == fingerprint and job.status in ('queued', 'running'):
+                    self.reused += 1
+                    return job
+            job = _Job(uuid.uuid4().hex, user_id, start_month, end_month, fingerprint)
+            self._jobs[job.id] = job
+            self.submitted += 1
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, user_id: int, job_id: str):
+        """The user's job with this id, or None (also for another user's job)."""
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+        return job if job is not None and job.user_id == user_id else None
+
+    def _run(self, job: _Job):
+        with self._lock:
+            job.status = 'running'
+        with self.app.app_context():
+            result = generate_pdf_report(job.user_id, job.start_month, job.end_month, job.fingerprint)
+        with self._lock:
+            job.finished_at = time.time()
+            if result is None:
+                job.status, job.error = 'failed', "Could not generate the PDF report."
+                self.failed += 1
+            else:
+                job.status, job.result = 'done', result
+                self.completed += 1
+        log_event("report_job_finished", f"Report job {job.status}", level='info', job_id=job.id,
+                  user_id=job.user_id, start=job.start_month, end=job.end_month,
+                  seconds=round(job.finished_at - job.created_at, 3))
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job.status in ('queued', 'running'))
+            return {"jobs": len(self._jobs), "pending": pending, "submitted": self.submitted, "reused": self.reused,
+                    "completed": self.completed, "failed": self.failed}
@@ -0,0 +1,179 @@
+import re
+from datetime import datetime
+
+from categories import PENDING_CATEGORY
+from database import row_lock, upsert_sql
+from schema import month_bounds
+import rollup
+
+# Expense and budget reads/writes shared by the web app and the CLI. Every
+# function takes a connection from database.py (MySQL or SQLite) and leaves
+# committing to the caller, so several calls can share one transaction.
+# Expenses and budgets belong to a user: every query is filtered on user_id
+# first, matching the user-leading indexes, so one user's reads never scan
+# another user's rows.
+
+_USERNAME_RE = re.compile(r'^[A-Za-z0-9_.@-]{1,64}$')
+
+
+# --- Users ---
+
+def get_or_create_user(conn, username: str) -> int:
+    """Returns the id for `username`, creating the user on first use. Raises ValueError on bad names."""
+    username = (username or '').strip()
+    if not _USERNAME_RE.match(username):
+        raise ValueError("Usernames are 1-64 letters, digits or . _ @ - characters.")
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
+        row = cursor.fetchone()
+        if row:
+            return int(row[0])
+        cursor.execute(upsert_sql("users", ("username",), ("username",)), (username,))
+        cursor.execute("SELECT id FROM users WHERE username = %s", (username,)) # Also right if another writer won the race
+        return int(cursor.fetchone()[0])
+    finally:
+        cursor.close()
+
+
+def get_username(conn, user_id: int):
+    """The username for an id, or None."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT username FROM users WHERE id = %s", (user_id,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return row[0] if row else None
+
+
+# --- Expenses ---
+
+def add_expense(conn, user_id: int, title: str, amount: float, category: str, date_added: datetime = None) -> int:
+    """Inserts a user's expense and counts it in the rollup. Returns the new id."""
+    date_added = date_added or datetime.now()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("INSERT INTO expenses (user_id, title, amount, category, date_added) VALUES (%s, %s, %s, %s, %s)",
+                       (user_id, title, amount, category, date_added))
+        expense_id = cursor.lastrowid
+    finally:
+        cursor.close()
+    rollup.record_expense(conn, user_id, date_added, category, amount) # Same transaction as the insert
+    return expense_id
+
+
+def recent_expenses(conn, user_id: int, limit: int = 10) -> list:
+    """A user's newest expenses as dicts, each with a display-ready 'formatted_date'."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT id, title, amount, category, date_added
+            FROM expenses
+            WHERE user_id = %s
+            ORDER BY date_added DESC
+            LIMIT %s
+        """, (user_id, limit))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    for row in rows:
+        row['formatted_date'] = row['date_added'].strftime('%Y-%m-%d %H:%M')
+    return rows
+
+
+def month_expenses(conn, user_id: int, month_year: str) -> list:
+    """A user's expenses in a 'YYYY-MM' month, oldest first, as dicts."""
+    start, end = month_bounds(month_year)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT id, title, amount, category, date_added
+            FROM expenses
+            WHERE user_id = %s AND date_added >= %s AND date_added < %s
+            ORDER BY date_added ASC, id ASC
+        """, (user_id, start, end))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def pending_count(conn, user_id: int) -> int:
+    """A user's expenses still waiting for the background categorizer."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM expenses WHERE user_id = %s AND category = %s",
+                       (user_id, PENDING_CATEGORY))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return int(row[0]) if row else 0
+
+
+def lock_expense(conn, user_id: int, expense_id: int):
+    """Reads one of a user's expenses and locks it until commit/rollback. Returns a dict or None."""
+    lock = row_lock(conn)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f"""SELECT id, user_id, title, amount, category, date_added FROM expenses
+                           WHERE id = %s AND user_id = %s {lock}""", (expense_id, user_id))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def change_category(conn, expense: dict, category: str):
+    """Recategorizes a row returned by lock_expense(), moves it between rollup buckets and bumps the user's data revision."""
+    if expense['category'] == category:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute("UPDATE expenses SET category = %s WHERE id = %s", (category, expense['id']))
+        # Cached reports are keyed by this revision; row counts and ids don't change here
+        cursor.execute("UPDATE users SET data_revision = data_revision + 1 WHERE id = %s", (expense['user_id'],))
+    finally:
+        cursor.close()
+    rollup.move_expense(conn, expense['user_id'], expense['date_added'], expense['category'], category,
+                        expense['amount'])
+
+
+# --- Budget ---
+
+def set_budget(conn, user_id: int, month_year: str, amount: float):
+    """Sets a user's budget for a 'YYYY-MM' month, replacing any earlier amount."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(upsert_sql("budget", ("user_id", "month_year", "amount"), ("user_id", "month_year"),
+                                  {"amount": "{new}"}),
+                       (user_id, month_year, amount))
+    finally:
+        cursor.close()
+
+
+def month_budget(conn, user_id: int, month_year: str):
+    """The budget a user set for a 'YYYY-MM' month, or None."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT amount FROM budget WHERE user_id = %s AND month_year = %s", (user_id, month_year))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return float(row[0]) if row else None
+
+
+def latest_budget(conn, user_id: int):
+    """The budget for a user's most recent budgeted month, or None if none was ever set."""
+    cursor = conn.cursor()
+    try:
+        # Walks the (user_id, month_year) unique key backwards: one index probe
+        cursor.execute("SELECT amount FROM budget WHERE user_id = %s ORDER BY month_year DESC LIMIT 1", (user_id,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return float(row[0]) if row and row[0] is not None else None
+
+
+def current_budget(conn, user_id: int, month_year: str):
+    """The month's own budget, falling back to the most recent one a user set."""
+    budget = month_budget(conn, user_id, month_year)
+    return budget if budget is not None else latest_budget(conn, user_id)
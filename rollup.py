@@ -0,0 +1,112 @@
+import sys
+from datetime import datetime
+
+from database import DB_ERRORS, connection, month_key, upsert_sql
+from schema import month_bounds
+
+# The expense_rollup table holds (user_id, month_year, category) -> count/sum so dashboard
+# totals, budget checks and report totals read a handful of rows instead of
+# scanning expenses. Writers must call record_expense() on the same connection and
+# before committing the INSERT into expenses so the two never drift.
+
+
+def record_expense(conn, user_id: int, date_added: datetime, category: str, amount: float, count: int = 1):
+    """Adds an expense (or `count` expenses totalling `amount`) to its user/month/category bucket."""
+    cursor = conn.cursor()
+    cursor.execute(upsert_sql("expense_rollup", ("user_id", "month_year", "category", "expense_count", "total_amount"),
+                              ("user_id", "month_year", "category"),
+                              {"expense_count": "expense_count + {new}", "total_amount": "total_amount + {new}"}),
+                   (user_id, date_added.strftime("%Y-%m"), category, count, amount))
+    cursor.close()
+
+
+def move_expense(conn, user_id: int, date_added: datetime, old_category: str, new_category: str, amount: float):
+    """Moves an already recorded expense between categories (e.g. after a correction)."""
+    if old_category == new_category:
+        return
+    record_expense(conn, user_id, date_added, old_category, -amount, count=-1)
+    record_expense(conn, user_id, date_added, new_category, amount)
+
+
+def month_summary(conn, user_id: int, month_year: str) -> dict:
+    """Returns {category: {'count': n, 'total': x}} for one user's 'YYYY-MM' month."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT category, expense_count, total_amount
+        FROM expense_rollup
+        WHERE user_id = %s AND month_year = %s AND expense_count > 0
+    """, (user_id, month_year))
+    summary = {}
+    for category, count, total in cursor.fetchall():
+        summary[category] = {'count': int(count), 'total': float(total)}
+    cursor.close()
+    return summary
+
+
+def month_total(conn, user_id: int, month_year: str) -> float:
+    """A user's total spend for one 'YYYY-MM' month, read from the rollup."""
+    return sum(bucket['total'] for bucket in month_summary(conn, user_id, month_year).values())
+
+
+def range_totals(conn, user_id: int, start_month: str, end_month: str) -> dict:
+    """{'YYYY-MM': total} for a user's inclusive month range in one query; months without spend are absent."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT month_year, SUM(total_amount)
+        FROM expense_rollup
+        WHERE user_id = %s AND month_year >= %s AND month_year <= %s AND expense_count > 0
+        GROUP BY month_year
+    """, (user_id, start_month, end_month))
+    totals = {month_year: float(total) for month_year, total in cursor.fetchall()}
+    cursor.close()
+    return totals
+
+
+def rebuild(conn, month_year: str = None) -> int:
+    """Recomputes the rollup from expenses, for one month or the whole history, for all users.
+
+    Intended for backfills and repairs; run it while writes are quiet, since
+    expenses inserted mid-rebuild may be counted twice for the rebuilt range.
+    Returns the number of buckets written.
+    """
+    cursor = conn.cursor()
+    try:
+        if month_year:
+            start, end = month_bounds(month_year)
+            cursor.execute("DELETE FROM expense_rollup WHERE month_year = %s", (month_year,))
+            cursor.execute("""
+                INSERT INTO expense_rollup (user_id, month_year, category, expense_count, total_amount)
+                SELECT user_id, %s, category, COUNT(*), SUM(amount)
+                FROM expenses
+                WHERE date_added >= %s AND date_added < %s
+                GROUP BY user_id, category
+            """, (month_year, start, end))
+        else:
+            cursor.execute("DELETE FROM expense_rollup")
+            month = month_key('date_added')
+            cursor.execute(f"""
+                INSERT INTO expense_rollup (user_id, month_year, category, expense_count, total_amount)
+                SELECT user_id, {month}, category, COUNT(*), SUM(amount)
+                FROM expenses
+                GROUP BY user_id, {month}, category
+            """)
+        written = cursor.rowcount
+        conn.commit()
+        return written
+    except DB_ERRORS:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild':
+        exit("Usage: python rollup.py rebuild [YYYY-MM]")
+    target_month = sys.argv[2] if len(sys.argv) > 2 else None
+    try:
+        with connection() as conn:
+            buckets = rebuild(conn, target_month)
+        print(f"Rebuilt {buckets} rollup buckets for {target_month or 'all months'}.")
+    except DB_ERRORS as err:
+        exit(f"Database error: {err}")
@@ -0,0 +1,413 @@
+import os
+import sys
+from datetime import datetime
+
+from database import DB_ERRORS, connection, is_sqlite
+
+DEFAULT_USER_ID = 1 # Owner of every row written before expenses were scoped by user
+DEFAULT_USERNAME = 'default'
+EXPENSES_PARTITION_MONTHS_AHEAD = int(os.getenv('EXPENSES_PARTITION_MONTHS_AHEAD', '3'))
+
+# --- Migrations ---
+# Each entry is (version, description, statements). Versions are applied in order
+# and recorded in `schema_version`, so re-running migrate() is always safe.
+# CREATE INDEX entries are (table, index_name, columns) tuples and are skipped when
+# the index already exists (databases created by hand before this module existed).
+# Statements that differ between backends are {'mysql': ..., 'sqlite': ...} dicts;
+# a None value means the step is not needed on that backend. Callables (built by
+# the _drop_index/_create_unique_index/_unless_column helpers below) inspect the
+# schema before changing it, so a migration that MySQL's auto-committing DDL left
+# half-applied can simply be run again.
+
+
+def _drop_index(table: str, index_name: str):
+    def step(cursor):
+        if _index_exists(cursor, table, index_name):
+            cursor.execute(f"DROP INDEX {index_name}" if is_sqlite() else f"DROP INDEX {index_name} ON {table}")
+    return step
+
+
+def _create_unique_index(table: str, index_name: str, columns: str):
+    def step(cursor):
+        if not _index_exists(cursor, table, index_name):
+            cursor.execute(f"CREATE UNIQUE INDEX {index_name} ON {table} {columns}")
+    return step
+
+
+def _unless_column(table: str, column: str, statement: str):
+    """Runs `statement` only while `table` has no `column` (ADD COLUMN and the like)."""
+    def step(cursor):
+        if not _column_exists(cursor, table, column):
+            cursor.execute(statement)
+    return step
+
+
+MIGRATIONS = [
+    (1, "Create expenses and budget tables", [
+        {
+            'mysql': """CREATE TABLE IF NOT EXISTS expenses (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                title VARCHAR(255) NOT NULL,
+                amount DECIMAL(12, 2) NOT NULL,
+                category VARCHAR(50) NOT NULL DEFAULT 'Miscellaneous',
+                date_added DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )""",
+            'sqlite': """CREATE TABLE IF NOT EXISTS expenses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title VARCHAR(255) NOT NULL,
+                amount DECIMAL(12, 2) NOT NULL,
+                category VARCHAR(50) NOT NULL DEFAULT 'Miscellaneous',
+                date_added DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )""",
+        },
+        {
+            'mysql': """CREATE TABLE IF NOT EXISTS budget (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                month_year CHAR(7) NOT NULL,
+                amount DECIMAL(12, 2) NOT NULL,
+                UNIQUE KEY uq_budget_month_year (month_year)
+            )""",
+            'sqlite': """CREATE TABLE IF NOT EXISTS budget (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                month_year CHAR(7) NOT NULL,
+                amount DECIMAL(12, 2) NOT NULL,
+                CONSTRAINT uq_budget_month_year UNIQUE (month_year)
+            )""",
+        },
+    ]),
+    (2, "Index expenses for month range scans and per-category reports", [
+        ("expenses", "idx_expenses_date_id", "(date_added, id)"),
+        ("expenses", "idx_expenses_category_date", "(category, date_added)"),
+    ]),
+    (3, "Create the monthly per-category rollup and backfill it", [
+        """CREATE TABLE IF NOT EXISTS expense_rollup (
+            month_year CHAR(7) NOT NULL,
+            category VARCHAR(50) NOT NULL,
+            expense_count INT NOT NULL DEFAULT 0,
+            total_amount DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (month_year, category)
+        )""",
+        {
+            'mysql': """INSERT INTO expense_rollup (month_year, category, expense_count, total_amount)
+                SELECT DATE_FORMAT(date_added, '%Y-%m'), category, COUNT(*), SUM(amount)
+                FROM expenses
+                GROUP BY DATE_FORMAT(date_added, '%Y-%m'), category
+                ON DUPLICATE KEY UPDATE expense_count = VALUES(expense_count), total_amount = VALUES(total_amount)""",
+            # WHERE true keeps SQLite from parsing the upsert's ON as a join constraint
+            'sqlite': """INSERT INTO expense_rollup (month_year, category, expense_count, total_amount)
+                SELECT strftime('%Y-%m', date_added), category, COUNT(*), SUM(amount)
+                FROM expenses
+                WHERE true
+                GROUP BY strftime('%Y-%m', date_added), category
+                ON CONFLICT (month_year, category) DO UPDATE
+                SET expense_count = excluded.expense_count, total_amount = excluded.total_amount""",
+        },
+    ]),
+    (4, "Create the persistent title -> category cache", [
+        """CREATE TABLE IF NOT EXISTS category_cache (
+            title_key VARCHAR(255) NOT NULL PRIMARY KEY,
+            category VARCHAR(50) NOT NULL,
+            source VARCHAR(10) NOT NULL DEFAULT 'ai',
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )""",
+    ]),
+    (5, "Add the statement-import dedup hash to expenses", [
+        _unless_column("expenses", "import_hash", "ALTER TABLE expenses ADD COLUMN import_hash CHAR(40) NULL"),
+        # NULLs don't collide in a UNIQUE index, so hand-entered expenses are unaffected
+        _create_unique_index("expenses", "uq_expenses_import_hash", "(import_hash)"),
+    ]),
+    # Existing rows, budgets and rollup buckets all belong to the default user.
+    # Every per-user query leads with user_id, so it reads one user's slice of
+    # an index however many users share the instance.
+    (6, "Scope expenses, budgets and the rollup by user", [
+        {
+            'mysql': """CREATE TABLE IF NOT EXISTS users (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                username VARCHAR(64) NOT NULL,
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE KEY uq_users_username (username)
+            )""",
+            'sqlite': """CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username VARCHAR(64) NOT NULL,
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                CONSTRAINT uq_users_username UNIQUE (username)
+            )""",
+        },
+        {
+            'mysql': f"INSERT IGNORE INTO users (id, username) VALUES ({DEFAULT_USER_ID}, '{DEFAULT_USERNAME}')",
+            'sqlite': f"INSERT OR IGNORE INTO users (id, username) VALUES ({DEFAULT_USER_ID}, '{DEFAULT_USERNAME}')",
+        },
+        _unless_column("expenses", "user_id",
+                       f"ALTER TABLE expenses ADD COLUMN user_id INT NOT NULL DEFAULT {DEFAULT_USER_ID}"),
+        ("expenses", "idx_expenses_user_date_id", "(user_id, date_added, id)"),
+        ("expenses", "idx_expenses_user_category_date", "(user_id, category, date_added)"),
+        # Superseded by the user-leading index; (category, date_added) stays for the Pending sweep
+        _drop_index("expenses", "idx_expenses_date_id"),
+        # The same statement line imported by two users is two expenses
+        _drop_index("expenses", "uq_expenses_import_hash"),
+        _create_unique_index("expenses", "uq_expenses_user_import_hash", "(user_id, import_hash)"),
+        {
+            'mysql': _unless_column("budget", "user_id", f"""ALTER TABLE budget
+                ADD COLUMN user_id INT NOT NULL DEFAULT {DEFAULT_USER_ID} AFTER id"""),
+            # SQLite cannot drop a table constraint, so the table is rebuilt
+            'sqlite': f"""CREATE TABLE budget_v6 (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INT NOT NULL DEFAULT {DEFAULT_USER_ID},
+                month_year CHAR(7) NOT NULL,
+                amount DECIMAL(12, 2) NOT NULL,
+                CONSTRAINT uq_budget_user_month UNIQUE (user_id, month_year)
+            )""",
+        },
+        {'mysql': _drop_index("budget", "uq_budget_month_year"), 'sqlite': None},
+        {'mysql': _create_unique_index("budget", "uq_budget_user_month", "(user_id, month_year)"), 'sqlite': None},
+        {'mysql': None, 'sqlite': f"""INSERT INTO budget_v6 (id, user_id, month_year, amount)
+            SELECT id, {DEFAULT_USER_ID}, month_year, amount FROM budget"""},
+        {'mysql': None, 'sqlite': "DROP TABLE budget"},
+        {'mysql': None, 'sqlite': "ALTER TABLE budget_v6 RENAME TO budget"},
+        {
+            # One ALTER, so the column and the new primary key land together
+            'mysql': _unless_column("expense_rollup", "user_id", f"""ALTER TABLE expense_rollup
+                ADD COLUMN user_id INT NOT NULL DEFAULT {DEFAULT_USER_ID} FIRST,
+                DROP PRIMARY KEY,
+                ADD PRIMARY KEY (user_id, month_year, category)"""),
+            'sqlite': f"""CREATE TABLE expense_rollup_v6 (
+                user_id INT NOT NULL DEFAULT {DEFAULT_USER_ID},
+                month_year CHAR(7) NOT NULL,
+                category VARCHAR(50) NOT NULL,
+                expense_count INT NOT NULL DEFAULT 0,
+                total_amount DECIMAL(14, 2) NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, month_year, category)
+            )""",
+        },
+        {'mysql': None, 'sqlite': f"""INSERT INTO expense_rollup_v6 (user_id, month_year, category, expense_count, total_amount)
+            SELECT {DEFAULT_USER_ID}, month_year, category, expense_count, total_amount FROM expense_rollup"""},
+        {'mysql': None, 'sqlite': "DROP TABLE expense_rollup"},
+        {'mysql': None, 'sqlite': "ALTER TABLE expense_rollup_v6 RENAME TO expense_rollup"},
+    ]),
+    # A correction is one user's preference: it must not recategorize other users' expenses
+    (7, "Move category corrections into per-user overrides", [
+        """CREATE TABLE IF NOT EXISTS category_overrides (
+            user_id INT NOT NULL,
+            title_key VARCHAR(255) NOT NULL,
+            category VARCHAR(50) NOT NULL,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, title_key)
+        )""",
+        # Corrections made before users existed were the default user's
+        {
+            'mysql': f"""INSERT IGNORE INTO category_overrides (user_id, title_key, category, updated_at)
+                SELECT {DEFAULT_USER_ID}, title_key, category, updated_at FROM category_cache WHERE source = 'user'""",
+            'sqlite': f"""INSERT OR IGNORE INTO category_overrides (user_id, title_key, category, updated_at)
+                SELECT {DEFAULT_USER_ID}, title_key, category, updated_at FROM category_cache WHERE source = 'user'""",
+        },
+        "DELETE FROM category_cache WHERE source = 'user'",
+    ]),
+    # Bumped by every category correction, so report fingerprints (and their ETags)
+    # change even though a correction leaves row counts and ids as they were
+    (8, "Count each user's data revisions for report fingerprints", [
+        _unless_column("users", "data_revision", "ALTER TABLE users ADD COLUMN data_revision INT NOT NULL DEFAULT 0"),
+    ]),
+]
+
+
+def month_bounds(month_year: str) -> tuple:
+    """Returns the half-open [start, end) datetimes covering a 'YYYY-MM' month."""
+    start = datetime.strptime(month_year, "%Y-%m")
+    if start.month == 12:
+        end = start.replace(year=start.year + 1, month=1)
+    else:
+        end = start.replace(month=start.month + 1)
+    return start, end
+
+
+def _index_exists(cursor, table: str, index_name: str) -> bool:
+    if is_sqlite():
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+                       (table, index_name))
+        return cursor.fetchone() is not None
+    cursor.execute("""
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+    """, (table, index_name))
+    return cursor.fetchone() is not None
+
+
+def _column_exists(cursor, table: str, column: str) -> bool:
+    if is_sqlite():
+        cursor.execute(f"PRAGMA table_info({table})")
+        return any(row[1] == column for row in cursor.fetchall())
+    cursor.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        LIMIT 1
+    """, (table, column))
+    return cursor.fetchone() is not None
+
+
+def current_version(cursor) -> int:
+    """Returns the highest applied migration version (0 for a fresh database)."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    row = cursor.fetchone()
+    return row[0] if row and row[0] is not None else 0
+
+
+def migrate(conn) -> int:
+    """Applies all pending migrations on `conn`. Returns the resulting version."""
+    cursor = conn.cursor()
+    try:
+        version = current_version(cursor)
+        for number, description, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            for statement in statements:
+                if isinstance(statement, dict):
+                    statement = statement['sqlite' if is_sqlite() else 'mysql']
+                    if statement is None:
+                        continue
+                if callable(statement):
+                    statement(cursor)
+                    continue
+                if isinstance(statement, tuple):
+                    table, index_name, columns = statement
+                    if _index_exists(cursor, table, index_name):
+                        continue
+                    statement = f"CREATE INDEX {index_name} ON {table} {columns}"
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                           (number, description))
+            conn.commit() # DDL auto-commits in MySQL; this records the version row
+            print(f"Applied migration {number}: {description}")
+            version = number
+        return version
+    finally:
+        cursor.close()
+
+
+# --- Index Checks ---
+
+MONTH_QUERY = """
+    SELECT title, amount, category, date_added
+    FROM expenses
+    WHERE user_id = %s AND date_added >= %s AND date_added < %s
+    ORDER BY date_added ASC
+"""
+
+
+def explain_month_query(conn, month_year: str = None, user_id: int = DEFAULT_USER_ID) -> dict:
+    """Runs EXPLAIN (EXPLAIN QUERY PLAN on SQLite) on a user's monthly report query and returns the plan row."""
+    start, end = month_bounds(month_year or datetime.now().strftime("%Y-%m"))
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(("EXPLAIN QUERY PLAN " if is_sqlite() else "EXPLAIN ") + MONTH_QUERY, (user_id, start, end))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def check_month_index(conn, month_year: str = None) -> bool:
+    """True if the user + month filter is served by a range scan on idx_expenses_user_date_id."""
+    plan = explain_month_query(conn, month_year)
+    if not plan:
+        return False
+    if is_sqlite():
+        # e.g. "SEARCH expenses USING INDEX idx_expenses_user_date_id (user_id=? AND date_added>? AND date_added<?)"
+        detail = plan.get('detail', '')
+        return detail.startswith('SEARCH') and 'idx_expenses_user_date_id' in detail
+    return plan.get('key') == 'idx_expenses_user_date_id' and plan.get('type') == 'range'
+
+
+# --- Partitioning (MySQL) ---
+# Optional: `python schema.py partition` range-partitions expenses by month so
+# month-filtered queries touch only their partitions (EXPLAIN shows them in
+# `partitions`). MySQL requires the partitioning column in every unique key, so
+# the primary key becomes (id, date_added) and the import dedup key gains
+# date_added; the importer's hash lookup still dedups exactly. Re-run the
+# command (e.g. monthly from cron) to add partitions ahead of time; rows past
+# the last one land in `pmax` and are still found.
+
+def _partition_name(month_year: str) -> str:
+    return "p" + month_year.replace("-", "")
+
+
+def _partition_clauses(months: list) -> str:
+    clauses = [f"PARTITION {_partition_name(month)} VALUES LESS THAN ('{month_bounds(month)[1]:%Y-%m-%d}')"
+               for month in months]
+    clauses.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    return ",\n    ".join(clauses)
+
+
+def _months_between(first: str, last: str) -> list:
+    months = []
+    while first <= last:
+        months.append(first)
+        first = month_bounds(first)[1].strftime("%Y-%m")
+    return months
+
+
+def partition_expenses(conn, months_ahead: int = EXPENSES_PARTITION_MONTHS_AHEAD) -> int:
+    """Partitions expenses by month, or adds partitions up to `months_ahead` months out.
+
+    Returns the number of monthly partitions created.
+    """
+    if is_sqlite():
+        raise ValueError("Partitioning is only available on MySQL.")
+    last_month = datetime.now().strftime("%Y-%m")
+    for _ in range(months_ahead):
+        last_month = month_bounds(last_month)[1].strftime("%Y-%m")
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT partition_name, partition_description FROM information_schema.partitions
+            WHERE table_schema = DATABASE() AND table_name = 'expenses' AND partition_name IS NOT NULL
+            ORDER BY partition_ordinal_position
+        """)
+        existing = [name for name, _ in cursor.fetchall() if name != 'pmax']
+        if existing:
+            newest = f"{existing[-1][1:5]}-{existing[-1][5:7]}"
+            months = _months_between(month_bounds(newest)[1].strftime("%Y-%m"), last_month)
+            if months:
+                cursor.execute(f"ALTER TABLE expenses REORGANIZE PARTITION pmax INTO (\n    {_partition_clauses(months)})")
+            return len(months)
+
+        cursor.execute("SELECT MIN(date_added) FROM expenses")
+        oldest = cursor.fetchone()[0]
+        months = _months_between(oldest.strftime("%Y-%m") if oldest else datetime.now().strftime("%Y-%m"), last_month)
+        cursor.execute("""ALTER TABLE expenses
+            DROP PRIMARY KEY, ADD PRIMARY KEY (id, date_added),
+            DROP INDEX uq_expenses_user_import_hash,
+            ADD UNIQUE KEY uq_expenses_user_import_hash (user_id, import_hash, date_added)""")
+        cursor.execute(f"ALTER TABLE expenses PARTITION BY RANGE COLUMNS (date_added) (\n    {_partition_clauses(months)})")
+        return len(months)
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'migrate'
+    try:
+        with connection() as conn:
+            if command == 'migrate':
+                print(f"Schema is at version {migrate(conn)}.")
+            elif command == 'explain':
+                month_arg = sys.argv[2] if len(sys.argv) > 2 else None
+                print(explain_month_query(conn, month_arg))
+                if not check_month_index(conn, month_arg):
+                    exit("Month query is NOT using idx_expenses_user_date_id.")
+                print("Month query uses idx_expenses_user_date_id.")
+            elif command == 'partition':
+                print(f"Added {partition_expenses(conn)} monthly partitions to expenses.")
+            else:
+                exit("Usage: python schema.py [migrate|explain [YYYY-MM]|partition]")
+    except ValueError as e:
+        exit(str(e))
+    except DB_ERRORS as err:
+        exit(f"Database error: {err}")
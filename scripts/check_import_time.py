@@ -0,0 +1,46 @@
+"""Checks that importing app.py stays within its startup budget.
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter, fails if the
+cumulative import time exceeds IMPORT_TIME_BUDGET_MS, or if a module that must
+be loaded lazily (the PDF engine, the Gemini SDK) shows up at import time.
+
+Usage: python scripts/check_import_time.py [budget_ms]
+"""
+import os
+import subprocess
+import sys
+
+IMPORT_TIME_BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', '600'))
+LAZY_MODULES = ("fpdf", "google.generativeai", "numpy")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module: str = "app") -> dict:
+    """Returns {module_name: cumulative_microseconds} for one cold import of `module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:  self_us | cumulative_us | <indent>module"
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative_us)
+    return timings
+
+
+if __name__ == '__main__':
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else IMPORT_TIME_BUDGET_MS
+    timings = measure()
+    total_ms = timings.get("app", 0) / 1000
+    eager = [name for name in timings if name.startswith(LAZY_MODULES)]
+    print(f"import app: {total_ms:.1f} ms (budget {budget_ms:.0f} ms)")
+    for name, cumulative in sorted(timings.items(), key=lambda item: item[1], reverse=True)[:10]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    if eager:
+        exit(f"FAIL: modules that should load lazily were imported: {', '.join(sorted(set(eager)))}")
+    if total_ms > budget_ms:
+        exit(f"FAIL: import time {total_ms:.1f} ms exceeds the {budget_ms:.0f} ms budget")
+    print("OK")
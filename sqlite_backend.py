@@ -0,0 +1,158 @@
+import os
+import queue
+import sqlite3
+import weakref
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+
+# --- Configuration ---
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '5')) # Seconds a writer waits for the write lock
+SQLITE_CACHE_KB = int(os.getenv('SQLITE_CACHE_KB', '20000')) # Page cache per connection
+SQLITE_MMAP_BYTES = int(os.getenv('SQLITE_MMAP_BYTES', str(256 * 1024 * 1024))) # Memory-mapped read window
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', '256')) # Prepared statements kept per connection
+
+# WAL lets readers run alongside the single writer; synchronous=NORMAL is
+# durable across application crashes in WAL mode and skips an fsync per commit.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA cache_size = -{SQLITE_CACHE_KB}",
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA mmap_size = {SQLITE_MMAP_BYTES}",
+)
+
+# Store datetimes/decimals as ISO text so range comparisons sort correctly, and
+# read DATETIME/DECIMAL columns back as the same types mysql.connector returns.
+_CENTS = Decimal('0.01')
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=' '))
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter('DATETIME', lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter('DECIMAL', lambda raw: Decimal(raw.decode()).quantize(_CENTS))
+
+
+@lru_cache(maxsize=512)
+def translate(operation: str) -> str:
+    """Converts the app's %s (mysql.connector) placeholders to SQLite's ?."""
+    return operation.replace('%s', '?')
+
+
+def _dict_row(cursor, row) -> dict:
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteCursor:
+    """sqlite3 cursor with the mysql.connector calling conventions the app uses."""
+
+    def __init__(self, raw_conn, dictionary: bool = False):
+        self._cursor = raw_conn.cursor()
+        if dictionary:
+            self._cursor.row_factory = _dict_row
+
+    def execute(self, operation, params=None):
+        if params is None:
+            self._cursor.execute(operation)
+        else:
+            self._cursor.execute(translate(operation), tuple(params))
+
+    def executemany(self, operation, seq_params):
+        self._cursor.executemany(translate(operation), seq_params)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size: int = 1):
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+
+class SQLiteConnection:
+    """One checkout of a pooled sqlite3 connection; close() hands it back."""
+
+    def __init__(self, pool, raw_conn):
+        self._pool = pool
+        self._raw = raw_conn
+        self._cursors = weakref.WeakSet()
+
+    def cursor(self, dictionary: bool = False, buffered: bool = None):
+        # sqlite3 always steps rows lazily, so buffered=False needs no special handling
+        cursor = SQLiteCursor(self._raw, dictionary)
+        self._cursors.add(cursor)
+        return cursor
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._raw.in_transaction
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def ping(self, **kwargs):
+        """Nothing to reconnect: the database is a local file."""
+
+    def disconnect(self):
+        """Abandons in-flight reads by closing this checkout's cursors."""
+        for cursor in list(self._cursors):
+            cursor.close()
+
+    def close(self):
+        if self._raw is None:
+            return
+        self.disconnect() # Unfinished statements would pin the WAL snapshot
+        if self._raw.in_transaction:
+            self._raw.rollback()
+        raw, self._raw = self._raw, None
+        self._pool.put_back(raw)
+
+
+class SQLitePool:
+    """Idle sqlite3 connections for one database file, opened on demand.
+
+    How many are in use at once is bounded by the caller (database.checkout).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._idle = queue.LifoQueue()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def _connect(self):
+        raw = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, detect_types=sqlite3.PARSE_DECLTYPES,
+                              check_same_thread=False, cached_statements=SQLITE_STATEMENT_CACHE)
+        for pragma in PRAGMAS:
+            raw.execute(pragma)
+        return raw
+
+    def get_connection(self) -> SQLiteConnection:
+        try:
+            raw = self._idle.get_nowait()
+        except queue.Empty:
+            raw = self._connect()
+        return SQLiteConnection(self, raw)
+
+    def put_back(self, raw):
+        self._idle.put(raw)
@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The suite runs on the embedded SQLite backend, so it needs no MySQL server.
+# Modules read DB_BACKEND when they are imported, hence before the imports below.
+os.environ['DB_BACKEND'] = 'sqlite'
+os.environ['GEMINI_API_KEY'] = '' # Never reach the real API from tests
+os.environ['CLASSIFIER_PATH'] = os.path.join(tempfile.mkdtemp(prefix='expense_tracker_tests_'), 'category_nb.json.gz')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh database file and connection pool for one test, with no per-process state left from others."""
+    import ai
+    import categories
+    import classifier
+    monkeypatch.setattr(database, 'SQLITE_PATH', str(tmp_path / 'expense_tracker.db'))
+    monkeypatch.setattr(categories.category_cache, '_entries', categories.OrderedDict())
+    monkeypatch.setattr(classifier, '_model', None)
+    monkeypatch.setattr(classifier, '_train_thread', None)
+    if os.path.exists(classifier.CLASSIFIER_PATH): # Saved by an earlier test
+        os.remove(classifier.CLASSIFIER_PATH)
+    monkeypatch.setattr(ai, 'breaker', ai.CircuitBreaker())
+    monkeypatch.setattr(ai, '_override', None)
+    database._reset_after_fork() # Next checkout builds a pool on the new file
+    yield database
+    pool = database._pool
+    database._reset_after_fork()
+    while pool is not None and not pool._idle.empty():
+        pool._idle.get_nowait().close()
+
+
+@pytest.fixture
+def migrated(db):
+    """`db` with every migration applied."""
+    import schema
+    with db.connection() as conn:
+        schema.migrate(conn)
+    return db
+
+
+@pytest.fixture
+def app(migrated):
+    """The Flask app on a migrated database, once its startup classifier training has finished.
+
+    Its background categorizer is stopped afterwards.
+    """
+    import classifier
+    from app import create_app
+    flask_app = create_app({'TESTING': True})
+    if classifier._train_thread:
+        classifier._train_thread.join(10)
+    yield flask_app
+    flask_app.extensions['categorizer'].stop()
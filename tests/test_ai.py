@@ -0,0 +1,87 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import ai
+
+
+class APIError(Exception):
+    """Shaped like google.api_core errors: the HTTP status is in `code`."""
+
+    def __init__(self, code: int):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class ScriptedModel:
+    """Raises the scripted errors in turn, then answers."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(text="ok")
+
+
+@pytest.fixture(autouse=True)
+def breaker(monkeypatch):
+    fresh = ai.CircuitBreaker(threshold=3, cooldown=0.05)
+    monkeypatch.setattr(ai, 'breaker', fresh)
+    return fresh
+
+
+@pytest.mark.parametrize("error, transient", [
+    (TimeoutError(), True),
+    (ConnectionResetError(), True),
+    (APIError(429), True),
+    (APIError(503), True),
+    (APIError(400), False),
+    (APIError(403), False),
+    (ValueError("blocked prompt"), False),
+])
+def test_is_transient(error, transient):
+    assert ai.is_transient(error) is transient
+
+
+def test_transient_errors_are_retried(breaker):
+    model = ScriptedModel(APIError(503), APIError(429))
+    assert ai.generate(model, "hi", "test", retries=2, backoff=0).text == "ok"
+    assert model.calls == 3
+    assert breaker.failures == 0 # Reset by the success
+
+
+@pytest.mark.parametrize("error", [APIError(400), APIError(401), ValueError("blocked prompt")])
+def test_permanent_errors_fail_at_once_without_tripping_the_breaker(breaker, error):
+    model = ScriptedModel(error, error, error, error)
+    for _ in range(breaker.threshold + 1):
+        with pytest.raises(type(error)):
+            ai.generate(model, "hi", "test", retries=3, backoff=0)
+    assert model.calls == breaker.threshold + 1
+    assert breaker.state == ai.CircuitBreaker.CLOSED
+
+
+def test_breaker_opens_half_opens_and_closes(breaker):
+    model = ScriptedModel(*[APIError(503)] * breaker.threshold)
+    for _ in range(breaker.threshold):
+        with pytest.raises(APIError):
+            ai.generate(model, "hi", "test")
+    assert breaker.state == ai.CircuitBreaker.OPEN
+    with pytest.raises(ai.AIUnavailableError):
+        ai.generate(model, "hi", "test")
+    assert model.calls == breaker.threshold # Refused without a call
+
+    time.sleep(breaker.cooldown)
+    assert breaker.allow() # The single half-open trial...
+    assert breaker.state == ai.CircuitBreaker.HALF_OPEN
+    assert not breaker.allow() # ...and nobody else while it is in flight
+    breaker.record_failure()
+    assert breaker.state == ai.CircuitBreaker.OPEN # A failed trial reopens it
+
+    time.sleep(breaker.cooldown)
+    assert ai.generate(model, "hi", "test").text == "ok"
+    assert breaker.state == ai.CircuitBreaker.CLOSED
@@ -0,0 +1,47 @@
+import sqlite3
+
+from categories import category_cache, normalize_title
+from schema import DEFAULT_USER_ID
+
+
+class BrokenConnection:
+    """Every statement fails, as during a brief database outage."""
+
+    def cursor(self, *args, **kwargs):
+        return self
+
+    def execute(self, *args):
+        raise sqlite3.OperationalError("database is locked")
+
+    def close(self):
+        pass
+
+
+def test_normalize_title_drops_amounts_and_ids():
+    assert normalize_title("Swiggy order #12345 Rs. 1,250.00") == normalize_title("SWIGGY ORDER 987")
+
+
+def test_failed_override_lookup_is_not_cached(migrated):
+    with migrated.connection() as conn:
+        category_cache.override(conn, DEFAULT_USER_ID, "Netflix", "Entertainment")
+        conn.commit()
+    category_cache._entries.clear() # As in another process, which only has the database
+
+    assert category_cache.get(BrokenConnection(), "Netflix", DEFAULT_USER_ID) is None
+    with migrated.connection() as conn:
+        assert category_cache.get(conn, "Netflix", DEFAULT_USER_ID) == "Entertainment"
+
+
+def test_invalidate_drops_shared_answer_but_keeps_corrections(migrated):
+    with migrated.connection() as conn:
+        category_cache.put(conn, "Uber 12", "Food") # A wrong model answer
+        category_cache.override(conn, DEFAULT_USER_ID, "Uber 12", "Travel")
+        conn.commit()
+        assert category_cache.get(conn, "Uber 40") == "Food"
+
+        assert category_cache.invalidate(conn, "Uber 99") == 1
+
+        assert category_cache.get(conn, "Uber 40") is None
+        assert category_cache.get(conn, "Uber 40", DEFAULT_USER_ID) == "Travel"
+        category_cache.put(conn, "Uber 7", "Travel") # The next answer is stored again
+        assert category_cache.get(conn, "Uber 1") == "Travel"
@@ -0,0 +1,92 @@
+import json
+import re
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import ai
+import categorizer
+import repository
+import rollup
+from categories import PENDING_CATEGORY
+from schema import DEFAULT_USER_ID
+
+
+class ListModel:
+    """Answers batch prompts with `category` for every numbered title, or raises `error`."""
+
+    def __init__(self, category: str = "Travel", error: Exception = None):
+        self.category = category
+        self.error = error
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        titles = re.findall(r'^\d+\. ', prompt, re.MULTILINE)
+        return SimpleNamespace(text=json.dumps([self.category] * len(titles)))
+
+
+@pytest.fixture
+def worker(app, monkeypatch):
+    """The app's categorizer, driven by hand: its thread is stopped and retries don't sleep."""
+    monkeypatch.setattr(categorizer, 'CATEGORIZER_BACKOFF', 0)
+    monkeypatch.setattr(ai, 'GEMINI_API_KEY', 'test-key')
+    categorizer_worker = app.extensions['categorizer']
+    categorizer_worker.stop()
+    return categorizer_worker
+
+
+def _categories(db) -> list:
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT category FROM expenses ORDER BY id")
+        rows = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+    return rows
+
+
+def test_add_during_gemini_outage_stays_pending(app, migrated, monkeypatch):
+    monkeypatch.setattr(ai, 'GEMINI_API_KEY', 'test-key')
+    monkeypatch.setattr(ai, '_healthy', False) # Health probe failed: get_model() returns None
+    assert ai.get_model() is None
+    app.test_client().post('/add', data={'title': 'Zorblax subscription', 'amount': '99'})
+    assert _categories(migrated) == [PENDING_CATEGORY]
+
+
+def test_add_without_gemini_key_uses_default(app, migrated):
+    app.test_client().post('/add', data={'title': 'Zorblax subscription', 'amount': '99'})
+    assert _categories(migrated) == ["Miscellaneous"]
+
+
+def test_pending_expenses_are_categorized_and_moved_in_rollup(worker, migrated, monkeypatch):
+    with migrated.connection() as conn:
+        for title in ("Uber to airport", "Uber home"):
+            repository.add_expense(conn, DEFAULT_USER_ID, title, 250, PENDING_CATEGORY)
+        conn.commit()
+    model = ListModel("Travel")
+    ai.set_model(model)
+
+    worker.drain_once()
+
+    assert _categories(migrated) == ["Travel", "Travel"]
+    assert model.calls == 1 # Both titles in one batch
+    with migrated.connection() as conn:
+        summary = rollup.month_summary(conn, DEFAULT_USER_ID, datetime.now().strftime("%Y-%m"))
+    assert summary == {"Travel": {"count": 2, "total": 500.0}}
+
+
+def test_failed_batch_leaves_rows_pending_and_backs_off(worker, migrated):
+    with migrated.connection() as conn:
+        repository.add_expense(conn, DEFAULT_USER_ID, "Uber to airport", 250, PENDING_CATEGORY)
+        conn.commit()
+    ai.set_model(ListModel(error=TimeoutError("deadline exceeded")))
+    interval = worker._interval
+
+    assert worker.drain_once() is False
+
+    assert _categories(migrated) == [PENDING_CATEGORY]
+    assert worker.deferred == 1
+    assert worker._interval == interval * 2
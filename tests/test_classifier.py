@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+import classifier
+import repository
+from schema import DEFAULT_USER_ID
+
+
+@pytest.fixture
+def trained(monkeypatch):
+    """A shared model confident that ride titles are Travel."""
+    model = classifier.NaiveBayesClassifier()
+    for i in range(classifier.LOCAL_CLASSIFIER_MIN_EXAMPLES):
+        model.learn(f"uber ride {i}", "Travel")
+        model.learn(f"pizza dinner {i}", "Food")
+    monkeypatch.setattr(classifier, '_model', model)
+    return model
+
+
+def test_confident_prediction_is_not_learned_back(app, trained):
+    examples = trained.examples
+    app.test_client().post('/add', data={'title': 'Uber ride to office', 'amount': '180'})
+    with app.app_context():
+        from database import get_db
+        assert repository.recent_expenses(get_db(), DEFAULT_USER_ID)[0]['category'] == "Travel"
+    assert trained.examples == examples
+
+
+def test_missing_model_starts_empty_without_training(migrated):
+    with migrated.connection() as conn:
+        for i in range(classifier.LOCAL_CLASSIFIER_MIN_EXAMPLES):
+            repository.add_expense(conn, DEFAULT_USER_ID, f"uber ride {i}", 100, "Travel")
+        conn.commit()
+    assert classifier.get_classifier().examples == 0 # The request path never scans expenses
+    assert classifier.classify("uber ride") == (None, 0.0)
+
+
+def test_background_training_builds_and_saves_the_model(migrated):
+    with migrated.connection() as conn:
+        for i in range(classifier.LOCAL_CLASSIFIER_MIN_EXAMPLES):
+            repository.add_expense(conn, DEFAULT_USER_ID, f"uber ride {i}", 100, "Travel")
+        conn.commit()
+    classifier.start_background_training()
+    classifier._train_thread.join(10)
+    assert classifier.get_classifier().examples == classifier.LOCAL_CLASSIFIER_MIN_EXAMPLES
+    assert classifier.classify("uber ride")[0] == "Travel"
+    assert os.path.exists(classifier.CLASSIFIER_PATH)
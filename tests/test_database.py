@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+
+def _count(conn, table: str) -> int:
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
+
+def test_pool_is_created_lazily_and_once(db):
+    assert db._pool is None
+    with db.connection():
+        pool = db._pool
+    with db.connection():
+        assert db._pool is pool
+
+
+def test_release_rolls_back_unfinished_transaction(db):
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("CREATE TABLE notes (body TEXT)")
+        cursor.execute("INSERT INTO notes (body) VALUES (%s)", ("kept",))
+        conn.commit()
+        cursor.execute("INSERT INTO notes (body) VALUES (%s)", ("discarded",))
+        cursor.close()
+        assert conn.in_transaction
+    with db.connection() as conn:
+        assert not conn.in_transaction
+        assert _count(conn, "notes") == 1
+
+
+def test_connection_is_released_when_the_block_raises(db, monkeypatch):
+    monkeypatch.setattr(db, 'DB_POOL_SIZE', 1)
+    with pytest.raises(RuntimeError):
+        with db.connection():
+            raise RuntimeError("boom")
+    with db.connection(timeout=0.1) as conn: # Would time out if the slot had leaked
+        assert _count(conn, "sqlite_master") == 0
+
+
+def test_checkout_times_out_when_pool_is_exhausted(db, monkeypatch):
+    monkeypatch.setattr(db, 'DB_POOL_SIZE', 2)
+    held = [db.checkout(), db.checkout()]
+    with pytest.raises(db.PoolTimeoutError):
+        db.checkout(timeout=0.05)
+    assert isinstance(db.PoolTimeoutError(), db.DB_ERRORS) # Handlers catching DB_ERRORS see it too
+    db.release(held.pop())
+    db.release(db.checkout(timeout=0.05))
+    db.release(held.pop())
+
+
+def test_waiting_checkout_gets_a_released_connection(db, monkeypatch):
+    monkeypatch.setattr(db, 'DB_POOL_SIZE', 1)
+    held = db.checkout()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(db.checkout(timeout=5)))
+    waiter.start()
+    db.release(held)
+    waiter.join(5)
+    assert len(got) == 1
+    db.release(got[0])
+
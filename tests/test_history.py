@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import repository
+from history import decode_cursor, encode_cursor
+from schema import DEFAULT_USER_ID
+
+
+@pytest.fixture
+def expenses(migrated) -> list:
+    """25 expenses, several sharing a timestamp so the id tiebreak matters. Returns ids newest first."""
+    base = datetime(2024, 6, 1, 12, 0)
+    with migrated.connection() as conn:
+        ids = [repository.add_expense(conn, DEFAULT_USER_ID, f"Item {i}", 10 + i,
+                                      "Food" if i % 3 else "Travel", base + timedelta(hours=i // 4))
+               for i in range(25)]
+        conn.commit()
+    return sorted(ids, key=lambda expense_id: ((expense_id - 1) // 4, expense_id), reverse=True)
+
+
+def test_cursor_round_trip():
+    token = encode_cursor(datetime(2024, 6, 1, 12, 30, 5), 42)
+    assert decode_cursor(token) == (datetime(2024, 6, 1, 12, 30, 5), 42)
+    with pytest.raises(ValueError):
+        decode_cursor(token[:-3] + "!!")
+
+
+def _walk(client, query: str) -> list:
+    seen, cursor = [], None
+    while True:
+        url = f"/api/expenses?{query}" + (f"&cursor={cursor}" if cursor else "")
+        body = client.get(url).get_json()
+        seen.extend(item['id'] for item in body['items'])
+        cursor = body['next_cursor']
+        if not cursor:
+            return seen
+
+
+def test_pages_cover_every_row_once_newest_first(app, expenses):
+    assert _walk(app.test_client(), "limit=4") == expenses
+
+
+def test_pages_respect_filters(app, expenses):
+    ids = _walk(app.test_client(), "limit=3&category=Travel")
+    assert len(ids) == 9
+    assert ids == [expense_id for expense_id in expenses if expense_id in set(ids)]
+
+
+def test_bad_cursor_is_a_400(app, migrated):
+    response = app.test_client().get('/api/expenses?cursor=not-a-cursor')
+    assert response.status_code == 400
+
+
+def test_exhausted_pool_is_a_503(app, migrated, monkeypatch):
+    monkeypatch.setattr(migrated, 'DB_POOL_TIMEOUT', 0.05)
+    held = []
+    try:
+        while True:
+            held.append(migrated.checkout())
+    except migrated.PoolTimeoutError:
+        pass
+    try:
+        response = app.test_client().get('/api/expenses')
+        assert response.status_code == 503
+        assert 'error' in response.get_json()
+    finally:
+        for conn in held:
+            migrated.release(conn)
@@ -0,0 +1,61 @@
+import io
+
+import ai
+import rollup
+from categories import PENDING_CATEGORY
+from importer import import_statement
+from schema import DEFAULT_USER_ID
+
+STATEMENT = """Date,Narration,Debit,Credit,Type
+2024-03-02,ZORBLAX MART,250.00,,DR
+2024-03-02,ZORBLAX MART,250.00,,DR
+2024-03-03,Refund ZORBLAX MART,,250.00,CR
+2024-03-04,Card payment,1000.00,,CR
+2024-03-05,Cashback,-40.00,,DR
+2024-03-06,Quux cafe,120.50 Cr,,DR
+2024-03-07,Quux cafe,99.00,,DR
+not a date,Quux cafe,10.00,,DR
+"""
+
+
+def _import(db, text: str):
+    with db.connection() as conn:
+        return import_statement(conn, DEFAULT_USER_ID, io.StringIO(text))
+
+
+def _expenses(db) -> list:
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT title, amount, category FROM expenses ORDER BY id")
+        rows = [(title, float(amount), category) for title, amount, category in cursor.fetchall()]
+        cursor.close()
+    return rows
+
+
+def test_credits_are_skipped_and_counted(migrated):
+    stats = _import(migrated, STATEMENT)
+    assert stats.rows_read == 8
+    assert stats.credits == 4 # Credit column, CR type, negative amount, "Cr" suffix
+    assert stats.skipped == 5 # ...and the unparseable date
+    assert [title for title, _, _ in _expenses(migrated)] == ["ZORBLAX MART", "ZORBLAX MART", "Quux cafe"]
+
+
+def test_identical_rows_in_one_file_are_kept_and_reimport_dedupes(migrated):
+    first = _import(migrated, STATEMENT)
+    assert first.inserted == 3 and first.duplicates == 0
+
+    again = _import(migrated, STATEMENT)
+    assert again.inserted == 0 and again.duplicates == 3
+
+    overlapping = STATEMENT + "2024-03-02,ZORBLAX MART,250.00,,DR\n" # A third identical purchase
+    assert _import(migrated, overlapping).inserted == 1
+
+
+def test_unresolved_rows_go_in_pending_without_calling_gemini(migrated, monkeypatch):
+    monkeypatch.setattr(ai, 'GEMINI_API_KEY', 'test-key')
+    stats = _import(migrated, STATEMENT)
+    assert stats.model_calls == 0
+    assert stats.pending == 3
+    assert {category for _, _, category in _expenses(migrated)} == {PENDING_CATEGORY}
+    with migrated.connection() as conn:
+        assert rollup.month_summary(conn, DEFAULT_USER_ID, "2024-03") == {PENDING_CATEGORY: {"count": 3, "total": 599.0}}
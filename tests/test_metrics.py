@@ -0,0 +1,15 @@
+import metrics
+
+
+def test_profile_header_is_ignored_by_default(app):
+    assert not metrics.PROFILING_ENABLED
+    response = app.test_client().get('/', headers={metrics.PROFILE_HEADER: '1'})
+    assert response.status_code == 200
+    assert 'Server-Timing' not in response.headers
+
+
+def test_profile_header_returns_spans_when_enabled(app, monkeypatch):
+    monkeypatch.setattr(metrics, 'PROFILING_ENABLED', True)
+    response = app.test_client().get('/', headers={metrics.PROFILE_HEADER: '1'})
+    assert 'desc="total x1"' in response.headers['Server-Timing']
+    assert 'Server-Timing' not in app.test_client().get('/').headers
@@ -0,0 +1,52 @@
+import io
+
+import pytest
+
+import ai
+import prototype
+
+
+def _users(db) -> dict:
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT username, id FROM users")
+        users = dict(cursor.fetchall())
+        cursor.execute("SELECT user_id FROM budget")
+        budget_users = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+    return users, budget_users
+
+
+@pytest.mark.parametrize("argv", [["add", "Tea", "-5"], ["add", "Tea", "0"], ["budget", "-100"]])
+def test_non_positive_amounts_are_rejected(argv):
+    with pytest.raises(SystemExit):
+        prototype.build_parser().parse_args(argv)
+
+
+def test_user_created_in_rolled_back_group_is_recreated(migrated, tmp_path, monkeypatch):
+    monkeypatch.setattr(prototype, '_user_ids', {})
+    parser = prototype.build_parser()
+    unwritable = tmp_path / "missing" / "report.pdf"
+    with migrated.connection() as conn:
+        with pytest.raises(prototype.BatchLineError):
+            prototype.run_batch(conn, parser, io.StringIO(f"--user bob report --output {unwritable}\n"), 10)
+        assert prototype.run_batch(conn, parser, io.StringIO("--user bob budget 100\n"), 10) == 1
+    users, budget_users = _users(migrated)
+    assert budget_users == [users["bob"]]
+
+
+def test_import_is_refused_in_batch_files(migrated):
+    with migrated.connection() as conn:
+        with pytest.raises(prototype.BatchLineError, match="import"):
+            prototype.run_batch(conn, prototype.build_parser(), io.StringIO("budget 100\nimport statement.csv\n"), 10)
+    assert _users(migrated)[1] == []
+
+
+class FailingModel:
+    def generate_content(self, prompt, **kwargs):
+        raise RuntimeError("403 API key not valid")
+
+
+def test_insights_api_error_is_reported_not_raised(db):
+    ai.set_model(FailingModel())
+    assert prototype.generate_insights("Food: 100").startswith("Could not generate AI insights")
@@ -0,0 +1,82 @@
+import os
+import time
+from datetime import datetime
+from io import BytesIO
+
+import pytest
+
+import reports
+import repository
+from schema import DEFAULT_USER_ID
+
+
+def _add(db, title: str, amount: float, category: str, date_added: datetime) -> int:
+    with db.connection() as conn:
+        expense_id = repository.add_expense(conn, DEFAULT_USER_ID, title, amount, category, date_added)
+        conn.commit()
+    return expense_id
+
+
+def test_category_correction_changes_report_etag(app, migrated):
+    expense_id = _add(migrated, "Coffee", 120, "Food", datetime(2024, 5, 3))
+    client = app.test_client()
+    first = client.get('/download_report?month=2024-05')
+    assert first.status_code == 200
+    etag = first.headers['ETag'].strip('"')
+    assert client.get('/download_report?month=2024-05', headers={'If-None-Match': f'"{etag}"'}).status_code == 304
+
+    client.post(f'/expense/{expense_id}/category', data={'category': 'Entertainment'})
+
+    second = client.get('/download_report?month=2024-05', headers={'If-None-Match': f'"{etag}"'})
+    assert second.status_code == 200
+    assert second.headers['ETag'].strip('"') != etag
+    assert second.data != first.data
+
+
+def test_reports_embed_the_bundled_unicode_font(migrated):
+    regular, bold, _ = reports.report_fonts()
+    assert regular.startswith(reports.FONTS_DIR) and bold.startswith(reports.FONTS_DIR)
+    _add(migrated, "चाय ₹ Café", 40, "Food", datetime(2024, 5, 3))
+    with migrated.connection() as conn:
+        data = reports.render_pdf_report(conn, DEFAULT_USER_ID, "2024-05", "2024-05")
+    assert b"/FontFile2" in data # An embedded TrueType font...
+    assert b"/Helvetica" not in data # ...instead of the latin-1 core font
+
+
+def test_missing_report_font_fails_startup(migrated, tmp_path, monkeypatch):
+    from app import create_app
+    monkeypatch.setattr(reports, 'REPORT_FONT_PATH', str(tmp_path / "missing.ttf"))
+    with pytest.raises(FileNotFoundError, match="missing.ttf"):
+        create_app()
+
+
+def test_report_job_renders_a_range_for_download(app, migrated):
+    for month in (1, 2, 3):
+        _add(migrated, f"Groceries {month}", 100 * month, "Food", datetime(2024, month, 10))
+    client = app.test_client()
+    started = client.post('/reports', data={'start': '2024-01', 'end': '2024-03'})
+    assert started.status_code == 202
+    job = started.get_json()
+    deadline = time.monotonic() + 30
+    while job['status'] in ('queued', 'running') and time.monotonic() < deadline:
+        time.sleep(0.05)
+        job = client.get(job['status_url']).get_json()
+    assert job['status'] == 'done'
+    download = client.get(job['download_url'])
+    assert download.status_code == 200 and download.mimetype == 'application/pdf'
+    assert download.data.startswith(b"%PDF")
+
+
+def test_parallel_render_merges_months_in_order(migrated, monkeypatch):
+    pypdf = pytest.importorskip("pypdf")
+    monkeypatch.setattr(reports, 'REPORT_WORKERS', 2)
+    monkeypatch.setattr(reports, 'REPORT_PARALLEL_ROWS', 1)
+    for month in (1, 2, 3):
+        _add(migrated, f"Rent {month}", 1000, "Utilities", datetime(2024, month, 1))
+    try:
+        with migrated.connection() as conn:
+            data = reports.render_pdf_report(conn, DEFAULT_USER_ID, "2024-01", "2024-03")
+    finally:
+        reports._reset_executor()
+    outline = [item.title for item in pypdf.PdfReader(BytesIO(data)).outline if not isinstance(item, list)]
+    assert outline == ["January 2024", "February 2024", "March 2024", "Summary"]
@@ -0,0 +1,69 @@
+import io
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+import ai
+import categorizer
+import rollup
+from schema import DEFAULT_USER_ID
+
+STATEMENT = b"""Date,Narration,Debit
+2024-03-02,Zorblax mart,250.00
+2024-03-09,Quux cafe,120.50
+2024-04-01,Quux cafe,80.00
+"""
+
+
+class TravelModel:
+    def generate_content(self, prompt, **kwargs):
+        titles = re.findall(r'^\d+\. ', prompt, re.MULTILINE)
+        return SimpleNamespace(text=json.dumps(["Travel"] * len(titles)))
+
+
+def _buckets_from_expenses(conn) -> dict:
+    cursor = conn.cursor()
+    cursor.execute("SELECT date_added, category, amount FROM expenses WHERE user_id = %s", (DEFAULT_USER_ID,))
+    buckets = {}
+    for date_added, category, amount in cursor.fetchall():
+        count, total = buckets.get((date_added.strftime("%Y-%m"), category), (0, 0.0))
+        buckets[(date_added.strftime("%Y-%m"), category)] = (count + 1, round(total + float(amount), 2))
+    cursor.close()
+    return buckets
+
+
+def _buckets_from_rollup(conn) -> dict:
+    cursor = conn.cursor()
+    cursor.execute("SELECT month_year FROM expense_rollup WHERE user_id = %s", (DEFAULT_USER_ID,))
+    months = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return {(month, category): (bucket['count'], round(bucket['total'], 2))
+            for month in months for category, bucket in rollup.month_summary(conn, DEFAULT_USER_ID, month).items()}
+
+
+def test_rollup_matches_expenses_after_mixed_writes(app, migrated, monkeypatch):
+    monkeypatch.setattr(categorizer, 'CATEGORIZER_BACKOFF', 0)
+    worker = app.extensions['categorizer']
+    worker.stop()
+    ai.set_model(TravelModel()) # Configured, so unknown titles go in Pending
+    client = app.test_client()
+
+    client.post('/add', data={'title': 'Zorblax taxi', 'amount': '310.25'})
+    client.post('/import', data={'statement': (io.BytesIO(STATEMENT), 'statement.csv')},
+                content_type='multipart/form-data')
+    worker.drain_once() # Pending -> Travel
+    client.post('/expense/1/category', data={'category': 'Food'})
+    client.post('/expense/3/category', data={'category': 'Food'})
+    client.post('/expense/3/category', data={'category': 'Health'}) # Corrected twice
+
+    with migrated.connection() as conn:
+        expected = _buckets_from_expenses(conn)
+        assert {category for _, category in expected} == {"Food", "Health", "Travel"} # Nothing left Pending
+        assert _buckets_from_rollup(conn) == expected
+        for month in {month for month, _ in expected}:
+            assert rollup.month_total(conn, DEFAULT_USER_ID, month) == pytest.approx(sum(
+                total for (bucket_month, _), (_, total) in expected.items() if bucket_month == month))
+        assert rollup.rebuild(conn) > 0
+        assert _buckets_from_rollup(conn) == expected
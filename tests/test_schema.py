@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import pytest
+
+import schema
+
+
+def test_migrate_is_idempotent(migrated):
+    with migrated.connection() as conn:
+        latest = schema.MIGRATIONS[-1][0]
+        assert schema.migrate(conn) == latest
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM schema_version")
+        assert cursor.fetchone()[0] == len(schema.MIGRATIONS)
+        cursor.close()
+
+
+def test_month_query_uses_the_user_date_index(migrated):
+    with migrated.connection() as conn:
+        assert schema.check_month_index(conn, "2024-02"), schema.explain_month_query(conn, "2024-02")
+
+
+def test_month_query_selects_half_open_range(migrated):
+    rows = [
+        ("Rent", datetime(2024, 1, 31, 23, 59, 59)),
+        ("Groceries", datetime(2024, 2, 1)),
+        ("Fuel", datetime(2024, 2, 29, 23, 59, 59)),
+        ("Dinner", datetime(2024, 3, 1)),
+    ]
+    with migrated.connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT INTO expenses (user_id, title, amount, category, date_added) VALUES (%s, %s, %s, %s, %s)",
+            [(schema.DEFAULT_USER_ID, title, 10, "Miscellaneous", added) for title, added in rows])
+        conn.commit()
+        cursor.execute(schema.MONTH_QUERY, (schema.DEFAULT_USER_ID, *schema.month_bounds("2024-02")))
+        assert [row[0] for row in cursor.fetchall()] == ["Groceries", "Fuel"]
+        cursor.close()
+
+
+@pytest.mark.parametrize("month_year, bounds", [
+    ("2024-02", (datetime(2024, 2, 1), datetime(2024, 3, 1))),
+    ("2024-12", (datetime(2024, 12, 1), datetime(2025, 1, 1))),
+])
+def test_month_bounds(month_year, bounds):
+    assert schema.month_bounds(month_year) == bounds
+
+
+def test_migrations_from_5_can_be_rerun_after_a_partial_apply(migrated):
+    with migrated.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM schema_version WHERE version >= 5") # Columns and indexes stay behind
+        conn.commit()
+        cursor.close()
+        assert schema.migrate(conn) == schema.MIGRATIONS[-1][0]
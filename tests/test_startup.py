@@ -0,0 +1,76 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import ai
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_import_time_check():
+    spec = importlib.util.spec_from_file_location(
+        "check_import_time", os.path.join(REPO_ROOT, "scripts", "check_import_time.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_import_app_stays_within_budget_and_lazy():
+    check = _load_import_time_check()
+    timings = check.measure()
+    eager = sorted(name for name in timings if name.startswith(check.LAZY_MODULES))
+    assert not eager
+    assert timings["app"] / 1000 <= check.IMPORT_TIME_BUDGET_MS
+
+
+def test_create_app_makes_no_ai_call_or_heavy_import(tmp_path):
+    # A fresh interpreter, so modules other tests imported do not hide an eager import
+    script = (
+        "import sys, threading, app\n"
+        "flask_app = app.create_app()\n"
+        "assert flask_app.test_client().get('/').status_code == 200\n"
+        "loaded = [name for name in ('fpdf', 'google.generativeai') if name in sys.modules]\n"
+        "probes = [t.name for t in threading.enumerate() if t.name == 'gemini-health-probe']\n"
+        "print(loaded, probes)\n"
+    )
+    env = dict(os.environ, DB_BACKEND='sqlite', SQLITE_PATH=str(tmp_path / 'expense_tracker.db'), GEMINI_API_KEY='')
+    result = subprocess.run([sys.executable, "-c", script], cwd=REPO_ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "[] []"
+
+
+def test_gemini_client_is_built_once_under_concurrent_first_use(monkeypatch):
+    genai = pytest.importorskip("google.generativeai")
+    built = []
+
+    def slow_model(name):
+        time.sleep(0.05) # Widen the window in which a second thread could also build one
+        built.append(name)
+        return object()
+
+    monkeypatch.setattr(genai, "configure", lambda **kwargs: None)
+    monkeypatch.setattr(genai, "GenerativeModel", slow_model)
+    monkeypatch.setattr(ai, "GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(ai, "_model", None)
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(ai._client())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert built == [ai.GEMINI_MODEL_NAME]
+    assert len({id(model) for model in models}) == 1
+
+
+def test_get_model_without_key_is_none_and_starts_no_probe(monkeypatch):
+    monkeypatch.setattr(ai, "GEMINI_API_KEY", "")
+    monkeypatch.setattr(ai, "_probe_thread", None)
+    assert ai.get_model() is None
+    ai.start_health_probe()
+    assert ai._probe_thread is None
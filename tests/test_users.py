@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+
+import app as app_module
+import reports
+import repository
+
+
+@pytest.fixture
+def clients(app, monkeypatch):
+    """Test clients signed in as alice and bob (dev-mode user switching)."""
+    monkeypatch.setattr(app_module, 'ALLOW_USER_SWITCH', True)
+    signed_in = {}
+    for username in ("alice", "bob"):
+        client = app.test_client()
+        client.post('/user', data={'username': username})
+        signed_in[username] = client
+    return signed_in
+
+
+def _expenses(db, username: str) -> list:
+    with db.connection() as conn:
+        user_id = repository.get_or_create_user(conn, username)
+        return [(row['id'], row['title'], row['category']) for row in repository.recent_expenses(conn, user_id)]
+
+
+def test_user_switching_is_off_by_default(app):
+    assert app.test_client().post('/user', data={'username': 'alice'}).status_code == 403
+
+
+def test_corrections_apply_only_to_their_user(clients, migrated):
+    clients['alice'].post('/add', data={'title': 'Netflix', 'amount': '499'})
+    alice_id = _expenses(migrated, 'alice')[0][0]
+    clients['alice'].post(f'/expense/{alice_id}/category', data={'category': 'Entertainment'})
+
+    clients['bob'].post('/add', data={'title': 'Netflix', 'amount': '199'})
+    clients['alice'].post('/add', data={'title': 'Netflix', 'amount': '499'})
+
+    assert [category for _, _, category in _expenses(migrated, 'bob')] == ["Miscellaneous"]
+    assert [category for _, _, category in _expenses(migrated, 'alice')] == ["Entertainment", "Entertainment"]
+
+
+def test_users_cannot_touch_each_others_expenses_or_reports(clients, migrated):
+    clients['alice'].post('/add', data={'title': 'Rent', 'amount': '15000'})
+    clients['bob'].post('/add', data={'title': 'Coffee', 'amount': '90'})
+    alice_id = _expenses(migrated, 'alice')[0][0]
+    month = datetime.now().strftime("%Y-%m")
+
+    assert clients['bob'].post(f'/expense/{alice_id}/category', data={'category': 'Food'}).status_code == 404
+    assert _expenses(migrated, 'alice')[0][2] != "Food"
+
+    with migrated.connection() as conn:
+        bob_id = repository.get_or_create_user(conn, 'bob')
+        [(_, rows, total)] = reports.fetch_sections(conn, bob_id, month, month)
+    assert [row[0] for row in rows] == ["Coffee"] and total == 90.0
+    assert (clients['alice'].get(f'/download_report?month={month}').headers['ETag']
+            != clients['bob'].get(f'/download_report?month={month}').headers['ETag'])
+
+    job = clients['alice'].post('/reports', data={'month': month}).get_json()
+    assert clients['bob'].get(job['status_url']).status_code == 404
+    assert clients['bob'].get(f"{job['status_url']}/download").status_code == 404